@@ -0,0 +1,85 @@
+"""
+a2a_apps.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+# FastAPI reads the annotation of the request of the routes at runtime, so annotations are not postponed here
+from collections.abc import AsyncGenerator
+from typing import TYPE_CHECKING, Any, override
+
+from a2a.extensions.common import HTTP_EXTENSION_HEADER
+from a2a.server.apps import A2AFastAPIApplication, A2ARESTFastAPIApplication
+from a2a.server.apps.rest.rest_adapter import RESTAdapter
+from a2a.types import JSONRPCErrorResponse
+from a2a.utils.error_handlers import rest_error_handler
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from app.libs.serialization import dumps
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from a2a.server.context import ServerCallContext
+    from a2a.server.request_handlers import RequestHandler
+    from a2a.types import AgentCard, JSONRPCResponse, SendStreamingMessageResponse
+    from starlette.responses import Response
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by the fast serializer, or given as serialized bytes."""
+
+    @override
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+###
+# Define HTTP+JSON Application
+###
+class FastRESTAdapter(RESTAdapter):
+    """REST adapter serializing the responses with the fast serializer."""
+
+    @override
+    @rest_error_handler
+    async def _handle_request(
+        self,
+        method: "Callable[[Request, ServerCallContext], Awaitable[Any]]",
+        request: Request,
+    ) -> "Response":
+        call_context = self._context_builder.build(request)
+        return FastJSONResponse(content=await method(request, call_context))
+
+
+class FastA2ARESTFastAPIApplication(A2ARESTFastAPIApplication):
+    """A2A HTTP+JSON application serializing the responses with the fast serializer."""
+
+    def __init__(self, agent_card: "AgentCard", http_handler: "RequestHandler", **kwargs: Any) -> None:  # noqa: ANN401
+        """Initialize Fast A2A REST FastAPI Application."""
+        super().__init__(agent_card, http_handler, **kwargs)
+        self._adapter = FastRESTAdapter(agent_card=agent_card, http_handler=http_handler, **kwargs)
+
+
+###
+# Define JSONRPC Application
+###
+class FastA2AFastAPIApplication(A2AFastAPIApplication):
+    """A2A JSONRPC application serializing the responses straight to bytes."""
+
+    @override
+    def _create_response(
+        self,
+        context: "ServerCallContext",
+        handler_result: "AsyncGenerator[SendStreamingMessageResponse] | JSONRPCErrorResponse | JSONRPCResponse",
+    ) -> "Response":
+        if isinstance(handler_result, AsyncGenerator):
+            return super()._create_response(context, handler_result)
+
+        headers = {}
+        if extensions := context.activated_extensions:
+            headers[HTTP_EXTENSION_HEADER] = ", ".join(sorted(extensions))
+        # Skip the intermediate dict, pydantic-core writes the JSON directly
+        model = handler_result if isinstance(handler_result, JSONRPCErrorResponse) else handler_result.root
+        return FastJSONResponse(model.__pydantic_serializer__.to_json(model, exclude_none=True), headers=headers)
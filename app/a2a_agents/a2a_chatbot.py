@@ -7,19 +7,20 @@ Author  : aumezawa
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Literal, override
+import asyncio
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Literal, override
 
+import httpx
 import uvicorn
 from a2a.server.agent_execution import AgentExecutor, RequestContext
-from a2a.server.apps import A2AFastAPIApplication, A2ARESTFastAPIApplication
 from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
+from a2a.server.tasks import BasePushNotificationSender, InMemoryTaskStore
 from a2a.types import (
     AgentCapabilities,
     AgentCard,
     AgentInterface,
     AgentSkill,
-    TaskArtifactUpdateEvent,
     TaskState,
     TaskStatus,
     TaskStatusUpdateEvent,
@@ -27,16 +28,52 @@ from a2a.types import (
 from a2a.utils import new_agent_text_message, new_task, new_text_artifact
 from loguru import logger
 
+from app.a2a_agents.a2a_apps import FastA2AFastAPIApplication, FastA2ARESTFastAPIApplication
+from app.a2a_agents.a2a_metrics import (
+    A2aChatbotMetrics,
+    MeteredQueueManager,
+    MeteredTaskStore,
+    MetricsCallbackHandler,
+)
+from app.a2a_agents.a2a_push import AllowedHostsPushNotificationConfigStore
+from app.a2a_agents.a2a_streaming import ArtifactStream, BoundedQueueManager
 from app.agents.chatbot import Chatbot
+from app.agents.fake_model import FixedChatModel
+from app.agents.planner import Planner
+from app.agents.tool_executors import ToolExecutors
+from app.agents.tool_results import ToolResultCompactor
+from app.libs.compression import COMPRESSION_MINIMUM_SIZE, CompressionMiddleware
+from app.libs.executors import EXECUTOR_CPU_WORKERS, EXECUTOR_IO_WORKERS, LoopLagMonitor
+from app.libs.health import HEALTH_ROUTE, READY_ROUTE, Readiness
+from app.libs.metrics import MetricsMiddleware
+from app.libs.scheduler import ThreadScheduler
+from app.libs.tracing import TRACEPARENT_HEADER
+from app.tools.currency_rate import frankfurter_client
+from app.tools.currency_rate import tool_result_policies as currency_rate_policies
 from app.tools.currency_rate import tools as currency_rate_tools
 
 if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+    from contextlib import AbstractContextManager
+
     from a2a.server.events import EventQueue
+    from a2a.server.tasks import TaskStore
+    from a2a.types import Task
+    from fastapi import FastAPI
+
+    from app.libs.executors import ExecutorKind
+    from app.libs.tracing import Span, Tracer
+    from app.libs.usage import TokenBudget
 
 HTTP_PROTOCOL: Literal["http", "https"] = "http"
 HTTP_HOST: str = "localhost"
 HTTP_PORT: int = 8000
 HTTP_ROUTE: str = "/a2a/chatbot"
+PUSH_NOTIFICATION_TIMEOUT: float = 10.0
+METRICS_ROUTE: str = "/metrics"
+TENANT_ID_HEADER: str = "x-tenant-id"
+GRPC_PORT: int = 50051
+WARM_UP_QUERY: str = "How much is 1 USD in JPY?"
 
 
 class A2aChatbotExecutor(AgentExecutor):
@@ -45,17 +82,121 @@ class A2aChatbotExecutor(AgentExecutor):
     def __init__(
         self,
         *,
+        agent: Literal["chatbot", "planner"] = "chatbot",
         streaming: bool = False,
         blocking: bool = True,
         strict: bool = False,
+        tracer: Tracer | None = None,
+        metrics: A2aChatbotMetrics | None = None,
+        budget: TokenBudget | None = None,
+        fallback_model: str | None = None,
+        merge_follow_ups: bool = False,
+        message_log: bool = False,
+        compact_tool_results: bool = False,
+        executors: ToolExecutors | None = None,
     ) -> None:
         """Initialize Chatbot Executor."""
-        self.agent = Chatbot(
+        fallback_llm_model = None
+        if fallback_model:
+            from langchain_google_genai import ChatGoogleGenerativeAI  # noqa: PLC0415
+
+            fallback_llm_model = ChatGoogleGenerativeAI(model=fallback_model)
+
+        agent_class = Planner if agent == "planner" else Chatbot
+        self.agent = agent_class(
             tools=currency_rate_tools,
             strict=strict,
+            tracer=tracer,
+            callbacks=[MetricsCallbackHandler(metrics)] if metrics else None,
+            fallback_model=fallback_llm_model,
+            budget=budget,
+            message_log=message_log,
+            tool_results=ToolResultCompactor(currency_rate_policies) if compact_tool_results else None,
+            executors=executors,
         )
         self.streaming = streaming
         self.blocking = blocking
+        self.metrics = metrics
+        # Runs on a context share its thread, so they take turns
+        self.scheduler = ThreadScheduler(merge=merge_follow_ups)
+        # Set by the server, to save the tasks of detached streams for polling
+        self.task_store: TaskStore | None = None
+
+    def _request_header(self, context: RequestContext, header: str) -> str | None:
+        """Get a header of the request."""
+        headers = context.call_context.state.get("headers", {}) if context.call_context else {}
+        value = headers.get(header)
+        return str(value) if value else None
+
+    def _request_value(self, context: RequestContext, header: str, key: str) -> str | None:
+        """Get a value from the headers or the message metadata of the request."""
+        metadata = (context.message.metadata if context.message else None) or {}
+        value = self._request_header(context, header) or metadata.get(key)
+        return str(value) if value else None
+
+    def _tenant_id(self, context: RequestContext) -> str | None:
+        """Get the tenant of the request, tracked only under a tenant budget."""
+        if not self.agent.budget.max_tenant_tokens:
+            return None
+        # Set by a gateway authenticating the callers, which cannot rewrite the message metadata
+        return self._request_header(context, TENANT_ID_HEADER)
+
+    def _trace(self, context: RequestContext, task: Task) -> AbstractContextManager[Span | None]:
+        """Trace the execution under the trace context of the request."""
+        tracer = self.agent.tracer
+        if tracer is None:
+            return nullcontext()
+        return tracer.span(
+            "a2a.execute",
+            traceparent=self._request_value(context, TRACEPARENT_HEADER, TRACEPARENT_HEADER),
+            attributes={"task_id": task.id, "context_id": task.context_id, "state": task.status.state.value},
+        )
+
+    def _usage_metadata(self, task: Task, tenant_id: str | None) -> dict[str, Any]:
+        """Make the task metadata reporting the token usage."""
+        usage: dict[str, Any] = {"context": self.agent.usage(task.context_id)}
+        if tenant_id:
+            usage["tenant"] = self.agent.tenant_usage(tenant_id)
+        return {"usage": usage}
+
+    async def _publish(self, stream: ArtifactStream | None, event_queue: EventQueue, task: Task) -> None:
+        """Publish a task, or save it for polling when its stream has been detached."""
+        if stream is None:
+            await event_queue.enqueue_event(task)
+        elif not await stream.send(task) and self.task_store is not None:
+            await self.task_store.save(task)
+
+    async def _run(
+        self,
+        query: str,
+        *,
+        thread_id: str,
+        resume: bool,
+        tenant_id: str | None,
+        stream: ArtifactStream | None,
+    ) -> tuple[str, bool]:
+        """Run the agent, writing the answer to the stream in the streaming mode, and get the result."""
+        if stream is None:
+            result, interrupt = await self.agent.async_run(
+                query=query,
+                thread_id=thread_id,
+                resume=resume,
+                raw_output=False,
+                tenant_id=tenant_id,
+            )
+            return (str(result), interrupt)
+
+        async for event, interrupt in self.agent.astream_run(
+            query=query,
+            thread_id=thread_id,
+            resume=resume,
+            raw_output=False,
+            tenant_id=tenant_id,
+        ):
+            if interrupt:
+                return (str(event), True)
+            await stream.write(str(event))
+        return (stream.text, False)
 
     @override
     async def execute(
@@ -70,104 +211,99 @@ class A2aChatbotExecutor(AgentExecutor):
         if not task:
             task = new_task(context.message)  # type: ignore[arg-type]
         task_state = task.status.state
+        tenant_id = self._tenant_id(context)
+        stream = ArtifactStream(event_queue, task, metrics=self.metrics) if self.streaming else None
+        (thread_id, resume) = (task.context_id, task_state == TaskState.input_required)
+        merged = True
 
-        logger.debug(f"req, task: {task.id}, state: {task_state}, context: {task.context_id}, query: {quary}")
+        async def _turn(query: str) -> tuple[str, bool]:
+            nonlocal merged
+            merged = False
+            return await self._run(
+                query,
+                thread_id=thread_id,
+                resume=resume,
+                tenant_id=tenant_id,
+                stream=stream,
+            )
 
-        try:
-            # Streaming
-            if self.streaming:
-                if not self.blocking:
-                    task.status.state = TaskState.working
-                    task.artifacts = []
-                    await event_queue.enqueue_event(task)
-                    logger.debug(f"res, task: {task.id}, state: {task.status.state}, context: {task.context_id}")
-
-                next_state = TaskState.completed
-                async for event, interrupt in self.agent.astream_run(
-                    query=quary,
-                    thread_id=task.context_id,
-                    resume=(task_state == TaskState.input_required),
-                    raw_output=False,
-                ):
-                    if interrupt:
-                        next_state = TaskState.input_required
-                        break
-
-                    await event_queue.enqueue_event(
-                        TaskArtifactUpdateEvent(
-                            artifact=new_text_artifact(
-                                name="answer",
-                                text=str(event),
-                            ),
+        with (
+            logger.contextualize(task_id=task.id, context_id=task.context_id),
+            self._trace(context, task),
+            self.metrics.measure_run() if self.metrics else nullcontext(),
+        ):
+            logger.debug("req, state: {}, query: {}", task_state, quary)
+            try:
+                # Streaming
+                if stream is not None:
+                    if not self.blocking:
+                        task.status.state = TaskState.working
+                        task.artifacts = []
+                        await self._publish(stream, event_queue, task)
+                        logger.debug("res, state: {}", task.status.state)
+
+                    (result, interrupt) = await self.scheduler.run(task.context_id, quary, _turn, group=resume)
+                    if merged and not interrupt:
+                        # The answer was streamed to the follow-up which ran the merged turn
+                        await stream.write(result)
+                    next_state = TaskState.input_required if interrupt else TaskState.completed
+
+                    attached = await stream.send(
+                        TaskStatusUpdateEvent(
+                            status=TaskStatus(state=next_state),
                             context_id=task.context_id,
                             task_id=task.id,
+                            final=True,
+                            metadata=self._usage_metadata(task, tenant_id),
                         ),
                     )
-                    logger.debug(
-                        f"res, task: {task.id}, state: {task.status.state}, context: {task.context_id}, "
-                        f"artifacts: {task.artifacts}",
-                    )
+                    if not attached and self.task_store is not None:
+                        # The consumer falls back to polling the task
+                        task = await self.task_store.get(task.id) or task
+                        task.status = TaskStatus(state=next_state)
+                        task.artifacts = [stream.artifact()] if stream.text else []
+                        task.metadata = {**(task.metadata or {}), **self._usage_metadata(task, tenant_id)}
+                        await self.task_store.save(task)
+                    logger.debug("res, state: {}, detached: {}", next_state, not attached)
 
-                await event_queue.enqueue_event(
-                    TaskStatusUpdateEvent(
-                        status=TaskStatus(state=next_state),
-                        context_id=task.context_id,
-                        task_id=task.id,
-                        final=True,
-                    ),
-                )
-                logger.debug(f"res, task: {task.id}, state: {task.status.state}, context: {task.context_id}")
+                # Non-streaming
+                else:
+                    if not self.blocking:
+                        task.status.state = TaskState.working
+                        task.artifacts = []
+                        await event_queue.enqueue_event(task)
+                        logger.debug("res, state: {}", task.status.state)
 
-            # Non-streaming
-            else:
-                if not self.blocking:
-                    task.status.state = TaskState.working
-                    task.artifacts = []
-                    await event_queue.enqueue_event(task)
-                    logger.debug(f"res, task: {task.id}, state: {task.status.state}, context: {task.context_id}")
-
-                result, interrupt = await self.agent.async_run(
-                    query=quary,
-                    thread_id=task.context_id,
-                    resume=(task_state == TaskState.input_required),
-                    raw_output=False,
-                )
+                    (result, interrupt) = await self.scheduler.run(task.context_id, quary, _turn, group=resume)
+                    task.metadata = {**(task.metadata or {}), **self._usage_metadata(task, tenant_id)}
 
-                if interrupt:
-                    task.status.state = TaskState.input_required
-                    task.status.message = new_agent_text_message(
-                        text=str(result),
-                        context_id=task.context_id,
-                        task_id=task.id,
-                    )
-                    task.artifacts = []
-                    await event_queue.enqueue_event(task)
-                    logger.debug(
-                        f"res, task: {task.id}, state: {task.status.state}, context: {task.context_id}, "
-                        f"message: {task.status.message}",
-                    )
-                else:
-                    task.status.state = TaskState.completed
-                    task.artifacts = [new_text_artifact(name="answer", text=str(result))]
-                    await event_queue.enqueue_event(task)
-                    logger.debug(
-                        f"res, task: {task.id}, state: {task.status.state}, context: {task.context_id}, "
-                        f"artifacts: {task.artifacts}",
-                    )
+                    if interrupt:
+                        task.status.state = TaskState.input_required
+                        task.status.message = new_agent_text_message(
+                            text=str(result),
+                            context_id=task.context_id,
+                            task_id=task.id,
+                        )
+                        task.artifacts = []
+                        await event_queue.enqueue_event(task)
+                        logger.debug("res, state: {}, message: {}", task.status.state, task.status.message)
+                    else:
+                        task.status.state = TaskState.completed
+                        task.artifacts = [new_text_artifact(name="answer", text=str(result))]
+                        await event_queue.enqueue_event(task)
+                        logger.debug("res, state: {}, artifacts: {}", task.status.state, task.artifacts)
 
-        except Exception as e:
-            task.status.state = TaskState.failed
-            task.status.message = new_agent_text_message(
-                text=f"Error occurred during agent execution: {e}",
-                context_id=task.context_id,
-                task_id=task.id,
-            )
-            task.artifacts = []
-            await event_queue.enqueue_event(task)
-            logger.debug(
-                f"res, task: {task.id}, state: {task.status.state}, context: {task.context_id}, "
-                f"artifacts: {task.artifacts}",
-            )
+            except Exception as e:
+                task.status.state = TaskState.failed
+                task.status.message = new_agent_text_message(
+                    text=f"Error occurred during agent execution: {e}",
+                    context_id=task.context_id,
+                    task_id=task.id,
+                )
+                task.artifacts = []
+                task.metadata = {**(task.metadata or {}), **self._usage_metadata(task, tenant_id)}
+                await self._publish(stream, event_queue, task)
+                logger.debug("res, state: {}, artifacts: {}", task.status.state, task.artifacts)
 
     @override
     async def cancel(
@@ -186,12 +322,46 @@ class A2aChatbot:
         self,
         *,
         mode: Literal["JSONRPC", "GRPC", "HTTP+JSON"] = "HTTP+JSON",
+        agent: Literal["chatbot", "planner"] = "chatbot",
         streaming: bool = False,
         blocking: bool = True,
         strict: bool = False,
+        push_notifications: bool = False,
+        push_allowed_hosts: tuple[str, ...] = (),
+        tracer: Tracer | None = None,
+        metrics: bool = True,
+        budget: TokenBudget | None = None,
+        fallback_model: str | None = None,
+        grpc_port: int = GRPC_PORT,
+        compression_minimum_size: int | None = COMPRESSION_MINIMUM_SIZE,
+        merge_follow_ups: bool = False,
+        message_log: bool = False,
+        compact_tool_results: bool = False,
+        warm_up: bool = True,
+        io_workers: int = EXECUTOR_IO_WORKERS,
+        cpu_workers: int = EXECUTOR_CPU_WORKERS,
+        cpu_executor: ExecutorKind = "process",
     ) -> None:
         """Initialize A2A Chatbot."""
+        if push_notifications and not push_allowed_hosts:
+            msg = "push notifications need the hosts allowed to receive them"
+            raise ValueError(msg)
         self.mode = mode
+        # Every request shares one event loop, so the sync tools run on pools of their own
+        self.executors = ToolExecutors(io_workers=io_workers, cpu_workers=cpu_workers, cpu_kind=cpu_executor)
+        self.loop_lag = LoopLagMonitor()
+        self.warm_up = warm_up
+        self.readiness = Readiness()
+        self.readiness.ready = not warm_up
+        self.compression_minimum_size = compression_minimum_size
+        self.grpc_port = grpc_port
+        # Set by `run`, to advertise the HTTP transport on the port served
+        self.http_port = HTTP_PORT
+        self.streaming = streaming
+        self.push_notifications = push_notifications
+        self.push_allowed_hosts = push_allowed_hosts
+        self.tracer = tracer
+        self.metrics = A2aChatbotMetrics() if metrics else None
         self.agent_skill = AgentSkill(
             id="exchange_currency_rate",
             name="exchange_currency_rate",
@@ -201,56 +371,199 @@ class A2aChatbot:
             output_modes=["text", "text/plain"],
             examples=["How much is 1 USD in JPY?"],
         )
-        self.agent_card = AgentCard(
+        self.agent_card = self._make_agent_card()
+        self.agent_executor = A2aChatbotExecutor(
+            agent=agent,
+            streaming=streaming,
+            blocking=blocking,
+            strict=strict,
+            tracer=tracer,
+            metrics=self.metrics,
+            budget=budget,
+            fallback_model=fallback_model,
+            merge_follow_ups=merge_follow_ups,
+            message_log=message_log,
+            compact_tool_results=compact_tool_results,
+            executors=self.executors,
+        )
+        push_config_store = (
+            AllowedHostsPushNotificationConfigStore(self.push_allowed_hosts) if self.push_notifications else None
+        )
+        # Closed when the server stops
+        self.push_client = httpx.AsyncClient(timeout=PUSH_NOTIFICATION_TIMEOUT) if push_config_store else None
+        task_store = MeteredTaskStore(self.metrics) if self.metrics else InMemoryTaskStore()
+        self.queue_manager = MeteredQueueManager() if self.metrics else BoundedQueueManager()
+        self.agent_executor.task_store = task_store
+        # Served over HTTP, and over gRPC in the GRPC mode
+        self.request_handler = DefaultRequestHandler(
+            agent_executor=self.agent_executor,
+            task_store=task_store,
+            queue_manager=self.queue_manager,
+            push_config_store=push_config_store,
+            push_sender=(
+                BasePushNotificationSender(httpx_client=self.push_client, config_store=push_config_store)
+                if push_config_store and self.push_client
+                else None
+            ),
+        )
+
+    @property
+    def http_url(self) -> str:
+        """Get the url of the HTTP transport."""
+        return f"{HTTP_PROTOCOL}://{HTTP_HOST}:{self.http_port}{HTTP_ROUTE}"
+
+    @property
+    def url(self) -> str:
+        """Get the url of the preferred transport."""
+        if self.mode == "GRPC":
+            return f"{HTTP_HOST}:{self.grpc_port}"
+        return self.http_url
+
+    def _make_agent_card(self) -> AgentCard:
+        """Make the agent card advertising the transports."""
+        return AgentCard(
             name="exchange_currency_rate_chatbot",
             description="A chatbot that can answer questions and exchange currency rates.",
-            url=f"{HTTP_PROTOCOL}://{HTTP_HOST}:{HTTP_PORT}{HTTP_ROUTE}",
+            url=self.url,
             preferred_transport=self.mode,
             additional_interfaces=[
                 AgentInterface(
-                    url=f"{HTTP_PROTOCOL}://{HTTP_HOST}:{HTTP_PORT}{HTTP_ROUTE}",
+                    url=self.url,
                     transport=self.mode,
                 ),
+                # The agent card and a fallback transport are served over HTTP beside gRPC
+                *(
+                    [
+                        AgentInterface(
+                            url=self.http_url,
+                            transport="HTTP+JSON",
+                        ),
+                    ]
+                    if self.mode == "GRPC"
+                    else []
+                ),
             ],
             version="2.0.0",
             capabilities=AgentCapabilities(
-                push_notifications=False,
+                push_notifications=self.push_notifications,
                 state_transition_history=False,
-                streaming=streaming,
+                streaming=self.streaming,
             ),
             default_input_modes=["text", "text/plain"],
             default_output_modes=["text", "text/plain"],
             skills=[self.agent_skill],
             supports_authenticated_extended_card=False,
         )
-        self.agent_executor = A2aChatbotExecutor(streaming=streaming, blocking=blocking, strict=strict)
 
-    def run(
-        self,
-        host: str = HTTP_HOST,
-        port: int = HTTP_PORT,
-    ) -> None:
-        """Start HTTP Server."""
-        server: A2AFastAPIApplication | A2ARESTFastAPIApplication
+    def build(self) -> FastAPI:
+        """Build the ASGI application."""
+        server: FastA2AFastAPIApplication | FastA2ARESTFastAPIApplication
         if self.mode == "JSONRPC":
-            server = A2AFastAPIApplication(
+            server = FastA2AFastAPIApplication(
                 agent_card=self.agent_card,
-                http_handler=DefaultRequestHandler(
-                    agent_executor=self.agent_executor,
-                    task_store=InMemoryTaskStore(),
-                ),
+                http_handler=self.request_handler,
             )
         else:
-            server = A2ARESTFastAPIApplication(
+            server = FastA2ARESTFastAPIApplication(
                 agent_card=self.agent_card,
-                http_handler=DefaultRequestHandler(
-                    agent_executor=self.agent_executor,
-                    task_store=InMemoryTaskStore(),
-                ),
+                http_handler=self.request_handler,
             )
 
-        uvicorn.run(
-            app=server.build(rpc_url=f"{HTTP_ROUTE}"),
-            host=host,
-            port=port,
-        )
+        app = server.build(rpc_url=f"{HTTP_ROUTE}")
+        app.add_route(HEALTH_ROUTE, self.readiness.healthz, methods=["GET"])
+        app.add_route(READY_ROUTE, self.readiness.readyz, methods=["GET"])
+        if self.compression_minimum_size is not None:
+            app.add_middleware(CompressionMiddleware, minimum_size=self.compression_minimum_size)
+        if self.metrics is not None and isinstance(self.queue_manager, MeteredQueueManager):
+            self.metrics.track_checkpointer(self.agent_executor.agent.checkpointer)
+            self.metrics.track_queues(self.queue_manager)
+            self.metrics.track_scheduler(self.agent_executor.scheduler)
+            self.metrics.track_executors(self.executors.pools)
+            self.metrics.track_loop_lag(self.loop_lag)
+            app.add_route(METRICS_ROUTE, self.metrics.registry.endpoint, methods=["GET"])
+            app.add_middleware(
+                MetricsMiddleware,
+                requests=self.metrics.http_requests,
+                latency=self.metrics.http_latency,
+            )
+        return app
+
+    def run(
+        self,
+        host: str = HTTP_HOST,
+        port: int = HTTP_PORT,
+    ) -> None:
+        """Start HTTP Server, and gRPC Server in the GRPC mode."""
+        if port != self.http_port:
+            self.http_port = port
+            self.agent_card = self._make_agent_card()
+        app = self.build()
+        config = uvicorn.Config(app=app, host=host, port=port)
+        try:
+            asyncio.run(self._serve(config, host), loop_factory=config.get_loop_factory())
+        finally:
+            self.executors.shutdown(wait=False)
+            if self.tracer is not None:
+                self.tracer.shutdown()
+
+    async def _serve(self, config: uvicorn.Config, host: str) -> None:
+        """Serve the application, warming up in the background."""
+        # Warm up while serving, so that probes see the server alive but not ready yet
+        warm_up = asyncio.create_task(self.readiness.warm_up(self.warm_up_steps())) if self.warm_up else None
+        loop_lag = asyncio.create_task(self.loop_lag.run()) if self.metrics else None
+        try:
+            if self.mode == "GRPC":
+                await self._serve_with_grpc(config, host)
+            else:
+                await uvicorn.Server(config).serve()
+        finally:
+            for task in (warm_up, loop_lag):
+                if task is not None:
+                    task.cancel()
+            if self.push_client is not None:
+                await self.push_client.aclose()
+
+    async def _serve_with_grpc(self, config: uvicorn.Config, host: str) -> None:
+        """Serve the request handler over gRPC beside the HTTP application on one event loop."""
+        from app.a2a_agents.a2a_grpc import GRPC_SHUTDOWN_GRACE, start_grpc_server  # noqa: PLC0415
+
+        grpc_server = await start_grpc_server(self.agent_card, self.request_handler, host, self.grpc_port)
+        try:
+            await uvicorn.Server(config).serve()
+        finally:
+            await grpc_server.stop(GRPC_SHUTDOWN_GRACE)
+
+    def warm_up_steps(self) -> dict[str, Callable[[], Awaitable[None]]]:
+        """Get the warm-up steps paying the costs of the first request before it comes."""
+        return {
+            "model": lambda: asyncio.to_thread(self._warm_up_model),
+            "tools": lambda: asyncio.to_thread(self._warm_up_tools),
+            "graph": self._warm_up_graph,
+        }
+
+    def _warm_up_model(self) -> None:
+        """Construct the model clients bound to the tools, and open their connection pools."""
+        from langchain_google_genai import ChatGoogleGenerativeAI  # noqa: PLC0415
+
+        agent = self.agent_executor.agent
+        # Binding the tools builds their schemas
+        _ = agent.llm
+        for model in (agent.model, agent.fallback_model):
+            if isinstance(model, ChatGoogleGenerativeAI) and model.client is not None:
+                # A metadata request opens the connection without spending tokens
+                model.client.models.get(model=model.model)
+
+    def _warm_up_tools(self) -> None:
+        """Construct the clients of the tools, loading their TLS contexts without calling the APIs."""
+        frankfurter_client()
+
+    async def _warm_up_graph(self) -> None:
+        """Run the graph once against a local fake model calling no tool, in the mode serving the requests."""
+        agent = self.agent_executor.agent
+        # A separate agent of the same class keeps the synthetic run out of the threads, the usage and the metrics
+        warm_up_agent = type(agent)(model=FixedChatModel(), tools=agent.tools, message_log=agent.message_log)
+        if self.agent_executor.streaming:
+            async for _ in warm_up_agent.astream_run(WARM_UP_QUERY):
+                pass
+        else:
+            await warm_up_agent.async_run(WARM_UP_QUERY)
@@ -0,0 +1,62 @@
+"""
+a2a_grpc.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, override
+
+import grpc
+from a2a.grpc import a2a_pb2_grpc
+from a2a.server.request_handlers.grpc_handler import DefaultCallContextBuilder, GrpcHandler
+from loguru import logger
+
+if TYPE_CHECKING:
+    from a2a.server.context import ServerCallContext
+    from a2a.server.request_handlers import RequestHandler
+    from a2a.types import AgentCard
+
+GRPC_SHUTDOWN_GRACE: float = 5.0
+GRPC_MAX_CONCURRENT_STREAMS: int = 256
+GRPC_MAX_MESSAGE_LENGTH: int = 16 * 1024 * 1024
+
+
+class HeaderCallContextBuilder(DefaultCallContextBuilder):
+    """Call context builder exposing the gRPC metadata as headers, as the HTTP transports do."""
+
+    @override
+    def build(self, context: grpc.aio.ServicerContext) -> ServerCallContext:
+        """Build the call context of a request."""
+        call_context = super().build(context)
+        call_context.state["headers"] = {
+            key.lower(): value.decode() if isinstance(value, bytes) else value
+            for key, value in context.invocation_metadata() or ()
+        }
+        return call_context
+
+
+async def start_grpc_server(
+    agent_card: AgentCard,
+    request_handler: RequestHandler,
+    host: str,
+    port: int,
+) -> grpc.aio.Server:
+    """Start a gRPC server of the request handler on the running event loop."""
+    server = grpc.aio.server(
+        options=[
+            ("grpc.max_concurrent_streams", GRPC_MAX_CONCURRENT_STREAMS),
+            ("grpc.max_receive_message_length", GRPC_MAX_MESSAGE_LENGTH),
+            ("grpc.max_send_message_length", GRPC_MAX_MESSAGE_LENGTH),
+        ],
+    )
+    a2a_pb2_grpc.add_A2AServiceServicer_to_server(  # type: ignore[no-untyped-call]
+        GrpcHandler(agent_card, request_handler, context_builder=HeaderCallContextBuilder()),
+        server,
+    )
+    server.add_insecure_port(f"{host}:{port}")
+    await server.start()
+    logger.info("a2a grpc server started: {}:{}", host, port)
+    return server
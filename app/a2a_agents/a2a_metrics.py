@@ -0,0 +1,310 @@
+"""
+a2a_metrics.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, override
+
+from a2a.server.request_handlers.default_request_handler import TERMINAL_TASK_STATES
+from a2a.server.tasks import InMemoryTaskStore
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.checkpoint.memory import InMemorySaver
+
+from app.a2a_agents.a2a_streaming import BoundedQueueManager
+from app.libs.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from uuid import UUID
+
+    from a2a.server.context import ServerCallContext
+    from a2a.types import Task
+    from langchain_core.outputs import LLMResult
+    from langgraph.checkpoint.base import BaseCheckpointSaver
+
+    from app.libs.executors import ExecutorPool, LoopLagMonitor
+    from app.libs.scheduler import ThreadScheduler
+
+
+class A2aChatbotMetrics:
+    """Metrics of the A2A Chatbot."""
+
+    def __init__(self, registry: MetricsRegistry | None = None) -> None:
+        """Initialize A2A Chatbot Metrics."""
+        self.registry = registry or MetricsRegistry()
+        self.http_requests = self.registry.register(
+            Counter("a2a_http_requests_total", "HTTP requests handled.", ("method", "route", "status")),
+        )
+        self.http_latency = self.registry.register(
+            Histogram("a2a_http_request_duration_seconds", "HTTP request latency.", ("method", "route")),
+        )
+        self.task_transitions = self.registry.register(
+            Counter("a2a_task_transitions_total", "Task state transitions.", ("from_state", "to_state")),
+        )
+        self.runs_in_flight = self.registry.register(
+            Gauge("a2a_runs_in_flight", "Agent runs in progress."),
+        )
+        self.run_latency = self.registry.register(
+            Histogram("a2a_run_duration_seconds", "End-to-end agent run latency."),
+        )
+        self.llm_latency = self.registry.register(
+            Histogram("chatbot_llm_call_duration_seconds", "LLM call latency.", ("model", "outcome")),
+        )
+        self.llm_tokens = self.registry.register(
+            Counter("chatbot_llm_tokens_total", "LLM tokens consumed.", ("model", "type")),
+        )
+        self.tool_latency = self.registry.register(
+            Histogram("chatbot_tool_call_duration_seconds", "Tool call latency.", ("tool", "outcome")),
+        )
+        self.stream_events = self.registry.register(
+            Counter("a2a_stream_artifact_events_total", "Coalesced artifact events streamed."),
+        )
+        self.stream_detached = self.registry.register(
+            Counter("a2a_stream_detached_total", "Streams detached from a slow consumer."),
+        )
+
+    def track_checkpointer(self, checkpointer: BaseCheckpointSaver[Any]) -> None:
+        """Expose the size of an in-memory checkpointer, read at scrape time."""
+        if not isinstance(checkpointer, InMemorySaver):
+            return
+        self.registry.register(
+            Gauge(
+                "chatbot_checkpointer_threads",
+                "Threads held by the checkpointer.",
+                function=lambda: {(): float(len(checkpointer.storage))},
+            ),
+        )
+        self.registry.register(
+            Gauge(
+                "chatbot_checkpointer_checkpoints",
+                "Checkpoints held by the checkpointer.",
+                function=lambda: {
+                    (): float(
+                        sum(
+                            len(checkpoints)
+                            for namespaces in list(checkpointer.storage.values())
+                            for checkpoints in list(namespaces.values())
+                        ),
+                    ),
+                },
+            ),
+        )
+
+    def track_queues(self, queue_manager: MeteredQueueManager) -> None:
+        """Expose the depth of the event queues, read at scrape time."""
+        self.registry.register(
+            Gauge(
+                "a2a_event_queues",
+                "Open event queues.",
+                function=lambda: {(): float(queue_manager.count())},
+            ),
+        )
+        self.registry.register(
+            Gauge(
+                "a2a_event_queue_depth",
+                "Events waiting in the event queues.",
+                function=lambda: {(): float(queue_manager.depth())},
+            ),
+        )
+
+    def track_scheduler(self, scheduler: ThreadScheduler) -> None:
+        """Expose the runs waiting for their turn on a thread, read at scrape time."""
+        self.registry.register(
+            Gauge(
+                "a2a_runs_queued",
+                "Runs waiting for the run in progress on their context.",
+                function=lambda: {(): float(scheduler.queued())},
+            ),
+        )
+        self.registry.register(
+            Gauge(
+                "a2a_follow_ups_merged",
+                "Follow-up messages merged into the turn of an earlier one.",
+                function=lambda: {(): float(scheduler.merged)},
+            ),
+        )
+
+    def track_executors(self, pools: tuple[ExecutorPool, ...]) -> None:
+        """Expose the calls of the executor pools by pool, read at scrape time."""
+
+        def _register(name: str, documentation: str, read: Callable[[ExecutorPool], int]) -> None:
+            self.registry.register(
+                Gauge(
+                    name,
+                    documentation,
+                    ("pool", "kind"),
+                    function=lambda: {(pool.name, pool.kind): float(read(pool)) for pool in pools},
+                ),
+            )
+
+        _register("executor_calls_queued", "Calls waiting for a worker of the pool.", lambda pool: pool.queued())
+        _register("executor_calls_running", "Calls running on a worker of the pool.", lambda pool: pool.running())
+        _register("executor_workers", "Workers of the pool.", lambda pool: pool.max_workers)
+        _register("executor_calls_completed", "Calls completed by the pool.", lambda pool: pool.completed)
+        _register("executor_calls_failed", "Calls failed or cancelled on the pool.", lambda pool: pool.failed)
+
+    def track_loop_lag(self, monitor: LoopLagMonitor) -> None:
+        """Expose the lag of the event loop, read at scrape time."""
+        self.registry.register(
+            Gauge(
+                "a2a_event_loop_lag_seconds",
+                "Delay of the last timer of the event loop behind its schedule.",
+                function=lambda: {(): monitor.lag},
+            ),
+        )
+        self.registry.register(
+            Gauge(
+                "a2a_event_loop_lag_max_seconds",
+                "Largest delay of a timer of the event loop behind its schedule.",
+                function=lambda: {(): monitor.max_lag},
+            ),
+        )
+
+    @contextmanager
+    def measure_run(self) -> Iterator[None]:
+        """Count an agent run in flight and measure its latency."""
+        self.runs_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.runs_in_flight.dec()
+            self.run_latency.observe(time.perf_counter() - start)
+
+
+class MeteredTaskStore(InMemoryTaskStore):
+    """In-memory task store counting the state transitions of saved tasks."""
+
+    def __init__(self, metrics: A2aChatbotMetrics) -> None:
+        """Initialize Metered Task Store."""
+        super().__init__()
+        self.metrics = metrics
+        self._states: dict[str, str] = {}
+
+    @override
+    async def save(self, task: Task, context: ServerCallContext | None = None) -> None:
+        """Save a task and count its state transition, forgetting the state of a task ended."""
+        await super().save(task, context)
+        state = task.status.state.value
+        previous = self._states.get(task.id, "none")
+        if previous != state:
+            self.metrics.task_transitions.inc(previous, state)
+        if task.status.state in TERMINAL_TASK_STATES:
+            self._states.pop(task.id, None)
+        else:
+            self._states[task.id] = state
+
+    @override
+    async def delete(self, task_id: str, context: ServerCallContext | None = None) -> None:
+        """Delete a task."""
+        await super().delete(task_id, context)
+        self._states.pop(task_id, None)
+
+
+class MeteredQueueManager(BoundedQueueManager):
+    """Bounded in-memory queue manager exposing the depth of its event queues."""
+
+    def count(self) -> int:
+        """Get the number of open event queues."""
+        return len(self._task_queue)
+
+    def depth(self) -> int:
+        """Get the number of events waiting in the event queues."""
+        return sum(queue.queue.qsize() for queue in list(self._task_queue.values()))
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Callback handler measuring LLM calls and tool calls."""
+
+    run_inline = True
+
+    def __init__(self, metrics: A2aChatbotMetrics) -> None:
+        """Initialize Metrics Callback Handler."""
+        self.metrics = metrics
+        self._starts: dict[UUID, tuple[float, str]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any] | None,  # noqa: ARG002
+        messages: list[list[Any]],  # noqa: ARG002
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """Start measuring an LLM call."""
+        self._starts[run_id] = (time.perf_counter(), str((metadata or {}).get("ls_model_name", "unknown")))
+
+    def on_llm_end(
+        self,
+        response: LLMResult,
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """Measure an LLM call and count its tokens."""
+        start = self._starts.pop(run_id, None)
+        if start is None:
+            return
+        (started, model) = start
+        self.metrics.llm_latency.observe(time.perf_counter() - started, model, "success")
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for key in ["input_tokens", "output_tokens"]:
+                    if key in usage:
+                        self.metrics.llm_tokens.inc(model, key.removesuffix("_tokens"), amount=usage[key])
+
+    def on_llm_error(
+        self,
+        error: BaseException,  # noqa: ARG002
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """Measure a failed LLM call."""
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.metrics.llm_latency.observe(time.perf_counter() - start[0], start[1], "error")
+
+    def on_tool_start(
+        self,
+        serialized: dict[str, Any] | None,
+        input_str: str,  # noqa: ARG002
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> None:
+        """Start measuring a tool call."""
+        name = kwargs.get("name") or (serialized or {}).get("name") or "unknown"
+        self._starts[run_id] = (time.perf_counter(), str(name))
+
+    def on_tool_end(
+        self,
+        output: Any,  # noqa: ARG002, ANN401
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """Measure a tool call."""
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.metrics.tool_latency.observe(time.perf_counter() - start[0], start[1], "success")
+
+    def on_tool_error(
+        self,
+        error: BaseException,  # noqa: ARG002
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """Measure a failed tool call."""
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.metrics.tool_latency.observe(time.perf_counter() - start[0], start[1], "error")
@@ -0,0 +1,47 @@
+"""
+a2a_push.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, override
+from urllib.parse import urlsplit
+
+from a2a.server.tasks import InMemoryPushNotificationConfigStore
+from a2a.types import InvalidParamsError
+from a2a.utils.errors import ServerError
+from loguru import logger
+
+if TYPE_CHECKING:
+    from a2a.types import PushNotificationConfig
+
+PUSH_NOTIFICATION_SCHEMES = ("http", "https")
+
+
+class AllowedHostsPushNotificationConfigStore(InMemoryPushNotificationConfigStore):
+    """
+    Push notification config store accepting the callback urls on the allowed hosts only.
+
+    The server posts the tasks to the callback urls given by callers,
+    so that an open store would let any caller make the server send requests to any host, e.g. of an internal network.
+    """
+
+    def __init__(self, allowed_hosts: tuple[str, ...]) -> None:
+        """Initialize Allowed Hosts Push Notification Config Store."""
+        super().__init__()
+        self.allowed_hosts = frozenset(host.lower() for host in allowed_hosts)
+
+    def allows(self, url: str) -> bool:
+        """Whether the server may post to the url."""
+        parts = urlsplit(url)
+        return parts.scheme in PUSH_NOTIFICATION_SCHEMES and (parts.hostname or "") in self.allowed_hosts
+
+    @override
+    async def set_info(self, task_id: str, notification_config: PushNotificationConfig) -> None:
+        if not self.allows(notification_config.url):
+            logger.warning("push notification url rejected, task: {}, url: {}", task_id, notification_config.url)
+            raise ServerError(error=InvalidParamsError(message="The push notification url is not allowed."))
+        await super().set_info(task_id, notification_config)
@@ -0,0 +1,195 @@
+"""
+a2a_streaming.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, override
+from uuid import uuid4
+
+from a2a.server.events import EventQueue, InMemoryQueueManager
+from a2a.types import Artifact, Part, TaskArtifactUpdateEvent, TextPart
+from loguru import logger
+
+if TYPE_CHECKING:
+    from a2a.server.events import Event
+    from a2a.types import Task
+
+    from app.a2a_agents.a2a_metrics import A2aChatbotMetrics
+
+STREAM_COALESCE_CHARS = 256
+STREAM_COALESCE_WINDOW = 0.05
+STREAM_MAX_CHUNK_CHARS = 16 * 1024
+STREAM_MAX_QUEUED_EVENTS = 64
+STREAM_DETACH_TIMEOUT = 10.0
+
+
+###
+# Define Queue Manager
+###
+class BoundedEventQueue(EventQueue):
+    """Event queue whose taps are bounded alike, so that a resubscriber buffers no more events than the consumer."""
+
+    def __init__(self, max_queue_size: int = STREAM_MAX_QUEUED_EVENTS) -> None:
+        """Initialize Bounded Event Queue."""
+        super().__init__(max_queue_size=max_queue_size)
+        self.max_queue_size = max_queue_size
+
+    @override
+    def tap(self) -> EventQueue:
+        """Tap the event queue into a child queue of the same bound."""
+        queue = BoundedEventQueue(self.max_queue_size)
+        self._children.append(queue)
+        return queue
+
+
+class BoundedQueueManager(InMemoryQueueManager):
+    """In-memory queue manager bounding the events buffered for a consumer of a task."""
+
+    def __init__(self, max_queue_size: int = STREAM_MAX_QUEUED_EVENTS) -> None:
+        """Initialize Bounded Queue Manager."""
+        super().__init__()
+        self.max_queue_size = max_queue_size
+
+    @override
+    async def create_or_tap(self, task_id: str) -> EventQueue:
+        """Create a bounded event queue of a task, or tap the existing one."""
+        async with self._lock:
+            if task_id not in self._task_queue:
+                queue = BoundedEventQueue(self.max_queue_size)
+                self._task_queue[task_id] = queue
+                return queue
+            return self._task_queue[task_id].tap()
+
+    @override
+    async def tap(self, task_id: str) -> EventQueue | None:
+        """Tap the event queue of a task, unless its stream has been detached."""
+        queue = await self.get(task_id)
+        # A detached stream closes its queue early, so followers have to poll the task instead
+        if queue is None or queue.is_closed():
+            return None
+        return await super().tap(task_id)
+
+
+###
+# Define Output Stage
+###
+class ArtifactStream:
+    """
+    Streaming output stage of a task, coalescing text chunks into artifact events.
+
+    Chunks are sent once `coalesce_chars` characters are pending, or `coalesce_window` seconds after the first one,
+    in events of at most `max_chunk_chars` characters.
+    Sending waits while the bounded event queue is full, which pauses the agent run.
+    A consumer that blocks a send for `detach_timeout` seconds is detached: its queue is closed,
+    and the rest of the run is only kept to be saved for polling.
+    """
+
+    def __init__(
+        self,
+        event_queue: EventQueue,
+        task: Task,
+        *,
+        name: str = "answer",
+        coalesce_chars: int = STREAM_COALESCE_CHARS,
+        coalesce_window: float = STREAM_COALESCE_WINDOW,
+        max_chunk_chars: int = STREAM_MAX_CHUNK_CHARS,
+        detach_timeout: float = STREAM_DETACH_TIMEOUT,
+        metrics: A2aChatbotMetrics | None = None,
+    ) -> None:
+        """Initialize Artifact Stream."""
+        self.event_queue = event_queue
+        self.task = task
+        self.name = name
+        self.coalesce_chars = coalesce_chars
+        self.coalesce_window = coalesce_window
+        self.max_chunk_chars = max_chunk_chars
+        self.detach_timeout = detach_timeout
+        self.metrics = metrics
+        self.artifact_id = str(uuid4())
+        self.detached = False
+        self._chunks: list[str] = []
+        self._pending = 0
+        self._pending_chars = 0
+        self._sent = 0
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task[None] | None = None
+
+    @property
+    def text(self) -> str:
+        """Get the whole text written to the stream."""
+        return "".join(self._chunks)
+
+    def artifact(self, text: str | None = None) -> Artifact:
+        """Make the artifact of the stream, holding the whole text by default."""
+        return Artifact(
+            artifact_id=self.artifact_id,
+            name=self.name,
+            parts=[Part(root=TextPart(text=self.text if text is None else text))],
+        )
+
+    async def write(self, text: str) -> None:
+        """Write a text chunk, sending the pending chunks when they are large enough."""
+        self._chunks.append(text)
+        if self.detached:
+            return
+        self._pending += 1
+        self._pending_chars += len(text)
+        if self._pending_chars >= self.coalesce_chars:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        """Send the pending chunks at the end of the coalescing window."""
+        await asyncio.sleep(self.coalesce_window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self, *, last: bool = False) -> None:
+        """Send the pending chunks as an artifact event."""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if self.detached or self._pending == 0:
+                return
+            text = "".join(self._chunks[len(self._chunks) - self._pending :])
+            (self._pending, self._pending_chars) = (0, 0)
+            for start in range(0, len(text), self.max_chunk_chars):
+                event = TaskArtifactUpdateEvent(
+                    artifact=self.artifact(text[start : start + self.max_chunk_chars]),
+                    append=self._sent > 0,
+                    last_chunk=last and start + self.max_chunk_chars >= len(text),
+                    context_id=self.task.context_id,
+                    task_id=self.task.id,
+                )
+                if not await self._send(event):
+                    return
+                self._sent += 1
+                if self.metrics is not None:
+                    self.metrics.stream_events.inc()
+
+    async def send(self, event: Event) -> bool:
+        """Send an event after the pending chunks, and get whether the consumer is still attached."""
+        await self.flush(last=True)
+        async with self._lock:
+            return not self.detached and await self._send(event)
+
+    async def _send(self, event: Event) -> bool:
+        """Enqueue an event, detaching the consumer when it blocks for too long."""
+        try:
+            await asyncio.wait_for(self.event_queue.enqueue_event(event), timeout=self.detach_timeout)
+        except TimeoutError:
+            self.detached = True
+            # Drop the buffered events, and end the stream of the consumer
+            await self.event_queue.close(immediate=True)
+            logger.warning("a2a stream detached from a slow consumer, task: {}", self.task.id)
+            if self.metrics is not None:
+                self.metrics.stream_detached.inc()
+            return False
+        return True
@@ -7,26 +7,38 @@ Author  : aumezawa
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Annotated, Any, TypedDict
+from contextlib import contextmanager, suppress
+from typing import TYPE_CHECKING, Annotated, Any, TypedDict, cast
 from uuid import uuid4
 
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, message_chunk_to_message
 from langchain_core.runnables import RunnableConfig
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 from langgraph.types import Command, interrupt
+from loguru import logger
+
+from app.agents.message_log import MessageLog, append_messages
+from app.libs.tracing import TracingCallbackHandler, current_span
+from app.libs.usage import TokenBudget, UsageLedger, add_usage, make_usage
 
 if TYPE_CHECKING:
-    from collections.abc import AsyncIterator
+    from collections.abc import AsyncIterator, Iterator, Mapping, Sequence
 
-    from langchain_core.language_models import BaseChatModel
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.language_models import BaseChatModel, LanguageModelInput
+    from langchain_core.messages import BaseMessage
+    from langchain_core.runnables import Runnable
     from langchain_core.tools import BaseTool
     from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint
     from langgraph.graph.state import CompiledStateGraph
 
+    from app.agents.tool_executors import ToolExecutors
+    from app.agents.tool_results import ToolResultCompactor
+    from app.libs.tracing import Span, Tracer
+
 
 ###
 # Define State
@@ -36,6 +48,17 @@ class ChatbotState(TypedDict):
 
     query: str
     messages: Annotated[list[Any], add_messages]
+    usage: Annotated[dict[str, float], add_usage]
+    llm_calls: int
+
+
+class ChatbotLogState(TypedDict):
+    """Chatbot State Class holding the messages in an append-only log."""
+
+    query: str
+    messages: Annotated[MessageLog, append_messages]
+    usage: Annotated[dict[str, float], add_usage]
+    llm_calls: int
 
 
 ###
@@ -45,6 +68,8 @@ class Chatbot:
     """Chatbot Class."""
 
     DEFAULT_LLM_MODEL = "gemini-2.5-flash"
+    TRIMMED_HISTORY_LENGTH = 8
+    BUDGET_EXHAUSTED_MESSAGE = "The token budget of this conversation is exhausted. Please start a new one later."
 
     NODE_START = START
     NODE_SETUP = "setup"
@@ -61,19 +86,60 @@ class Chatbot:
         checkpointer: BaseCheckpointSaver[str] | None = None,
         system_prompt: str = "Answer in English.",
         strict: bool = False,
+        tracer: Tracer | None = None,
+        callbacks: list[BaseCallbackHandler] | None = None,
+        fallback_model: BaseChatModel | None = None,
+        budget: TokenBudget | None = None,
+        ledger: UsageLedger | None = None,
+        message_log: bool = False,
+        tool_results: ToolResultCompactor | None = None,
+        executors: ToolExecutors | None = None,
     ) -> None:
         """Initialize Chatbot."""
-        self.model = model or ChatGoogleGenerativeAI(model=self.DEFAULT_LLM_MODEL)
-        if tools:
-            self.llm = self.model.bind_tools(tools)
-        else:
-            self.llm = self.model
-        self.tools = tools or []
+        # The sync tools run on the pools of the executors, so that they never hold up the event loop
+        self.executors = executors
+        tools = executors.wrap_all(tools) if executors and tools else tools
+        # The compactor adds the tool fetching the full results
+        self.tool_results = tool_results
+        self.tools = (tools or []) + (tool_results.tools if tools and tool_results else [])
+        # The default model is constructed on first use to keep imports light
+        self._model = model
+        self._llm: Runnable[LanguageModelInput, BaseMessage] | None = None
+        self.fallback_model = fallback_model
+        self.fallback_llm: Runnable[LanguageModelInput, BaseMessage] | None = None
+        if fallback_model is not None:
+            self.fallback_llm = self._bind(fallback_model)
+        self.budget = budget or TokenBudget()
+        self.ledger = ledger or UsageLedger()
         self.checkpointer = checkpointer or InMemorySaver()
         self.system_prompt = system_prompt
         self.strict = strict
+        self.tracer = tracer
+        self.callbacks = callbacks or []
+        # Long threads append to a log, instead of merging the whole list of messages on every update
+        self.message_log = message_log
         self.graph = self._build_graph()
 
+    @property
+    def model(self) -> BaseChatModel:
+        """Get the model."""
+        if self._model is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI  # noqa: PLC0415
+
+            self._model = ChatGoogleGenerativeAI(model=self.DEFAULT_LLM_MODEL)
+        return self._model
+
+    @property
+    def llm(self) -> Runnable[LanguageModelInput, BaseMessage]:
+        """Get the model bound to the tools."""
+        if self._llm is None:
+            self._llm = self._bind(self.model)
+        return self._llm
+
+    def _bind(self, model: BaseChatModel) -> Runnable[LanguageModelInput, BaseMessage]:
+        """Bind the model to the tools."""
+        return model.bind_tools(self.tools) if self.tools else model
+
     def checkpoint(self, thread_id: str) -> Checkpoint | None:
         """Get Checkpointer."""
         return self.checkpointer.get(
@@ -86,12 +152,130 @@ class Chatbot:
             ),
         )
 
+    def usage(self, thread_id: str) -> dict[str, float]:
+        """Get the token usage and cost of the thread."""
+        checkpoint = self.checkpoint(thread_id)
+        if checkpoint is None:
+            return {}
+        return dict(checkpoint["channel_values"].get("usage") or {})
+
+    def tenant_usage(self, tenant_id: str) -> dict[str, float]:
+        """Get the token usage and cost of the tenant."""
+        return self.ledger.get(tenant_id)
+
+    def _trim(self, messages: Sequence[Any]) -> list[Any]:
+        """Keep the system prompt and the recent history starting at a human message."""
+        # Never cut the results of tool calls from their request: step back to the human message of the turn,
+        # keeping a long tool loop whole
+        start = max(len(messages) - self.TRIMMED_HISTORY_LENGTH, 0)
+        while start > 0 and not isinstance(messages[start], HumanMessage):
+            start -= 1
+        # Every turn sets up the system prompt again, so the latest one is near the end
+        system = next((message for message in reversed(messages) if isinstance(message, SystemMessage)), None)
+        recent = [message for message in messages[start:] if not isinstance(message, SystemMessage)]
+        return recent if system is None else [system, *recent]
+
+    def _select_llm(self, level: str, state: Mapping[str, Any]) -> Runnable[LanguageModelInput, BaseMessage]:
+        """Select the model to call."""
+        # Called from the node, since compiling the graph reads the attributes used by the node
+        llm = (self.fallback_llm or self.llm) if level == "downgrade" else self.llm
+        llm_calls = state.get("llm_calls", 0)
+        if llm_calls >= self.budget.max_llm_calls_per_turn:
+            # Bound a runaway tools -> llm loop by answering without tools
+            logger.warning("llm calls capped, calls: {}", llm_calls)
+            llm = (self.fallback_model if level == "downgrade" else None) or self.model
+        return llm
+
+    def _invoke(self, llm: Runnable[LanguageModelInput, BaseMessage], messages: list[Any]) -> BaseMessage:
+        """Call the model."""
+        if self.tracer is None:
+            return llm.invoke(messages)
+        # Stream the call so that the tracer sees the first token
+        message: Any = None
+        for chunk in llm.stream(messages):
+            message = chunk if message is None else message + chunk
+        return message_chunk_to_message(message) if message is not None else AIMessage(content="")
+
+    @contextmanager
+    def _trace_run(self, thread_id: str, *, resume: bool) -> Iterator[Span | None]:
+        """Trace a run of the graph, if a tracer is set."""
+        if self.tracer is None:
+            yield None
+            return
+        span = self.tracer.start_span("chatbot.run", attributes={"thread_id": thread_id, "resume": resume})
+        # Made current, so that the calls to remote agents propagate the trace
+        token = current_span.set(span)
+        try:
+            yield span
+        except GeneratorExit:
+            # The stream was closed early by the consumer
+            self.tracer.end_span(span)
+            raise
+        except BaseException as e:
+            self.tracer.end_span(span, error=e)
+            raise
+        else:
+            self.tracer.end_span(span)
+        finally:
+            with suppress(ValueError):
+                # A stream may be closed in another context, e.g. finalized by the event loop
+                current_span.reset(token)
+
+    def _run_config(self, thread_id: str, span: Span | None, *, tenant_id: str | None = None) -> RunnableConfig:
+        """Make the config of a run of the graph."""
+        config = RunnableConfig(
+            {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "tenant_id": tenant_id,
+                },
+            },
+        )
+        callbacks = list(self.callbacks)
+        if self.tracer is not None and span is not None:
+            callbacks.append(TracingCallbackHandler(self.tracer, span))
+        if callbacks:
+            config["callbacks"] = callbacks
+        return config
+
+    def _call_llm(self, state: Mapping[str, Any], config: RunnableConfig) -> dict[str, Any]:
+        """Call the model on the messages within the token budget, the node shared by the agents."""
+        tenant_id = config.get("configurable", {}).get("tenant_id")
+        level = self.budget.level(
+            state.get("usage", {}).get("total_tokens", 0.0),
+            self.ledger.get(tenant_id).get("total_tokens", 0.0) if tenant_id else 0.0,
+        )
+        if level == "exhausted":
+            logger.warning("token budget exhausted, tenant: {}", tenant_id)
+            return {
+                "messages": [AIMessage(content=self.BUDGET_EXHAUSTED_MESSAGE)],
+            }
+
+        llm = self._select_llm(level, state)
+        # Approaching the budget, use a shorter history
+        history = self._trim(state["messages"]) if level == "downgrade" else list(state["messages"])
+
+        message = self._invoke(llm, history)
+        usage = make_usage(
+            getattr(message, "usage_metadata", None),
+            message.response_metadata.get("model_name"),
+        )
+        if tenant_id:
+            self.ledger.add(tenant_id, usage)
+
+        return {
+            "messages": [message],
+            "usage": usage,
+            "llm_calls": state.get("llm_calls", 0) + 1,
+        }
+
     def _build_graph(self) -> CompiledStateGraph[Any, None, Any, Any]:
         """Build Chatbot Graph."""
         # Initialize Graph
-        builder = StateGraph(ChatbotState)
+        # The nodes read either state, so that their annotations do not add a conflicting schema to the graph
+        builder = StateGraph(ChatbotLogState if self.message_log else ChatbotState)
 
-        def _node_setup(state: ChatbotState) -> dict[str, list[Any]]:
+        def _node_setup(state: ChatbotState | ChatbotLogState) -> dict[str, Any]:
             messages = [
                 SystemMessage(content=self.system_prompt),
                 HumanMessage(content=state["query"]),
@@ -99,26 +283,21 @@ class Chatbot:
 
             return {
                 "messages": messages,
+                "llm_calls": 0,
             }
 
-        def _node_llm(state: ChatbotState) -> dict[str, list[Any]]:
-            messages = [
-                self.llm.invoke(state["messages"]),
-            ]
+        def _node_llm(state: ChatbotState | ChatbotLogState, config: RunnableConfig) -> dict[str, Any]:
+            return self._call_llm(state, config)
 
-            return {
-                "messages": messages,
-            }
-
-        def _node_router(state: ChatbotState) -> str:
+        def _node_router(state: ChatbotState | ChatbotLogState) -> str:
             last_message = state["messages"][-1]
-            if last_message.tool_calls:
+            if isinstance(last_message, AIMessage) and last_message.tool_calls:
                 for tool_call in last_message.tool_calls:
                     if tool_call["name"] in [tool.name for tool in self.tools]:
                         return self.NODE_APPROVAL
             return self.NODE_END
 
-        def _node_approval(state: ChatbotState) -> dict[str, list[Any]]:  # noqa: ARG001
+        def _node_approval(state: ChatbotState | ChatbotLogState) -> dict[str, list[Any]]:  # noqa: ARG001
             approval = interrupt("Do you approve using an external tool? [yes/no]") if self.strict else "yes"
 
             messages = []
@@ -131,7 +310,14 @@ class Chatbot:
 
         builder.add_node(self.NODE_SETUP, _node_setup)
         builder.add_node(self.NODE_LLM, _node_llm)
-        builder.add_node(self.NODE_TOOLS, ToolNode(self.tools))
+        builder.add_node(
+            self.NODE_TOOLS,
+            ToolNode(
+                self.tools,
+                wrap_tool_call=self.tool_results.wrap if self.tool_results else None,
+                awrap_tool_call=self.tool_results.awrap if self.tool_results else None,
+            ),
+        )
         builder.add_node(self.NODE_APPROVAL, _node_approval)
 
         builder.add_edge(self.NODE_START, self.NODE_SETUP)
@@ -149,18 +335,15 @@ class Chatbot:
         thread_id: str | None = None,
         resume: bool = False,
         raw_output: bool = False,
+        tenant_id: str | None = None,
     ) -> tuple[str | dict[str, Any], bool]:
         """Run Chatbot."""
-        result = await self.graph.ainvoke(
-            input={"query": query} if not resume else Command(resume=query),
-            config=RunnableConfig(
-                {
-                    "configurable": {
-                        "thread_id": thread_id or str(uuid4()),
-                    },
-                },
-            ),
-        )
+        thread_id = thread_id or str(uuid4())
+        with self._trace_run(thread_id, resume=resume) as span:
+            result = await self.graph.ainvoke(
+                input={"query": query} if not resume else Command(resume=query),
+                config=self._run_config(thread_id, span, tenant_id=tenant_id),
+            )
 
         if raw_output:
             return (result, bool(result.get("__interrupt__")))
@@ -185,37 +368,45 @@ class Chatbot:
         thread_id: str | None = None,
         resume: bool = False,
         raw_output: bool = False,
+        tenant_id: str | None = None,
     ) -> AsyncIterator[tuple[str | dict[str, Any], bool]]:
         """Run Chatbot."""
-        async for event in self.graph.astream(
-            input={"query": query} if not resume else Command(resume=query),
-            config=RunnableConfig(
-                {
-                    "configurable": {
-                        "thread_id": thread_id or str(uuid4()),
-                    },
-                },
-            ),
-        ):
-            if raw_output:
-                yield (event, bool(event.get("__interrupt__")))
-                continue
-
-            if event.get("__interrupt__") is not None:
-                yield (event.get("__interrupt__", ["no messages."])[0].value, True)
-                continue
-
-            messages = next(iter(event.values())).get("messages", [])
-            if messages and isinstance(messages[-1], AIMessage):
-                content = messages[-1].content
-                if not content:
+        thread_id = thread_id or str(uuid4())
+        with self._trace_run(thread_id, resume=resume) as span:
+            async for mode, chunk in self.graph.astream(
+                input={"query": query} if not resume else Command(resume=query),
+                config=self._run_config(thread_id, span, tenant_id=tenant_id),
+                stream_mode=["updates", "custom"],
+            ):
+                # Partial outputs written by tools
+                if mode == "custom":
+                    if raw_output:
+                        yield ({"custom": chunk}, False)
+                    elif isinstance(chunk, dict) and chunk.get("text"):
+                        yield (str(chunk["text"]), False)
                     continue
-                elif isinstance(content, str):
-                    yield (content, False)
-                else:
-                    yield (
-                        " ".join(
-                            [chunk if isinstance(chunk, str) else chunk.get("text", "") for chunk in content],
-                        ),
-                        False,
-                    )
+
+                event = cast("dict[str, Any]", chunk)
+
+                if raw_output:
+                    yield (event, bool(event.get("__interrupt__")))
+                    continue
+
+                if event.get("__interrupt__") is not None:
+                    yield (event.get("__interrupt__", ["no messages."])[0].value, True)
+                    continue
+
+                messages = next(iter(event.values())).get("messages", [])
+                if messages and isinstance(messages[-1], AIMessage):
+                    content = messages[-1].content
+                    if not content:
+                        continue
+                    elif isinstance(content, str):
+                        yield (content, False)
+                    else:
+                        yield (
+                            " ".join(
+                                [chunk if isinstance(chunk, str) else chunk.get("text", "") for chunk in content],
+                            ),
+                            False,
+                        )
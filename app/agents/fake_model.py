@@ -0,0 +1,60 @@
+"""
+fake_model.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, cast, override
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+    from langchain_core.callbacks import CallbackManagerForLLMRun
+    from langchain_core.language_models import LanguageModelInput
+    from langchain_core.messages import BaseMessage
+    from langchain_core.runnables import Runnable
+    from langchain_core.tools import BaseTool
+
+FIXED_ANSWER = "OK"
+
+
+###
+# Define Fake Chat Model
+###
+class FixedChatModel(BaseChatModel):
+    """Local chat model answering a fixed text without calling any tool, e.g. to run a graph without side effects."""
+
+    answer: str = FIXED_ANSWER
+
+    @property
+    @override
+    def _llm_type(self) -> str:
+        return "fixed"
+
+    @override
+    def bind_tools(
+        self,
+        tools: Sequence[dict[str, Any] | type | Callable[..., Any] | BaseTool],
+        *,
+        tool_choice: str | None = None,
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, AIMessage]:
+        # The tools are never called
+        return cast("Runnable[LanguageModelInput, AIMessage]", self)
+
+    @override
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
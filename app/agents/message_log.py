@@ -0,0 +1,183 @@
+"""
+message_log.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, cast, overload, override
+from uuid import uuid4
+
+from langchain_core.messages import RemoveMessage, convert_to_messages, message_chunk_to_message
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph.message import add_messages
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from langchain_core.messages import BaseMessage
+    from langgraph.graph.message import Messages
+
+MESSAGE_LOG_SEGMENT_SIZE = 64
+MESSAGE_LOG_CACHED_SEGMENTS = 1024
+
+_serde = JsonPlusSerializer()
+_decoded: dict[bytes, tuple[BaseMessage, ...]] = {}
+
+
+###
+# Define Segments
+###
+def _cache(data: bytes, messages: tuple[BaseMessage, ...]) -> None:
+    """Keep the messages of a sealed segment, evicting the oldest segment when the cache is full."""
+    if len(_decoded) >= MESSAGE_LOG_CACHED_SEGMENTS:
+        _decoded.pop(next(iter(_decoded)), None)
+    _decoded[data] = messages
+
+
+def _encode(messages: Iterable[BaseMessage]) -> bytes:
+    """Serialize the messages of a sealed segment."""
+    sealed = tuple(messages)
+    (_, data) = _serde.dumps_typed(list(sealed))
+    _cache(data, sealed)
+    return data
+
+
+def _decode(data: bytes) -> tuple[BaseMessage, ...]:
+    """Deserialize the messages of a sealed segment, once per process while it stays cached."""
+    messages = _decoded.get(data)
+    if messages is None:
+        messages = tuple(_serde.loads_typed(("msgpack", data)))
+        _cache(data, messages)
+    return messages
+
+
+###
+# Define Message Log
+###
+@dataclass(eq=False)
+class MessageLog(Sequence["BaseMessage"]):
+    """
+    Append-only log of the messages of a thread, as an alternative to the list merged by `add_messages`.
+
+    Adding a message is O(1), with an index of the ids to replace a message added again with the same id.
+    Every `segment_size` messages are sealed into a serialized segment shared by the later versions of the log,
+    so that a checkpoint copies the bytes of the sealed segments instead of serializing every message again.
+    """
+
+    segments: tuple[bytes, ...] = ()
+    tail: tuple[BaseMessage, ...] = ()
+    segment_size: int = MESSAGE_LOG_SEGMENT_SIZE
+
+    def __post_init__(self) -> None:
+        """Initialize the index."""
+        # Deserialized checkpoints hold lists
+        self.segments = tuple(self.segments)
+        self.tail = tuple(self.tail)
+        self._index: dict[str, int] | None = None
+
+    @classmethod
+    def of(cls, messages: Iterable[BaseMessage], segment_size: int = MESSAGE_LOG_SEGMENT_SIZE) -> MessageLog:
+        """Make a log of the messages."""
+        return cls(segment_size=segment_size).add(messages)
+
+    @override
+    def __len__(self) -> int:
+        return len(self.segments) * self.segment_size + len(self.tail)
+
+    @overload
+    def __getitem__(self, index: int) -> BaseMessage: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[BaseMessage]: ...
+
+    @override
+    def __getitem__(self, index: int | slice) -> BaseMessage | list[BaseMessage]:
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        position = index + len(self) if index < 0 else index
+        if not 0 <= position < len(self):
+            msg = "message log index out of range"
+            raise IndexError(msg)
+        (segment, offset) = divmod(position, self.segment_size)
+        if segment == len(self.segments):
+            return self.tail[offset]
+        return _decode(self.segments[segment])[offset]
+
+    @override
+    def __iter__(self) -> Iterator[BaseMessage]:
+        for data in self.segments:
+            yield from _decode(data)
+        yield from self.tail
+
+    @override
+    def __reversed__(self) -> Iterator[BaseMessage]:
+        # Readers of the latest messages stop in the tail, without decoding the sealed segments
+        yield from reversed(self.tail)
+        for data in reversed(self.segments):
+            yield from reversed(_decode(data))
+
+    def _take_index(self) -> dict[str, int]:
+        """Take over the id index, which is rebuilt if this version is added to again."""
+        index = self._index
+        if index is None:
+            index = {message.id: position for position, message in enumerate(self) if message.id is not None}
+        self._index = None
+        return index
+
+    def add(self, messages: Iterable[BaseMessage]) -> MessageLog:
+        """Get a new version of the log with the messages added, replacing the messages of the same ids."""
+        index = self._take_index()
+        segments = self.segments
+        tail = list(self.tail)
+        for message in messages:
+            if message.id is None:
+                message.id = str(uuid4())
+            position = index.get(message.id)
+            if position is None:
+                index[message.id] = len(segments) * self.segment_size + len(tail)
+                tail.append(message)
+                if len(tail) == self.segment_size:
+                    segments = (*segments, _encode(tail))
+                    tail = []
+                continue
+            # Replacing a sealed message reseals its segment only
+            (segment, offset) = divmod(position, self.segment_size)
+            if segment == len(segments):
+                tail[offset] = message
+            else:
+                sealed = list(_decode(segments[segment]))
+                sealed[offset] = message
+                segments = (*segments[:segment], _encode(sealed), *segments[segment + 1 :])
+
+        log = MessageLog(segments, tuple(tail), self.segment_size)
+        log._index = index
+        return log
+
+
+###
+# Define Reducer
+###
+def _to_messages(messages: Messages) -> list[BaseMessage]:
+    """Coerce an update to a list of messages, as `add_messages` does."""
+    return [
+        message_chunk_to_message(cast("Any", message))
+        for message in convert_to_messages(messages if isinstance(messages, list) else [messages])
+    ]
+
+
+def append_messages(left: MessageLog | Messages, right: Messages) -> MessageLog:
+    """Add messages to the log, the counterpart of `add_messages` for a state holding a `MessageLog`."""
+    if not isinstance(left, MessageLog):
+        # Migrate a list of a checkpoint made with `add_messages`
+        left = MessageLog.of(_to_messages(left))
+    messages = _to_messages(right)
+    if any(isinstance(message, RemoveMessage) for message in messages):
+        # Removing rewrites the log, which is rare enough to fall back to the list
+        history: list[Any] = list(left)
+        return MessageLog.of(cast("list[BaseMessage]", add_messages(history, right)), left.segment_size)
+    return left.add(messages)
@@ -0,0 +1,316 @@
+"""
+planner.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, cast
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.graph import StateGraph
+from langgraph.types import interrupt
+from loguru import logger
+from pydantic import BaseModel, Field, ValidationError
+
+from app.agents.chatbot import Chatbot, ChatbotLogState, ChatbotState
+from app.libs.serialization import dumps, loads
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from langchain_core.language_models import BaseChatModel, LanguageModelInput
+    from langchain_core.messages import BaseMessage
+    from langchain_core.runnables import Runnable, RunnableConfig
+    from langgraph.graph.state import CompiledStateGraph
+
+PLAN_MAX_CONCURRENCY = 4
+PLAN_MAX_REPLANS = 2
+PLAN_REJECTED_MESSAGE = "The plan was rejected. Don't use any external tools."
+PLAN_PROMPT = """\
+You answer by planning. When the question needs tools, call `Plan` once with every step needed,
+as a dependency graph: the steps without dependencies between them are executed at the same time.
+A step uses the result of an earlier step by giving `$<step id>` as an argument, or `$<step id>.<key>`
+to take a key of a JSON result. You get the results of all the steps at once, then answer the question.
+If some steps failed, call `Plan` again with the steps still needed, which may use the results of earlier steps.
+When the question needs no tools, answer it directly.
+
+The tools are:
+{tools}"""
+
+
+###
+# Define Plan
+###
+class PlanStep(BaseModel):
+    """Step of a plan, calling a tool."""
+
+    id: str = Field(..., description="A unique identifier of the step, e.g. s1.")
+    tool: str = Field(..., description="The name of the tool to call.")
+    args: str = Field(
+        ...,
+        description="The arguments of the tool as a JSON object. A value `$<step id>` is replaced by its result.",
+    )
+    depends_on: list[str] = Field(
+        default_factory=list,
+        description="The identifiers of the steps whose results are needed before this step.",
+    )
+
+
+class Plan(BaseModel):
+    """Submit a plan of tool calls, executed as a dependency graph."""
+
+    steps: list[PlanStep] = Field(..., description="The steps of the plan.")
+
+
+PLAN_TOOL_NAME = Plan.__name__
+
+
+###
+# Define State
+###
+class PlannerState(ChatbotState):
+    """Planner State Class."""
+
+    results: dict[str, Any]
+    replans: int
+
+
+class PlannerLogState(ChatbotLogState):
+    """Planner State Class holding the messages in an append-only log."""
+
+    results: dict[str, Any]
+    replans: int
+
+
+###
+# Define Planner Class
+###
+class Planner(Chatbot):
+    """
+    Plan-and-execute agent, an alternative to the ReAct loop of Chatbot.
+
+    The model plans every tool call of a question up front as a dependency graph,
+    whose independent steps are executed concurrently, at most `max_concurrency` at a time.
+    The model is called again with all the results, to answer,
+    or to replan the failed steps at most `max_replans` times,
+    so a question needs two model calls however many tool calls it has.
+    """
+
+    NODE_EXECUTE = "execute"
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int = PLAN_MAX_CONCURRENCY,
+        max_replans: int = PLAN_MAX_REPLANS,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> None:
+        """Initialize Planner."""
+        self.max_concurrency = max_concurrency
+        self.max_replans = max_replans
+        super().__init__(**kwargs)
+
+    def _bind(self, model: BaseChatModel) -> Runnable[LanguageModelInput, BaseMessage]:
+        """Bind the model to the plan, the tools being called by the executor."""
+        return model.bind_tools([Plan]) if self.tools else model
+
+    def _select_llm(self, level: str, state: Mapping[str, Any]) -> Runnable[LanguageModelInput, BaseMessage]:
+        """Select the model to call, answering without a plan once the replans are used up."""
+        if state.get("replans", 0) >= self.max_replans:
+            logger.warning("replans exhausted, replans: {}", state.get("replans", 0))
+            return (self.fallback_model if level == "downgrade" else None) or self.model
+        return super()._select_llm(level, state)
+
+    def _prompt(self) -> str:
+        """Make the system prompt describing the tools to plan with."""
+        if not self.tools:
+            return self.system_prompt
+        tools = "\n".join(
+            f"- {tool.name}: {tool.description} Arguments: {dumps(tool.args).decode()}" for tool in self.tools
+        )
+        return f"{self.system_prompt}\n\n{PLAN_PROMPT.format(tools=tools)}"
+
+    async def _execute(
+        self,
+        steps: list[PlanStep],
+        results: dict[str, Any],
+        config: RunnableConfig,
+    ) -> dict[str, str]:
+        """Execute the steps of a plan in the order of their dependencies, and get the outcome of each step."""
+        tools = {tool.name: tool for tool in self.tools}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        outcomes: dict[str, str] = {}
+        tasks: dict[str, asyncio.Task[None]] = {}
+
+        async def _run(step: PlanStep) -> None:
+            for dependency in step.depends_on:
+                if dependency in tasks:
+                    await tasks[dependency]
+            failed = [dependency for dependency in step.depends_on if dependency not in results]
+            if failed:
+                outcomes[step.id] = f"error: skipped, the steps {', '.join(failed)} have no result"
+                return
+            tool = tools.get(step.tool)
+            if tool is None:
+                outcomes[step.id] = f"error: the tool {step.tool} does not exist"
+                return
+            async with semaphore:
+                try:
+                    args = _resolve(loads(step.args), results)
+                    result = await tool.ainvoke(args, config)
+                except Exception as e:
+                    logger.warning("plan step failed, step: {}, tool: {}, error: {}", step.id, step.tool, e)
+                    outcomes[step.id] = f"error: {e}"
+                    return
+            results[step.id] = result
+            outcome = _text(result)
+            if self.tool_results is not None:
+                message = ToolMessage(content=outcome, name=step.tool, tool_call_id=step.id)
+                outcome = str((await self.tool_results.acompact(message)).content)
+            outcomes[step.id] = outcome
+
+        # A step is started after its dependencies, so that it never waits for a step started after it
+        (ordered, cyclic) = _order(steps)
+        for step in cyclic:
+            outcomes[step.id] = "error: the step depends on itself through its dependencies"
+        async with asyncio.TaskGroup() as group:
+            for step in ordered:
+                tasks[step.id] = group.create_task(_run(step))
+        return {step.id: outcomes[step.id] for step in steps}
+
+    def _build_graph(self) -> CompiledStateGraph[Any, None, Any, Any]:
+        """Build Planner Graph."""
+        # Initialize Graph
+        # The nodes read either state, so that their annotations do not add a conflicting schema to the graph
+        builder = StateGraph(PlannerLogState if self.message_log else PlannerState)
+        prompt = self._prompt()
+
+        def _node_setup(state: PlannerState | PlannerLogState) -> dict[str, Any]:
+            messages = [
+                SystemMessage(content=prompt),
+                HumanMessage(content=state["query"]),
+            ]
+
+            return {
+                "messages": messages,
+                "llm_calls": 0,
+                "results": {},
+                "replans": 0,
+            }
+
+        def _node_llm(state: PlannerState | PlannerLogState, config: RunnableConfig) -> dict[str, Any]:
+            return self._call_llm(state, config)
+
+        def _node_router(state: PlannerState | PlannerLogState) -> str:
+            last_message = state["messages"][-1]
+            if isinstance(last_message, AIMessage) and last_message.tool_calls:
+                for tool_call in last_message.tool_calls:
+                    if tool_call["name"] == PLAN_TOOL_NAME:
+                        return self.NODE_APPROVAL
+            return self.NODE_END
+
+        def _node_approval(state: PlannerState | PlannerLogState) -> dict[str, list[Any]]:
+            last_message = cast("AIMessage", state["messages"][-1])
+            approval = (
+                interrupt("Do you approve executing the plan with external tools? [yes/no]") if self.strict else "yes"
+            )
+
+            messages = []
+            if str(approval).upper() != "YES":
+                # Answer every call, since the model expects a result for each of them
+                messages = [
+                    ToolMessage(content=PLAN_REJECTED_MESSAGE, tool_call_id=tool_call["id"])
+                    for tool_call in last_message.tool_calls
+                ]
+
+            return {
+                "messages": messages,
+            }
+
+        def _node_approval_router(state: PlannerState | PlannerLogState) -> str:
+            return self.NODE_LLM if isinstance(state["messages"][-1], ToolMessage) else self.NODE_EXECUTE
+
+        async def _node_execute(state: PlannerState | PlannerLogState, config: RunnableConfig) -> dict[str, Any]:
+            last_message = cast("AIMessage", state["messages"][-1])
+            results = dict(state.get("results") or {})
+            messages = []
+            failed = False
+            for tool_call in last_message.tool_calls:
+                if tool_call["name"] != PLAN_TOOL_NAME:
+                    (content, failed) = (f"error: the tool {tool_call['name']} is called by a plan only", True)
+                else:
+                    try:
+                        plan = Plan.model_validate(tool_call["args"])
+                    except ValidationError as e:
+                        (content, failed) = (f"error: the plan is invalid: {e}", True)
+                    else:
+                        outcomes = await self._execute(plan.steps, results, config)
+                        content = "\n".join(f"[{step_id}] {outcome}" for step_id, outcome in outcomes.items())
+                        # Only the steps which succeeded have results
+                        failed = failed or any(step.id not in results for step in plan.steps)
+                messages.append(ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"]))
+
+            return {
+                "messages": messages,
+                "results": results,
+                "replans": state.get("replans", 0) + int(failed),
+            }
+
+        builder.add_node(self.NODE_SETUP, _node_setup)
+        builder.add_node(self.NODE_LLM, _node_llm)
+        builder.add_node(self.NODE_APPROVAL, _node_approval)
+        builder.add_node(self.NODE_EXECUTE, _node_execute)
+
+        builder.add_edge(self.NODE_START, self.NODE_SETUP)
+        builder.add_edge(self.NODE_SETUP, self.NODE_LLM)
+        builder.add_conditional_edges(self.NODE_LLM, _node_router)
+        builder.add_conditional_edges(self.NODE_APPROVAL, _node_approval_router)
+        builder.add_edge(self.NODE_EXECUTE, self.NODE_LLM)
+
+        return builder.compile(checkpointer=self.checkpointer)
+
+
+def _order(steps: list[PlanStep]) -> tuple[list[PlanStep], list[PlanStep]]:
+    """Order the steps after the steps of the plan they depend on, and get the steps in a cycle apart."""
+    pending = {step.id: step for step in steps}
+    ordered: list[PlanStep] = []
+    while True:
+        ready = [step for step in pending.values() if not any(dependency in pending for dependency in step.depends_on)]
+        if not ready:
+            return (ordered, list(pending.values()))
+        ordered.extend(pending.pop(step.id) for step in ready)
+
+
+def _resolve(value: Any, results: dict[str, Any]) -> Any:  # noqa: ANN401
+    """Replace the references `$<step id>` and `$<step id>.<key>` in the arguments by the results of the steps."""
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    if not isinstance(value, str) or not value.startswith("$"):
+        return value
+    (step_id, *path) = value[1:].split(".")
+    if step_id not in results:
+        return value
+    resolved = results[step_id]
+    for key in path:
+        if isinstance(resolved, str):
+            resolved = loads(resolved)
+        resolved = resolved[int(key)] if isinstance(resolved, list) else resolved[key]
+    return resolved
+
+
+def _text(result: Any) -> str:  # noqa: ANN401
+    """Get the text of the result of a tool."""
+    if isinstance(result, str):
+        return result
+    if isinstance(result, ToolMessage):
+        return str(result.content)
+    try:
+        return dumps(result).decode()
+    except TypeError:
+        return str(result)
@@ -0,0 +1,102 @@
+"""
+tool_executors.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import functools
+import importlib
+from typing import TYPE_CHECKING, Any, Literal, cast
+
+from langchain_core.tools import StructuredTool
+from loguru import logger
+
+from app.libs.executors import EXECUTOR_CPU_WORKERS, EXECUTOR_IO_WORKERS, ExecutorPool
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from langchain_core.tools import BaseTool
+
+    from app.libs.executors import ExecutorKind
+
+TOOL_EXECUTOR_KEY = "executor"
+
+type ToolExecutor = Literal["io", "cpu", "loop"]
+
+
+def cpu_bound(tool: BaseTool) -> BaseTool:
+    """Mark a tool as CPU-bound, to run it on the CPU pool."""
+    tool.metadata = {**(tool.metadata or {}), TOOL_EXECUTOR_KEY: "cpu"}
+    return tool
+
+
+def _call_tool(module: str, name: str, kwargs: dict[str, Any]) -> Any:  # noqa: ANN401
+    """Call the function of a tool in a worker, found by its module and name since a tool is not picklable."""
+    target: Any = functools.reduce(getattr, name.split("."), importlib.import_module(module))
+    func = cast("Callable[..., Any]", target.func if isinstance(target, StructuredTool) else target)
+    return func(**kwargs)
+
+
+###
+# Define Tool Executors
+###
+class ToolExecutors:
+    """
+    Pools running the sync tools off the event loop, each tool on the pool given by the `executor` key of its metadata.
+
+    - `cpu`: the CPU pool, of processes or of interpreters, in parallel with the event loop beyond the GIL.
+      The tool is called in a worker by the module and the name of its function,
+      so it must be defined at module level, with picklable arguments and results.
+      An interpreter pool also needs every module imported by the tool to support subinterpreters.
+    - `io`, the default: the bounded I/O thread pool, in the context of the tool call.
+    - `loop`: left to LangChain, e.g. a tool too cheap to be worth a thread switch.
+
+    Async tools are left to the event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        io_workers: int = EXECUTOR_IO_WORKERS,
+        cpu_workers: int = EXECUTOR_CPU_WORKERS,
+        cpu_kind: ExecutorKind = "process",
+    ) -> None:
+        """Initialize Tool Executors."""
+        self.io = ExecutorPool("io", "thread", io_workers)
+        self.cpu = ExecutorPool("cpu", cpu_kind, cpu_workers)
+
+    @property
+    def pools(self) -> tuple[ExecutorPool, ...]:
+        """Get the pools."""
+        return (self.io, self.cpu)
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """Wrap a sync tool into a tool awaiting its pool, or get the tool itself if left to the event loop."""
+        executor: ToolExecutor = (tool.metadata or {}).get(TOOL_EXECUTOR_KEY, "io")
+        if executor == "loop" or not isinstance(tool, StructuredTool) or tool.func is None or tool.coroutine:
+            return tool
+        func = tool.func
+
+        if executor == "cpu" and "<locals>" in func.__qualname__:
+            logger.warning("CPU-bound tool not defined at module level, running on the I/O pool, tool: {}", tool.name)
+            executor = "io"
+
+        async def _arun(**kwargs: Any) -> Any:  # noqa: ANN401
+            if executor == "cpu":
+                return await self.cpu.run(_call_tool, func.__module__, func.__qualname__, kwargs)
+            return await self.io.run(functools.partial(func, **kwargs))
+
+        return tool.model_copy(update={"coroutine": _arun})
+
+    def wrap_all(self, tools: list[BaseTool]) -> list[BaseTool]:
+        """Wrap the sync tools."""
+        return [self.wrap(tool) for tool in tools]
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """Shut down the pools."""
+        for pool in self.pools:
+            pool.shutdown(wait=wait)
@@ -0,0 +1,269 @@
+"""
+tool_results.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import tool
+from loguru import logger
+
+from app.libs.serialization import dumps, loads
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.tools import BaseTool
+    from langgraph.prebuilt.tool_node import ToolCallRequest
+    from langgraph.types import Command
+
+TOOL_RESULT_MAX_TOKENS = 512
+TOOL_RESULT_CHARS_PER_TOKEN = 4
+TOOL_RESULT_STORE_SIZE = 256
+FETCH_TOOL_RESULT_NAME = "fetch_tool_result"
+FETCH_TOOL_RESULT_MAX_TOKENS = 2048
+SUMMARY_PROMPT = (
+    "Summarize the following tool result in at most {max_words} words. "
+    "Keep every number, name, date and identifier needed to answer questions about it."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens of a text from its length."""
+    return math.ceil(len(text) / TOOL_RESULT_CHARS_PER_TOKEN)
+
+
+###
+# Define Policy
+###
+@dataclass(frozen=True, slots=True)
+class ToolResultPolicy:
+    """
+    Compaction of the results of a tool before they enter the messages.
+
+    A JSON result is projected to the dotted `fields`, mapping over lists, e.g. `rates` or `items.name`.
+    A result still over `max_tokens` is then summarized by `summarize` if given, and truncated otherwise.
+    """
+
+    fields: tuple[str, ...] = ()
+    max_tokens: int | None = TOOL_RESULT_MAX_TOKENS
+    summarize: Callable[[str], str] | None = None
+
+
+def model_summarizer(model: BaseChatModel, max_tokens: int = TOOL_RESULT_MAX_TOKENS) -> Callable[[str], str]:
+    """Make a summarizer of tool results calling the model, whose usage is not counted in the thread."""
+
+    def _summarize(text: str) -> str:
+        message = model.invoke(
+            [
+                SystemMessage(content=SUMMARY_PROMPT.format(max_words=max_tokens * 3 // 4)),
+                HumanMessage(content=text),
+            ],
+        )
+        return message.text
+
+    return _summarize
+
+
+def _select(value: Any, path: list[str]) -> Any:  # noqa: ANN401
+    """Select a dotted path of a JSON value, mapping over lists, or get None if it is missing."""
+    if not path:
+        return value
+    if isinstance(value, list):
+        return [_select(item, path) for item in value]
+    if isinstance(value, dict) and path[0] in value:
+        selected = _select(value[path[0]], path[1:])
+        return {path[0]: selected} if selected is not None else None
+    return None
+
+
+def _merge(left: Any, right: Any) -> Any:  # noqa: ANN401
+    """Merge two projections of the same JSON value."""
+    if isinstance(left, dict) and isinstance(right, dict):
+        return {**left, **{key: _merge(left.get(key), value) for key, value in right.items()}}
+    if isinstance(left, list) and isinstance(right, list):
+        return [_merge(item, other) for item, other in zip(left, right, strict=True)]
+    return right if right is not None else left
+
+
+def project(text: str, fields: tuple[str, ...]) -> str:
+    """Project a JSON text to the dotted fields, keeping a text which is not JSON as is."""
+    try:
+        value = loads(text)
+    except ValueError:
+        return text
+    projected = None
+    for field in fields:
+        projected = _merge(projected, _select(value, field.split(".")))
+    return dumps(projected).decode() if projected is not None else text
+
+
+###
+# Define Store
+###
+class ToolResultStore:
+    """Full tool results kept out of the messages by id, evicting the oldest ones."""
+
+    def __init__(self, max_results: int = TOOL_RESULT_STORE_SIZE) -> None:
+        """Initialize Tool Result Store."""
+        self.max_results = max_results
+        self._results: dict[str, str] = {}
+
+    def put(self, result_id: str, text: str) -> None:
+        """Store a result by its id."""
+        if len(self._results) >= self.max_results:
+            self._results.pop(next(iter(self._results)), None)
+        self._results[result_id] = text
+
+    def get(self, result_id: str) -> str | None:
+        """Get a result by its id."""
+        return self._results.get(result_id)
+
+
+###
+# Define Compactor
+###
+class ToolResultCompactor:
+    """
+    Post-processing stage of the tool node, compacting the results of the tools before they enter the messages.
+
+    The results are re-sent to the model on every later turn of the thread, so only their compacted form is kept,
+    with the id of the full result, which the model fetches on demand with the `fetch_tool_result` tool.
+    Tools without a policy get the default one, and a default of None leaves their results as they are.
+    """
+
+    def __init__(
+        self,
+        policies: dict[str, ToolResultPolicy] | None = None,
+        *,
+        default: ToolResultPolicy | None = ToolResultPolicy(),  # noqa: B008
+        store: ToolResultStore | None = None,
+    ) -> None:
+        """Initialize Tool Result Compactor."""
+        self.policies = policies or {}
+        self.default = default
+        self.store = store or ToolResultStore()
+        self.compacted = 0
+        self.saved_tokens = 0
+        self.tools = [self._fetch_tool()]
+
+    def _fetch_tool(self) -> BaseTool:
+        """Make the tool fetching the full results."""
+        store = self.store
+        page = FETCH_TOOL_RESULT_MAX_TOKENS * TOOL_RESULT_CHARS_PER_TOKEN
+
+        @tool(FETCH_TOOL_RESULT_NAME)
+        def fetch_tool_result(result_id: str, offset: int = 0) -> str:
+            """
+            Fetch the full result of an earlier tool call which was compacted.
+
+            Args:
+                result_id: The id of the full result, given in the compacted result.
+                offset: The character offset to read from, to page through a long result.
+                    Defaults to 0.
+
+            Returns:
+                str: A page of the full result.
+            """
+            text = store.get(result_id)
+            if text is None:
+                return f"The result {result_id} is no longer available."
+            remaining = len(text) - offset - page
+            if remaining <= 0:
+                return text[offset:]
+            return f"{text[offset : offset + page]}\n[{remaining} more characters, fetched with offset={offset + page}]"
+
+        return fetch_tool_result
+
+    def policy(self, name: str | None) -> ToolResultPolicy | None:
+        """Get the policy of a tool."""
+        if name == FETCH_TOOL_RESULT_NAME:
+            return None
+        return self.policies.get(name or "", self.default)
+
+    def compact(self, message: ToolMessage) -> ToolMessage:
+        """Compact the result of a tool, storing the full result out of the messages."""
+        policy = self.policy(message.name)
+        if policy is None or message.status == "error":
+            return message
+        text = _text(message.content)
+        if text is None:
+            return message
+
+        compacted = project(text, policy.fields) if policy.fields else text
+        if policy.max_tokens is not None and estimate_tokens(compacted) > policy.max_tokens:
+            if policy.summarize is not None:
+                compacted = policy.summarize(compacted)
+            max_chars = policy.max_tokens * TOOL_RESULT_CHARS_PER_TOKEN
+            if len(compacted) > max_chars:
+                compacted = compacted[:max_chars] + "..."
+        if compacted == text:
+            return message
+
+        result_id = str(uuid4())
+        tokens = estimate_tokens(text)
+        content = (
+            f"{compacted}\n[compacted from about {tokens} tokens, "
+            f'the full result is fetched with {FETCH_TOOL_RESULT_NAME}(result_id="{result_id}")]'
+        )
+        # A small result does not pay for the reference to the full one
+        if len(content) >= len(text):
+            return message
+
+        self.store.put(result_id, text)
+        compacted_tokens = estimate_tokens(content)
+        self.compacted += 1
+        self.saved_tokens += tokens - compacted_tokens
+        logger.debug("tool result compacted, tool: {}, tokens: {} -> {}", message.name, tokens, compacted_tokens)
+        return message.model_copy(update={"content": content})
+
+    async def acompact(self, message: ToolMessage) -> ToolMessage:
+        """Compact the result of a tool asynchronously."""
+        policy = self.policy(message.name)
+        if policy is not None and policy.summarize is not None:
+            # Summarizing calls a model, which would block the event loop
+            return await asyncio.to_thread(self.compact, message)
+        return self.compact(message)
+
+    def wrap(
+        self,
+        request: ToolCallRequest,
+        execute: Callable[[ToolCallRequest], ToolMessage | Command[Any]],
+    ) -> ToolMessage | Command[Any]:
+        """Execute a tool call, compacting its result."""
+        result = execute(request)
+        return self.compact(result) if isinstance(result, ToolMessage) else result
+
+    async def awrap(
+        self,
+        request: ToolCallRequest,
+        execute: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command[Any]]],
+    ) -> ToolMessage | Command[Any]:
+        """Execute a tool call asynchronously, compacting its result."""
+        result = await execute(request)
+        return await self.acompact(result) if isinstance(result, ToolMessage) else result
+
+
+def _text(content: str | list[Any]) -> str | None:
+    """Get the text of a tool result, or None if it holds other than text."""
+    if isinstance(content, str):
+        return content
+    texts = []
+    for block in content:
+        if isinstance(block, str):
+            texts.append(block)
+        elif isinstance(block, dict) and block.get("type") == "text":
+            texts.append(str(block.get("text", "")))
+        else:
+            return None
+    return "\n".join(texts)
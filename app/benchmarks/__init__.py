@@ -0,0 +1 @@
+"""Package for the benchmarks module."""
@@ -0,0 +1,408 @@
+"""
+a2a_load.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from contextlib import AsyncExitStack, contextmanager
+from dataclasses import dataclass
+from itertools import count
+from typing import TYPE_CHECKING, Any, Literal, cast, override
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+import httpx
+import httpx_sse
+from a2a.types import Message, MessageSendConfiguration, MessageSendParams, Part, Role, TaskQueryParams, TextPart
+
+from app.libs.batch import percentile, summarize
+from app.libs.compression import accept_encoding_header
+from app.libs.serialization import loads
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Iterator
+
+    from grpc.aio import Channel
+
+LOAD_REQUESTS = 100
+LOAD_CONCURRENCY = 8
+LOAD_TIMEOUT = 60.0
+LOAD_POLL_INTERVAL = 0.2
+LOAD_QUERY = "How much is 1 USD in JPY?"
+AGENT_CARD_ROUTE = "/.well-known/agent-card.json"
+ACTIVE_STATES = ("submitted", "working")
+ERROR_STATES = ("failed", "rejected", "canceled")
+
+type Transport = Literal["JSONRPC", "HTTP+JSON", "GRPC"]
+type Flow = Literal["send", "stream", "poll"]
+
+
+@dataclass(slots=True)
+class LoadSample:
+    """Outcome of a request of the load."""
+
+    latency: float
+    first_event: float | None = None
+    error: str | None = None
+
+
+class LoadError(Exception):
+    """Error of a request of the load."""
+
+
+def _state(task: dict[str, Any]) -> str:
+    """Get the state of a task, as named by JSONRPC."""
+    state = str(task.get("status", {}).get("state", ""))
+    return state.lower().removeprefix("task_state_").replace("_", "-")
+
+
+def _raise_for_state(task: dict[str, Any]) -> None:
+    """Raise when a task has failed."""
+    if _state(task) in ERROR_STATES:
+        msg = f"task {_state(task)}"
+        raise LoadError(msg)
+
+
+###
+# Define Client
+###
+class A2aLoadClient:
+    """Pooled async client of an A2A server, speaking JSONRPC or HTTP+JSON."""
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        transport: Transport = "HTTP+JSON",
+        api_version: str = "/v1",
+    ) -> None:
+        """Initialize A2A Load Client."""
+        self.client = client
+        self.url = url
+        self.transport = transport
+        self.api_version = api_version
+        self._ids = count()
+
+    def _message(self, query: str, *, blocking: bool) -> dict[str, Any]:
+        """Make the parameters of a message."""
+        if self.transport == "JSONRPC":
+            message: dict[str, Any] = {
+                "messageId": str(uuid4()),
+                "role": "user",
+                "parts": [{"kind": "text", "text": query}],
+            }
+        else:
+            message = {
+                "messageId": str(uuid4()),
+                "role": "ROLE_USER",
+                "content": [{"text": query}],
+            }
+        return {"message": message, "configuration": {"blocking": blocking}}
+
+    def _rpc(self, method: str, params: dict[str, Any]) -> dict[str, Any]:
+        """Make a JSONRPC request."""
+        return {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+
+    @staticmethod
+    def _result(response: httpx.Response) -> dict[str, Any]:
+        """Get the result of a response, raising on errors."""
+        if response.is_error:
+            msg = f"http {response.status_code}"
+            raise LoadError(msg)
+        result: dict[str, Any] = loads(response.content)
+        if "error" in result:
+            msg = f"jsonrpc {result['error'].get('code')}"
+            raise LoadError(msg)
+        return result
+
+    async def send(self, query: str, *, blocking: bool = True) -> dict[str, Any]:
+        """Send a message, and get the task."""
+        if self.transport == "JSONRPC":
+            response = await self.client.post(
+                self.url,
+                json=self._rpc("message/send", self._message(query, blocking=blocking)),
+            )
+            return cast("dict[str, Any]", self._result(response).get("result", {}))
+        response = await self.client.post(
+            f"{self.url}{self.api_version}/message:send",
+            json=self._message(query, blocking=blocking),
+        )
+        result = self._result(response)
+        return cast("dict[str, Any]", result.get("task", result.get("msg", {})))
+
+    async def get_task(self, task_id: str) -> dict[str, Any]:
+        """Get a task."""
+        if self.transport == "JSONRPC":
+            response = await self.client.post(self.url, json=self._rpc("tasks/get", {"id": task_id}))
+            return cast("dict[str, Any]", self._result(response).get("result", {}))
+        return self._result(await self.client.get(f"{self.url}{self.api_version}/tasks/{task_id}"))
+
+    async def stream(self, query: str) -> tuple[float, int]:
+        """Stream a message, and get the time to the first event and the number of events."""
+        start = time.perf_counter()
+        (first_event, events) = (0.0, 0)
+        if self.transport == "JSONRPC":
+            (url, body) = (self.url, self._rpc("message/stream", self._message(query, blocking=True)))
+        else:
+            (url, body) = (f"{self.url}{self.api_version}/message:stream", self._message(query, blocking=True))
+        async with httpx_sse.aconnect_sse(self.client, "POST", url, json=body) as event_source:
+            if event_source.response.is_error:
+                msg = f"http {event_source.response.status_code}"
+                raise LoadError(msg)
+            async for sse in event_source.aiter_sse():
+                if events == 0:
+                    first_event = time.perf_counter() - start
+                events += 1
+                data = loads(sse.data)
+                if "error" in data:
+                    msg = f"jsonrpc {data['error'].get('code')}"
+                    raise LoadError(msg)
+                # JSONRPC wraps the events in the result, HTTP+JSON names them by kind
+                payload = data.get("result", data)
+                _raise_for_state(payload.get("statusUpdate") or payload.get("task") or payload)
+        if events == 0:
+            msg = "no events"
+            raise LoadError(msg)
+        return (first_event, events)
+
+    async def run(self, flow: Flow, query: str, poll_interval: float = LOAD_POLL_INTERVAL) -> LoadSample:
+        """Run a flow, and measure it."""
+        start = time.perf_counter()
+        try:
+            if flow == "stream":
+                (first_event, _) = await self.stream(query)
+                return LoadSample(latency=time.perf_counter() - start, first_event=first_event)
+
+            task = await self.send(query, blocking=flow == "send")
+            while flow == "poll" and _state(task) in ACTIVE_STATES:
+                await asyncio.sleep(poll_interval)
+                task = await self.get_task(task["id"])
+            _raise_for_state(task)
+        except (LoadError, httpx.HTTPError) as e:
+            error = str(e) if isinstance(e, LoadError) else type(e).__name__
+            return LoadSample(latency=time.perf_counter() - start, error=error)
+        return LoadSample(latency=time.perf_counter() - start)
+
+
+class A2aGrpcLoadClient(A2aLoadClient):
+    """Async client of an A2A server speaking gRPC, measured as the HTTP transports."""
+
+    def __init__(self, channel: Channel, url: str) -> None:
+        """Initialize A2A gRPC Load Client."""
+        from a2a.client.transports.grpc import GrpcTransport  # noqa: PLC0415
+
+        self.url = url
+        self.transport = "GRPC"
+        self.grpc = GrpcTransport(channel, None)
+
+    @staticmethod
+    def _params(query: str, *, blocking: bool) -> MessageSendParams:
+        """Make the parameters of a message."""
+        return MessageSendParams(
+            message=Message(message_id=str(uuid4()), role=Role.user, parts=[Part(root=TextPart(text=query))]),
+            configuration=MessageSendConfiguration(blocking=blocking),
+        )
+
+    @override
+    async def send(self, query: str, *, blocking: bool = True) -> dict[str, Any]:
+        """Send a message, and get the task."""
+        with _grpc_errors():
+            result = await self.grpc.send_message(self._params(query, blocking=blocking))
+        return result.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+    @override
+    async def get_task(self, task_id: str) -> dict[str, Any]:
+        """Get a task."""
+        with _grpc_errors():
+            task = await self.grpc.get_task(TaskQueryParams(id=task_id))
+        return task.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+    @override
+    async def stream(self, query: str) -> tuple[float, int]:
+        """Stream a message, and get the time to the first event and the number of events."""
+        start = time.perf_counter()
+        (first_event, events) = (0.0, 0)
+        with _grpc_errors():
+            async for event in self.grpc.send_message_streaming(self._params(query, blocking=True)):
+                if events == 0:
+                    first_event = time.perf_counter() - start
+                events += 1
+                _raise_for_state(event.model_dump(mode="json", by_alias=True, exclude_none=True))
+        if events == 0:
+            msg = "no events"
+            raise LoadError(msg)
+        return (first_event, events)
+
+
+@contextmanager
+def _grpc_errors() -> Iterator[None]:
+    """Raise the errors of gRPC calls as load errors, importing gRPC only when it is used."""
+    from grpc.aio import AioRpcError  # noqa: PLC0415
+
+    try:
+        yield
+    except AioRpcError as e:
+        msg = f"grpc {e.code().name.lower()}"
+        raise LoadError(msg) from e
+
+
+async def detect_transport(client: httpx.AsyncClient, url: str) -> tuple[Transport, str]:
+    """Detect the preferred transport of an A2A server and its url from its agent card."""
+    parts = urlsplit(url)
+    for card_url in [f"{url}{AGENT_CARD_ROUTE}", f"{parts.scheme}://{parts.netloc}{AGENT_CARD_ROUTE}"]:
+        response = await client.get(card_url)
+        if response.is_success:
+            card = response.json()
+            if card.get("preferredTransport") == "GRPC":
+                return ("GRPC", card["url"])
+            return ("JSONRPC" if card.get("preferredTransport") == "JSONRPC" else "HTTP+JSON", url)
+    return ("HTTP+JSON", url)
+
+
+###
+# Define Load
+###
+async def _closed_loop(
+    run: Callable[[], Awaitable[LoadSample]],
+    requests: int,
+    concurrency: int,
+) -> list[LoadSample]:
+    """Keep a fixed number of requests in flight."""
+    samples: list[LoadSample] = []
+    remaining = iter(range(requests))
+
+    async def _worker() -> None:
+        samples.extend([await run() for _ in remaining])
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(concurrency):
+            group.create_task(_worker())
+    return samples
+
+
+async def _open_loop(
+    run: Callable[[], Awaitable[LoadSample]],
+    requests: int,
+    concurrency: int,
+    rate: float,
+) -> list[LoadSample]:
+    """Start requests at a fixed rate, measuring latency from the scheduled start."""
+    samples: list[LoadSample] = []
+    slots = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def _request(scheduled: float) -> None:
+        async with slots:
+            sample = await run()
+        # Count the wait for a slot, so that a saturated server is not hidden
+        sample.latency = time.perf_counter() - scheduled
+        samples.append(sample)
+
+    async with asyncio.TaskGroup() as group:
+        for i in range(requests):
+            scheduled = start + i / rate
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            group.create_task(_request(scheduled))
+    return samples
+
+
+async def collect_a2a_load(
+    url: str,
+    *,
+    flow: Flow = "send",
+    requests: int = LOAD_REQUESTS,
+    concurrency: int = LOAD_CONCURRENCY,
+    rate: float | None = None,
+    transport: Transport | None = None,
+    query: str = LOAD_QUERY,
+    request_timeout: float = LOAD_TIMEOUT,
+) -> tuple[Transport, list[LoadSample], float]:
+    """
+    Drive an A2A server at a fixed concurrency, or at a fixed rate, and get the samples and the elapsed time.
+
+    The url of the GRPC transport is the target of the channel, e.g. localhost:50051.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with AsyncExitStack() as stack:
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(
+                headers={"Accept-Encoding": accept_encoding_header()},
+                limits=limits,
+                timeout=request_timeout,
+            ),
+        )
+        if transport is None:
+            (transport, url) = await detect_transport(client, url)
+
+        load_client: A2aLoadClient
+        if transport == "GRPC":
+            from grpc.aio import insecure_channel  # noqa: PLC0415
+
+            # Multiplex the requests on one channel over HTTP/2, as the A2A client does
+            channel = await stack.enter_async_context(insecure_channel(url))
+            load_client = A2aGrpcLoadClient(channel, url)
+        else:
+            load_client = A2aLoadClient(client, url, transport)
+
+        start = time.perf_counter()
+        if rate:
+            samples = await _open_loop(lambda: load_client.run(flow, query), requests, concurrency, rate)
+        else:
+            samples = await _closed_loop(lambda: load_client.run(flow, query), requests, concurrency)
+        return (transport, samples, time.perf_counter() - start)
+
+
+async def run_a2a_load(
+    url: str,
+    *,
+    flow: Flow = "send",
+    requests: int = LOAD_REQUESTS,
+    concurrency: int = LOAD_CONCURRENCY,
+    rate: float | None = None,
+    transport: Transport | None = None,
+    query: str = LOAD_QUERY,
+    request_timeout: float = LOAD_TIMEOUT,
+) -> dict[str, Any]:
+    """Drive an A2A server at a fixed concurrency, or at a fixed rate, and summarize the load."""
+    (transport, samples, elapsed) = await collect_a2a_load(
+        url,
+        flow=flow,
+        requests=requests,
+        concurrency=concurrency,
+        rate=rate,
+        transport=transport,
+        query=query,
+        request_timeout=request_timeout,
+    )
+
+    errors = Counter(sample.error for sample in samples if sample.error is not None)
+    result = summarize([sample.latency for sample in samples if sample.error is None], elapsed, sum(errors.values()))
+    first_events = sorted(sample.first_event for sample in samples if sample.first_event is not None)
+    return {
+        "url": url,
+        "transport": transport,
+        "flow": flow,
+        "requests": len(samples),
+        "concurrency": concurrency,
+        "rate_per_s": rate,
+        "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+        "errors_by_kind": dict(errors),
+        **result,
+        **(
+            {
+                "first_event_ms": {
+                    "p50": round(percentile(first_events, 0.50) * 1e3, 3),
+                    "p95": round(percentile(first_events, 0.95) * 1e3, 3),
+                    "p99": round(percentile(first_events, 0.99) * 1e3, 3),
+                },
+            }
+            if first_events
+            else {}
+        ),
+    }
@@ -0,0 +1,245 @@
+"""
+e2e_bench.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing
+import resource
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from importlib.util import find_spec
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from app.libs.batch import percentile, run_batch, summarize
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Awaitable, Callable
+
+    from app.agents.chatbot import Chatbot
+    from app.benchmarks.a2a_load import LoadSample, Transport
+
+E2E_SCENARIOS = (
+    "chatbot_run",
+    "chatbot_stream",
+    "a2a_send",
+    "a2a_stream",
+    "a2a_send_jsonrpc",
+    "a2a_stream_jsonrpc",
+    *(("a2a_send_grpc", "a2a_stream_grpc") if find_spec("grpc") else ()),
+)
+E2E_TRANSPORTS: dict[str, Transport] = {"jsonrpc": "JSONRPC", "grpc": "GRPC"}
+E2E_BASELINE_PATH = Path(".benchmarks") / "e2e.json"
+E2E_TOLERANCE = 0.2
+E2E_ALLOC_REQUESTS = 10
+E2E_QUERY = "How much is 1 USD in JPY?"
+E2E_REQUESTS = 50
+E2E_CONCURRENCY = 8
+E2E_LLM_LATENCY = 0.05
+E2E_TOKEN_RATE = 200.0
+E2E_TOOL_LATENCY = 0.01
+# Metrics which regress when they increase, or when they decrease
+HIGHER_IS_WORSE = ("p50_ms", "p99_ms", "ttft_p50_ms", "ttft_p99_ms", "alloc_peak_kb", "peak_rss_kb")
+LOWER_IS_WORSE = ("throughput_per_s",)
+
+
+@dataclass(frozen=True, slots=True)
+class E2eConfig:
+    """Load and fake backends of the benchmark."""
+
+    requests: int = E2E_REQUESTS
+    concurrency: int = E2E_CONCURRENCY
+    llm_latency: float = E2E_LLM_LATENCY
+    token_rate: float = E2E_TOKEN_RATE
+    tool_latency: float = E2E_TOOL_LATENCY
+
+
+type Sample = tuple[float, float | None]
+
+
+###
+# Define Scenarios
+###
+async def _indexed(count: int) -> AsyncIterator[tuple[int, int]]:
+    for i in range(count):
+        yield (i, i)
+
+
+async def _drive(run: Callable[[], Awaitable[Sample]], requests: int, concurrency: int) -> tuple[list[Sample], int]:
+    """Drive a scenario at a fixed concurrency, and get its samples and errors."""
+    (samples, errors) = ([], 0)
+
+    async def _request(_: int) -> Sample:
+        return await run()
+
+    async for item in run_batch(_indexed(requests), _request, concurrency):
+        if item.error is not None or item.result is None:
+            errors += 1
+        else:
+            samples.append(item.result)
+    return (samples, errors)
+
+
+async def _run_scenario(scenario: str, config: E2eConfig, requests: int) -> tuple[list[Sample], int, float]:
+    """Run a scenario in-process against the fake model and the stub tool backend."""
+    from app.agents.chatbot import Chatbot  # noqa: PLC0415
+    from app.benchmarks.fakes import FrankfurterStub, ScriptedChatModel  # noqa: PLC0415
+    from app.tools.currency_rate import tools  # noqa: PLC0415
+
+    model = ScriptedChatModel(latency=config.llm_latency, token_rate=config.token_rate)
+    chatbot = Chatbot(model=model, tools=tools)
+
+    async def _chatbot_run() -> Sample:
+        start = time.perf_counter()
+        await chatbot.async_run(E2E_QUERY)
+        return (time.perf_counter() - start, None)
+
+    async def _chatbot_stream() -> Sample:
+        start = time.perf_counter()
+        first: float | None = None
+        async for _ in chatbot.astream_run(E2E_QUERY):
+            first = first if first is not None else time.perf_counter() - start
+        return (time.perf_counter() - start, first)
+
+    with FrankfurterStub(latency=config.tool_latency).serve():
+        start = time.perf_counter()
+        if scenario == "chatbot_run":
+            (samples, errors) = await _drive(_chatbot_run, requests, config.concurrency)
+        elif scenario == "chatbot_stream":
+            (samples, errors) = await _drive(_chatbot_stream, requests, config.concurrency)
+        else:
+            (load, elapsed) = await _run_a2a_scenario(scenario, chatbot, config, requests)
+            samples = [(sample.latency, sample.first_event) for sample in load if sample.error is None]
+            errors = len(load) - len(samples)
+            return (samples, errors, elapsed)
+        elapsed = time.perf_counter() - start
+    return (samples, errors, elapsed)
+
+
+async def _run_a2a_scenario(
+    scenario: str,
+    chatbot: Chatbot,
+    config: E2eConfig,
+    requests: int,
+) -> tuple[list[LoadSample], float]:
+    """Run an A2A scenario over the transport named by its suffix, HTTP+JSON by default."""
+    from app.a2a_agents.a2a_chatbot import A2aChatbot  # noqa: PLC0415
+    from app.benchmarks.a2a_load import collect_a2a_load  # noqa: PLC0415
+    from app.benchmarks.fakes import free_port, serve_app  # noqa: PLC0415
+
+    (_, flow, *suffix) = scenario.split("_")
+    transport = E2E_TRANSPORTS.get(suffix[0], "HTTP+JSON") if suffix else "HTTP+JSON"
+    a2a_chatbot = A2aChatbot(
+        mode=transport,
+        streaming=flow == "stream",
+        metrics=False,
+        grpc_port=free_port(),
+    )
+    a2a_chatbot.agent_executor.agent = chatbot
+    with serve_app(a2a_chatbot.build()) as url:
+        grpc_server = None
+        if transport == "GRPC":
+            from app.a2a_agents.a2a_grpc import start_grpc_server  # noqa: PLC0415
+
+            grpc_server = await start_grpc_server(
+                a2a_chatbot.agent_card,
+                a2a_chatbot.request_handler,
+                "localhost",
+                a2a_chatbot.grpc_port,
+            )
+        try:
+            (_, load, elapsed) = await collect_a2a_load(
+                a2a_chatbot.url if transport == "GRPC" else f"{url}/a2a/chatbot",
+                flow="stream" if flow == "stream" else "send",
+                requests=requests,
+                concurrency=config.concurrency,
+                transport=transport,
+                query=E2E_QUERY,
+            )
+        finally:
+            if grpc_server is not None:
+                await grpc_server.stop(None)
+    return (load, elapsed)
+
+
+def run_scenario(scenario: str, config: E2eConfig) -> dict[str, Any]:
+    """Measure a scenario, meant to run in a fresh process for its peak RSS."""
+    from app.libs.logger import setup_logger  # noqa: PLC0415
+
+    setup_logger(background=False)
+    (samples, errors, elapsed) = asyncio.run(_run_scenario(scenario, config, config.requests))
+
+    # Measure allocations on a shorter run, since tracing them slows every call
+    tracemalloc.start()
+    asyncio.run(_run_scenario(scenario, config, min(config.requests, E2E_ALLOC_REQUESTS)))
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = summarize([latency for latency, _ in samples], elapsed, errors)
+    first = sorted(ttft for _, ttft in samples if ttft is not None)
+    return {
+        "requests": config.requests,
+        "errors": errors,
+        "throughput_per_s": summary["throughput_per_s"],
+        "p50_ms": summary["latency_ms"]["p50"],
+        "p99_ms": summary["latency_ms"]["p99"],
+        "ttft_p50_ms": round(percentile(first, 0.50) * 1e3, 3) if first else None,
+        "ttft_p99_ms": round(percentile(first, 0.99) * 1e3, 3) if first else None,
+        "alloc_peak_kb": round(peak / 1024, 1),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+###
+# Define Harness
+###
+def run_e2e_benchmark(
+    config: E2eConfig | None = None,
+    scenarios: tuple[str, ...] = E2E_SCENARIOS,
+) -> dict[str, Any]:
+    """Run every scenario in a fresh process."""
+    config = config or E2eConfig()
+    context = multiprocessing.get_context("spawn")
+    results: dict[str, Any] = {"config": asdict(config), "scenarios": {}}
+    for scenario in scenarios:
+        with context.Pool(1) as pool:
+            results["scenarios"][scenario] = pool.apply(run_scenario, (scenario, config))
+    return results
+
+
+def save_baseline(results: dict[str, Any], path: str | Path = E2E_BASELINE_PATH) -> None:
+    """Save the results as the baseline."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(results, indent=2) + "\n")
+
+
+def compare_baseline(
+    results: dict[str, Any],
+    path: str | Path = E2E_BASELINE_PATH,
+    tolerance: float = E2E_TOLERANCE,
+) -> dict[str, dict[str, Any]]:
+    """Compare the results with the baseline, and get the metrics regressed beyond the tolerance."""
+    baseline = json.loads(Path(path).read_text())
+    if baseline.get("config") != results.get("config"):
+        msg = f"Baseline taken with another config: {baseline.get('config')}"
+        raise ValueError(msg)
+
+    regressions: dict[str, dict[str, Any]] = {}
+    for scenario, metrics in results["scenarios"].items():
+        before = baseline["scenarios"].get(scenario, {})
+        for name, value in metrics.items():
+            if value is None or not before.get(name):
+                continue
+            ratio = value / before[name]
+            if (name in HIGHER_IS_WORSE and ratio > 1 + tolerance) or (
+                name in LOWER_IS_WORSE and ratio < 1 - tolerance
+            ):
+                regressions.setdefault(scenario, {})[name] = {"baseline": before[name], "current": value}
+    return regressions
@@ -0,0 +1,71 @@
+"""
+executor_bench.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from app.libs.executors import ExecutorKind
+
+EXECUTOR_BENCH_RUNS = 32
+EXECUTOR_BENCH_MODES = ("default", "thread", "process")
+EXECUTOR_BENCH_LAG_INTERVAL = 0.005
+
+
+async def _run_mode(mode: str, runs: int) -> dict[str, float]:
+    """Run the chatbot calling a CPU-bound tool concurrently, measuring the lag of the event loop."""
+    from app.agents.chatbot import Chatbot  # noqa: PLC0415
+    from app.agents.tool_executors import ToolExecutors  # noqa: PLC0415
+    from app.benchmarks.fakes import FAKE_ANSWER, FAKE_CPU_TOOL_CALL, ScriptedChatModel, hash_rounds  # noqa: PLC0415
+    from app.libs.executors import LoopLagMonitor  # noqa: PLC0415
+
+    # The default mode leaves the tool to LangChain, which runs a sync tool on the default thread pool
+    kind: ExecutorKind = "thread" if mode == "thread" else "process"
+    executors = ToolExecutors(cpu_kind=kind) if mode != "default" else None
+    chatbot = Chatbot(
+        model=ScriptedChatModel(script=[FAKE_CPU_TOOL_CALL, FAKE_ANSWER], latency=0.0, token_rate=float("inf")),
+        tools=[hash_rounds],
+        executors=executors,
+    )
+    try:
+        # Started before measuring, e.g. the workers of a process pool
+        await chatbot.async_run(FAKE_ANSWER)
+        monitor = LoopLagMonitor(EXECUTOR_BENCH_LAG_INTERVAL)
+        lags: list[float] = []
+
+        async def _sample() -> None:
+            while True:
+                await asyncio.sleep(EXECUTOR_BENCH_LAG_INTERVAL)
+                lags.append(monitor.lag)
+
+        monitoring = [asyncio.create_task(monitor.run()), asyncio.create_task(_sample())]
+        start = time.perf_counter()
+        await asyncio.gather(*(chatbot.async_run(FAKE_ANSWER) for _ in range(runs)))
+        elapsed = time.perf_counter() - start
+        for task in monitoring:
+            task.cancel()
+    finally:
+        if executors is not None:
+            executors.shutdown()
+
+    lags.sort()
+    return {
+        "runs_per_s": round(runs / elapsed, 2),
+        "loop_lag_p50_ms": round(lags[len(lags) // 2] * 1e3, 2) if lags else 0.0,
+        "loop_lag_max_ms": round(monitor.max_lag * 1e3, 2),
+    }
+
+
+def run_executor_benchmark(
+    runs: int = EXECUTOR_BENCH_RUNS,
+    modes: tuple[str, ...] = EXECUTOR_BENCH_MODES,
+) -> dict[str, Any]:
+    """Compare the pools running a CPU-bound tool by the throughput and the lag of the event loop."""
+    return {mode: asyncio.run(_run_mode(mode, runs)) for mode in modes}
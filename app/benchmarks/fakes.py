@@ -0,0 +1,253 @@
+"""
+fakes.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, cast, override
+from uuid import uuid4
+
+import uvicorn
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.agents.tool_executors import cpu_bound
+from app.tools.currency_rate import FRANKFURTER_API_URL_ENV
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator, Sequence
+
+    from langchain_core.callbacks import CallbackManagerForLLMRun
+    from langchain_core.language_models import LanguageModelInput
+    from langchain_core.messages import BaseMessage
+    from langchain_core.runnables import Runnable
+    from langchain_core.tools import BaseTool
+    from starlette.requests import Request
+
+FAKE_MODEL_NAME = "gemini-2.5-flash"
+FAKE_ANSWER = "1 USD is 150.0 JPY as of the latest exchange rate published by the European Central Bank."
+FAKE_TOOL_CALL: dict[str, Any] = {
+    "name": "get_exchange_rate",
+    "args": {"currency_from": "USD", "currency_to": "JPY", "currency_date": "latest"},
+}
+FAKE_RATE = 150.0
+FAKE_CPU_TOOL_CALL: dict[str, Any] = {
+    "name": "hash_rounds",
+    "args": {"text": "How much is 1 USD in JPY?", "rounds": 100_000},
+}
+
+
+###
+# Define Fake Chat Model
+###
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic chat model following a script of tool calls and answers.
+
+    The step of the script is the number of model turns since the last human message,
+    so that concurrent conversations do not interfere.
+    The model waits `latency` seconds for the first token, then emits `token_rate` tokens per second.
+    """
+
+    script: list[dict[str, Any] | str] = [FAKE_TOOL_CALL, FAKE_ANSWER]  # noqa: RUF012
+    latency: float = 0.05
+    token_rate: float = 200.0
+    model_name: str = FAKE_MODEL_NAME
+
+    @property
+    @override
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @override
+    def bind_tools(
+        self,
+        tools: Sequence[dict[str, Any] | type | Callable[..., Any] | BaseTool],
+        *,
+        tool_choice: str | None = None,
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, AIMessage]:
+        # The script decides the tool calls
+        return cast("Runnable[LanguageModelInput, AIMessage]", self)
+
+    def _step(self, messages: list[BaseMessage]) -> dict[str, Any] | str:
+        """Get the step of the script answering the messages."""
+        turns = 0
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, AIMessage):
+                turns += 1
+        return self.script[min(turns, len(self.script) - 1)]
+
+    def _tokens(self, step: dict[str, Any] | str) -> list[str]:
+        """Split the step into tokens."""
+        if isinstance(step, str):
+            return [f"{word} " for word in step.split()]
+        return [json.dumps(step["args"])]
+
+    def _usage(self, messages: list[BaseMessage], tokens: list[str]) -> dict[str, int]:
+        """Make the usage metadata, counting words as tokens."""
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": len(tokens),
+            "total_tokens": input_tokens + len(tokens),
+        }
+
+    @override
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        step = self._step(messages)
+        tokens = self._tokens(step)
+        time.sleep(self.latency + len(tokens) / self.token_rate)
+        message = AIMessage(
+            content="".join(tokens).strip() if isinstance(step, str) else "",
+            tool_calls=[] if isinstance(step, str) else [{**step, "id": str(uuid4())}],
+            usage_metadata=self._usage(messages, tokens),
+            response_metadata={"model_name": self.model_name},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    @override
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        step = self._step(messages)
+        tokens = self._tokens(step)
+        time.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / self.token_rate)
+            last = i == len(tokens) - 1
+            if isinstance(step, str):
+                chunk = AIMessageChunk(content=token.strip() if last else token)
+            else:
+                chunk = AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[{"name": step["name"], "args": token, "id": str(uuid4()), "index": 0}],
+                )
+            if last:
+                chunk.usage_metadata = self._usage(messages, tokens)  # type: ignore[assignment]
+                chunk.response_metadata = {"model_name": self.model_name}
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+###
+# Define Fake Tools
+###
+@cpu_bound
+@tool
+def hash_rounds(text: str, rounds: int) -> str:
+    """
+    Hash a text repeatedly, a CPU-bound stand-in of a tool holding the GIL.
+
+    Args:
+        text: The text to hash.
+        rounds: The number of times to hash.
+
+    Returns:
+        str: The last digest in hex.
+    """
+    digest = text.encode()
+    for _ in range(rounds):
+        digest = hashlib.sha256(digest).digest()
+    return digest.hex()
+
+
+###
+# Define Stub Servers
+###
+class FrankfurterStub:
+    """Local stand-in of the Frankfurter API serving a fixed exchange rate."""
+
+    def __init__(self, latency: float = 0.01, rate: float = FAKE_RATE) -> None:
+        """Initialize Frankfurter Stub."""
+        self.latency = latency
+        self.rate = rate
+        self.requests = 0
+        self.app = Starlette(routes=[Route("/{date}", self._rates, methods=["GET"])])
+
+    async def _rates(self, request: Request) -> JSONResponse:
+        """Serve an exchange rate."""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        currency_from = request.query_params.get("from", "EUR")
+        currency_to = request.query_params.get("to", "USD")
+        return JSONResponse(
+            {
+                "amount": 1.0,
+                "base": currency_from,
+                "date": "2025-01-02" if request.path_params["date"] == "latest" else request.path_params["date"],
+                "rates": {currency_to: self.rate},
+            },
+        )
+
+    @contextmanager
+    def serve(self) -> Iterator[str]:
+        """Serve the stub, pointing the currency rate tool to it."""
+        with serve_app(self.app) as url:
+            previous = os.environ.get(FRANKFURTER_API_URL_ENV)
+            os.environ[FRANKFURTER_API_URL_ENV] = url
+            try:
+                yield url
+            finally:
+                if previous is None:
+                    os.environ.pop(FRANKFURTER_API_URL_ENV, None)
+                else:
+                    os.environ[FRANKFURTER_API_URL_ENV] = previous
+
+
+def free_port(host: str = "localhost") -> int:
+    """Get a free port of the host."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return int(sock.getsockname()[1])
+
+
+@contextmanager
+def serve_app(app: Any, host: str = "localhost") -> Iterator[str]:  # noqa: ANN401
+    """Serve an ASGI application on a free port in a background thread."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app=app, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started and thread.is_alive():
+        time.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
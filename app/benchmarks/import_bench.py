@@ -0,0 +1,90 @@
+"""
+import_bench.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+IMPORT_BENCH_REPEATS = 5
+IMPORT_BENCH_TOP = 5
+IMPORT_BENCH_MODULES = ("cli.query", "cli.run_a2a_server", "cli.a2a_query")
+# Dependencies which the entry points must load only on the code path needing them
+IMPORT_BENCH_HEAVY_MODULES = (
+    "langchain_google_genai",
+    "langchain_mcp_adapters",
+    "a2a.client",
+    "a2a.server",
+    "uvicorn",
+    "httpx_sse",
+    "numpy",
+)
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _parse_importtime(stderr: str) -> list[tuple[int, str, int]]:
+    """Parse the nesting depth, the name and the cumulative time in us of the imports of `-X importtime`."""
+    imports: list[tuple[int, str, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:  # noqa: PLR2004
+            continue
+        (_, total, name) = line.removeprefix("import time:").split("|")
+        if not total.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(total)))
+    return imports
+
+
+def measure_import(module: str) -> dict[str, Any]:
+    """Import a module in a fresh interpreter."""
+    code = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([name for name in {IMPORT_BENCH_HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = (time.perf_counter() - start) * 1e3
+    imports = _parse_importtime(result.stderr)
+    return {
+        "wall_ms": wall,
+        "import_ms": sum(total for depth, name, total in imports if depth == 0 and name == module) / 1e3,
+        "dependencies_ms": {name: total / 1e3 for depth, name, total in imports if depth == 1},
+        "heavy_modules": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def run_import_benchmark(
+    repeats: int = IMPORT_BENCH_REPEATS,
+    modules: tuple[str, ...] = IMPORT_BENCH_MODULES,
+) -> dict[str, dict[str, Any]]:
+    """Measure the import time of the entry points, and the heavy dependencies they load eagerly."""
+    results: dict[str, dict[str, Any]] = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeats)]
+        dependencies = runs[-1]["dependencies_ms"]
+        results[module] = {
+            "wall_ms": statistics.median(run["wall_ms"] for run in runs),
+            "import_ms": statistics.median(run["import_ms"] for run in runs),
+            "heaviest_ms": {
+                name: dependencies[name]
+                for name in sorted(dependencies, key=dependencies.__getitem__, reverse=True)[:IMPORT_BENCH_TOP]
+            },
+            "heavy_modules": runs[-1]["heavy_modules"],
+        }
+    return results
@@ -0,0 +1,151 @@
+"""
+logger_bench.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, cast
+
+from loguru import logger
+
+from app.libs.logger import TEXT_FORMAT, InterceptHandler, QueueSink, debug_sampler, json_format
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from types import FrameType
+
+    from app.libs.logger import Stream
+
+BENCH_ITERATIONS = 20000
+BENCH_LOGGER = "app.benchmarks.stdlib"
+BENCH_STALL_EVERY = 64
+BENCH_STALL = 0.001
+BENCH_SAMPLE_RATE = 0.1
+
+
+class StallingStream:
+    """Stream stalling periodically like stdout piped to a busy log collector."""
+
+    def __init__(self, stream: Stream, stall_every: int = BENCH_STALL_EVERY, stall: float = BENCH_STALL) -> None:
+        """Initialize the stream."""
+        self.stream = stream
+        self.stall_every = stall_every
+        self.stall = stall
+        self.writes = 0
+
+    def write(self, message: str) -> None:
+        """Write a message."""
+        self.writes += 1
+        if self.writes % self.stall_every == 0:
+            time.sleep(self.stall)
+        self.stream.write(message)
+
+    def flush(self) -> None:
+        """Flush the stream."""
+        self.stream.flush()
+
+
+class LegacyInterceptHandler(logging.Handler):
+    """Intercept handler walking the stack frames, as before the logging rework."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Emit a record."""
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = str(record.levelno)
+
+        frame, depth = logging.currentframe(), 1
+        while frame.f_code.co_filename in (logging.__file__, __file__):
+            frame = cast("FrameType", frame.f_back)
+            depth += 1
+        logger.opt(depth=depth, exception=record.exc_info).log(level, "{}", record.getMessage())
+
+
+def measure(func: Callable[[int], None], iterations: int) -> float:
+    """Measure the mean time of a call in microseconds."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run_logger_benchmark(iterations: int = BENCH_ITERATIONS) -> dict[str, dict[str, float]]:
+    """Compare the legacy logging setup with the current one."""
+    task: dict[str, Any] = {
+        "id": "task",
+        "artifacts": [{"name": "answer", "parts": [{"text": "x" * 64}]} for _ in range(32)],
+    }
+    stdlib_logger = logging.getLogger(BENCH_LOGGER)
+    stdlib_logger.setLevel(logging.INFO)
+    stdlib_logger.propagate = False
+    results: dict[str, dict[str, float]] = {}
+
+    with open(os.devnull, "w", encoding="utf-8") as sink:  # noqa: PTH123
+        # Disabled debug records, eager f-string vs lazy arguments
+        logger.remove()
+        logger.add(sink, format=TEXT_FORMAT, level="INFO")
+        results["disabled_debug"] = {
+            "legacy_us": measure(lambda i: logger.debug(f"res, task: {i}, artifacts: {task['artifacts']}"), iterations),
+            "current_us": measure(
+                lambda i: logger.debug("res, task: {}, artifacts: {}", i, task["artifacts"]),
+                iterations,
+            ),
+        }
+
+        # Enabled debug records, every record vs sampled records
+        logger.remove()
+        logger.add(sink, format=TEXT_FORMAT, level="DEBUG")
+        legacy = measure(lambda i: logger.debug("res, task: {}, state: {}", i, "working"), iterations)
+        logger.remove()
+        logger.add(sink, format=TEXT_FORMAT, level="DEBUG", filter=debug_sampler(BENCH_SAMPLE_RATE))
+        current = measure(lambda i: logger.debug("res, task: {}, state: {}", i, "working"), iterations)
+        results["sampled_debug"] = {
+            "legacy_us": legacy,
+            "current_us": current,
+        }
+
+        # Enabled records, blocking sink vs background sink
+        logger.remove()
+        logger.add(StallingStream(sink), format=TEXT_FORMAT, level="INFO")
+        legacy = measure(lambda i: logger.info("res, task: {}, state: {}", i, "working"), iterations)
+        logger.remove()
+        logger.add(QueueSink(StallingStream(sink)), format=TEXT_FORMAT, level="INFO")
+        start = time.perf_counter()
+        current = measure(lambda i: logger.info("res, task: {}, state: {}", i, "working"), iterations)
+        logger.remove()
+        results["enabled_info"] = {
+            "legacy_us": legacy,
+            "current_us": current,
+            "current_drained_us": (time.perf_counter() - start) / iterations * 1e6,
+        }
+
+        # JSON records with bound ids
+        logger.remove()
+        logger.add(sink, format=json_format, level="INFO", colorize=False)
+        with logger.contextualize(task_id="task", context_id="context"):
+            results["json_info"] = {
+                "current_us": measure(lambda i: logger.info("res, task: {}, state: {}", i, "working"), iterations),
+            }
+
+        # Intercepted stdlib records, stack walk vs record patch
+        logger.remove()
+        logger.add(sink, format=TEXT_FORMAT, level="INFO")
+        stdlib_logger.handlers = [LegacyInterceptHandler()]
+        legacy = measure(lambda i: stdlib_logger.info("request %d", i), iterations)
+        stdlib_logger.handlers = [InterceptHandler()]
+        current = measure(lambda i: stdlib_logger.info("request %d", i), iterations)
+        results["stdlib_info"] = {
+            "legacy_us": legacy,
+            "current_us": current,
+        }
+
+    stdlib_logger.handlers = []
+    logger.remove()
+    return results
@@ -0,0 +1,74 @@
+"""
+rag_bench.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import tempfile
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from app.libs.vector_index import VectorIndex
+
+RAG_BENCH_ROWS = (100_000, 1_000_000)
+RAG_BENCH_DIM = 256
+RAG_BENCH_QUERIES = 50
+RAG_BENCH_TOP_K = 10
+RAG_BENCH_BATCH_ROWS = 50_000
+RAG_BENCH_CLUSTERS = 1024
+
+
+def _search(index: VectorIndex, queries: Any, k: int) -> tuple[float, list[set[int]]]:  # noqa: ANN401
+    """Measure the mean search time in milliseconds, and get the rows found."""
+    start = time.perf_counter()
+    found = [{row for (row, _) in index.search(query, k)} for query in queries]
+    return ((time.perf_counter() - start) / len(queries) * 1e3, found)
+
+
+def run_rag_benchmark(
+    rows: tuple[int, ...] = RAG_BENCH_ROWS,
+    queries: int = RAG_BENCH_QUERIES,
+    dim: int = RAG_BENCH_DIM,
+) -> dict[str, dict[str, float]]:
+    """Compare the exhaustive and the partitioned search of the vector index over clustered synthetic vectors."""
+    import numpy as np  # noqa: PLC0415
+
+    from app.libs.vector_index import VectorIndex  # noqa: PLC0415
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(RAG_BENCH_CLUSTERS, dim)).astype(np.float32)
+    results: dict[str, dict[str, float]] = {}
+    for count in rows:
+        with tempfile.TemporaryDirectory() as path:
+            index = VectorIndex(path)
+            start = time.perf_counter()
+            for batch in range(0, count, RAG_BENCH_BATCH_ROWS):
+                size = min(RAG_BENCH_BATCH_ROWS, count - batch)
+                vectors = centers[rng.integers(0, RAG_BENCH_CLUSTERS, size)] + rng.normal(size=(size, dim))
+                index.add(vectors, [{"id": str(row)} for row in range(batch, batch + size)])
+            ingest_s = time.perf_counter() - start
+
+            samples = rng.integers(0, count, queries)
+            query_vectors = np.asarray(index._vectors_map()[samples]) + 0.1 * rng.normal(size=(queries, dim))  # noqa: SLF001
+            (exact_ms, exact) = _search(index, query_vectors, RAG_BENCH_TOP_K)
+            start = time.perf_counter()
+            index.partition()
+            partition_s = time.perf_counter() - start
+            (ivf_ms, found) = _search(index, query_vectors, RAG_BENCH_TOP_K)
+
+            results[f"rows_{count}"] = {
+                "ingest_rows_per_s": round(count / ingest_s),
+                "index_mb": round(count * dim * 4 / 2**20, 1),
+                "exact_search_ms": round(exact_ms, 3),
+                "partition_s": round(partition_s, 3),
+                "ivf_search_ms": round(ivf_ms, 3),
+                "ivf_recall_at_10": round(
+                    sum(len(a & b) for a, b in zip(exact, found, strict=True)) / (RAG_BENCH_TOP_K * queries),
+                    3,
+                ),
+            }
+    return results
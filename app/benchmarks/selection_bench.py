@@ -0,0 +1,82 @@
+"""
+selection_bench.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, cast
+
+if TYPE_CHECKING:
+    from langchain_core.tools import BaseTool
+
+    from app.tools.a2a_client import A2aServer
+
+SELECTION_BENCH_ROUNDS = 5
+SELECTION_BENCH_LATENCIES: dict[str, float] = {"slow": 0.2, "medium": 0.05, "fast": 0.01}
+SELECTION_BENCH_FANOUT = 2
+
+
+class _FakeA2aServer:
+    """Stand-in of an A2A server answering after a fixed latency."""
+
+    def __init__(self, name: str, latency: float) -> None:
+        """Initialize Fake A2A Server."""
+        from app.tools.a2a_task_store import InMemoryTaskIdStore  # noqa: PLC0415
+
+        self.name = name
+        self.latency = latency
+        self.task_id_store = InMemoryTaskIdStore()
+
+    async def get_tools(self) -> list[BaseTool]:
+        """Get the tool answering after the latency."""
+        from langchain_core.messages.content import create_text_block  # noqa: PLC0415
+        from langchain_core.tools import StructuredTool  # noqa: PLC0415
+
+        from app.tools.a2a_client import RequestMessage  # noqa: PLC0415
+
+        async def send_message(text: str) -> list[Any]:
+            await asyncio.sleep(self.latency)
+            return [create_text_block(text=f"{self.name}: {text}")]
+
+        return [
+            StructuredTool(
+                name=self.name,
+                description="Answer after a fixed latency.",
+                args_schema=RequestMessage,
+                coroutine=send_message,
+            ),
+        ]
+
+    async def close(self) -> None:
+        """Release nothing."""
+
+
+async def _run(rounds: int, latencies: dict[str, float], fanout: int) -> dict[str, Any]:
+    """Race the fake agents in rounds, recording the agent selected first before each round."""
+    from app.tools.a2a_multi_client import A2aServerGroup  # noqa: PLC0415
+
+    servers = cast("list[A2aServer]", [_FakeA2aServer(name, latency) for (name, latency) in latencies.items()])
+    async with A2aServerGroup("selection_bench", servers, strategy="first", fanout=fanout) as group:
+        (tool,) = await group.get_tools()
+        selected: list[str] = []
+        for i in range(rounds):
+            selected.append(group.select(1)[0].name)
+            await tool.ainvoke({"text": f"round {i}"}, config={"configurable": {"thread_id": f"selection-{i}"}})
+        return {
+            "selected": selected,
+            "final": group.select(1)[0].name,
+            "latency_ms": {name: round(stats.latency * 1e3, 2) for (name, stats) in group.stats.items()},
+        }
+
+
+def run_selection_benchmark(
+    rounds: int = SELECTION_BENCH_ROUNDS,
+    latencies: dict[str, float] = SELECTION_BENCH_LATENCIES,
+    fanout: int = SELECTION_BENCH_FANOUT,
+) -> dict[str, Any]:
+    """Check that the `first` strategy of an A2A server group learns to select the fastest agent."""
+    return asyncio.run(_run(rounds, latencies, fanout))
@@ -0,0 +1,106 @@
+"""
+state_bench.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from langchain_core.messages import BaseMessage
+
+STATE_BENCH_LENGTHS = (1000, 5000)
+STATE_BENCH_TURNS = 10
+STATE_BENCH_THREAD_ID = "state-bench"
+
+
+def _history(length: int) -> list[BaseMessage]:
+    """Make a history of questions and answers."""
+    from langchain_core.messages import AIMessage, HumanMessage  # noqa: PLC0415
+
+    from app.benchmarks.fakes import FAKE_ANSWER  # noqa: PLC0415
+
+    messages: list[BaseMessage] = []
+    for i in range(length // 2):
+        messages.append(HumanMessage(content=f"How much is {i} USD in JPY?"))
+        messages.append(AIMessage(content=f"{i} USD is {i * 150.0} JPY. {FAKE_ANSWER}"))
+    return messages
+
+
+def _measure_ms(func: Callable[[int], None], iterations: int) -> float:
+    """Measure the mean time of a call in milliseconds."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e3
+
+
+def _measure_update(messages: Any, iterations: int, *, message_log: bool) -> float:  # noqa: ANN401
+    """Measure adding a message to the state."""
+    from langchain_core.messages import AIMessage  # noqa: PLC0415
+    from langgraph.graph.message import add_messages  # noqa: PLC0415
+
+    from app.agents.message_log import append_messages  # noqa: PLC0415
+
+    reducer = append_messages if message_log else add_messages
+
+    def _update(i: int) -> None:
+        nonlocal messages
+        update: list[Any] = [AIMessage(content=f"answer {i}")]
+        messages = reducer(messages, update)
+
+    return _measure_ms(_update, iterations)
+
+
+def _measure_checkpoint(messages: Any, iterations: int) -> float:  # noqa: ANN401
+    """Measure saving and loading the messages in a checkpoint."""
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer  # noqa: PLC0415
+
+    serde = JsonPlusSerializer()
+    return _measure_ms(lambda _: serde.loads_typed(serde.dumps_typed(messages)), iterations)
+
+
+async def _measure_turn(history: list[BaseMessage], turns: int, *, message_log: bool) -> float:
+    """Measure a turn of the chatbot on a thread holding the history."""
+    from app.agents.chatbot import Chatbot  # noqa: PLC0415
+    from app.benchmarks.fakes import FAKE_ANSWER, ScriptedChatModel  # noqa: PLC0415
+
+    chatbot = Chatbot(
+        model=ScriptedChatModel(script=[FAKE_ANSWER], latency=0.0, token_rate=float("inf")),
+        message_log=message_log,
+    )
+    config: Any = {"configurable": {"thread_id": STATE_BENCH_THREAD_ID}}
+    chatbot.graph.update_state(config, {"messages": history}, as_node=Chatbot.NODE_LLM)
+    start = time.perf_counter()
+    for _ in range(turns):
+        await chatbot.async_run("How much is 1 USD in JPY?", thread_id=STATE_BENCH_THREAD_ID)
+    return (time.perf_counter() - start) / turns * 1e3
+
+
+def run_state_benchmark(
+    lengths: tuple[int, ...] = STATE_BENCH_LENGTHS,
+    turns: int = STATE_BENCH_TURNS,
+) -> dict[str, dict[str, float]]:
+    """Compare the messages merged by `add_messages` with the append-only message log on long threads."""
+    from app.agents.message_log import MessageLog  # noqa: PLC0415
+
+    results: dict[str, dict[str, float]] = {}
+    for length in lengths:
+        history = _history(length)
+        log = MessageLog.of(history)
+        results[f"messages_{length}"] = {
+            "list_update_ms": _measure_update(list(history), turns, message_log=False),
+            "log_update_ms": _measure_update(log, turns, message_log=True),
+            "list_checkpoint_ms": _measure_checkpoint(history, turns),
+            "log_checkpoint_ms": _measure_checkpoint(log, turns),
+            "list_turn_ms": asyncio.run(_measure_turn(history, turns, message_log=False)),
+            "log_turn_ms": asyncio.run(_measure_turn(history, turns, message_log=True)),
+        }
+    return results
@@ -0,0 +1,134 @@
+"""
+batch.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import os
+    from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+
+BATCH_CONCURRENCY = 8
+
+
+###
+# Define Results
+###
+@dataclass(slots=True)
+class BatchResult[T, R]:
+    """Result of an item of a batch."""
+
+    index: int
+    item: T
+    result: R | None
+    error: BaseException | None
+    latency: float
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    """Get a percentile of sorted values by the nearest rank."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(ratio * len(values)) - 1))]
+
+
+def summarize(latencies: Iterable[float], elapsed: float, errors: int = 0) -> dict[str, Any]:
+    """Summarize the throughput and the latency in ms of a batch."""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(values) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values) * 1e3, 3) if values else 0.0,
+            "p50": round(percentile(values, 0.50) * 1e3, 3),
+            "p95": round(percentile(values, 0.95) * 1e3, 3),
+            "p99": round(percentile(values, 0.99) * 1e3, 3),
+            "max": round(values[-1] * 1e3, 3) if values else 0.0,
+        },
+    }
+
+
+###
+# Define Offset
+###
+class BatchOffset:
+    """Offset of a batch below which every item is done, persisted to resume after a crash."""
+
+    def __init__(self, path: str | os.PathLike[str] | None = None) -> None:
+        """Initialize Batch Offset."""
+        self.path = Path(path) if path is not None else None
+        self.offset = int(self.path.read_text().strip() or 0) if self.path and self.path.exists() else 0
+        self._done: set[int] = set()
+
+    def done(self, index: int) -> None:
+        """Mark an item done, and persist the offset when it advances."""
+        self._done.add(index)
+        offset = self.offset
+        while offset in self._done:
+            self._done.remove(offset)
+            offset += 1
+        if offset != self.offset:
+            self.offset = offset
+            self._save()
+
+    def _save(self) -> None:
+        """Save the offset atomically."""
+        if self.path is None:
+            return
+        temp = self.path.with_name(f"{self.path.name}.tmp")
+        temp.write_text(f"{self.offset}\n")
+        temp.replace(self.path)
+
+
+###
+# Define Runner
+###
+async def run_batch[T, R](
+    items: AsyncIterable[tuple[int, T]],
+    handler: Callable[[T], Awaitable[R]],
+    concurrency: int = BATCH_CONCURRENCY,
+) -> AsyncIterator[BatchResult[T, R]]:
+    """Run the handler on indexed items with bounded concurrency, yielding results in completion order."""
+    pending: asyncio.Queue[tuple[int, T] | None] = asyncio.Queue(maxsize=concurrency * 2)
+    results: asyncio.Queue[BatchResult[T, R] | None] = asyncio.Queue()
+
+    async def _produce() -> None:
+        async for indexed in items:
+            await pending.put(indexed)
+        for _ in range(concurrency):
+            await pending.put(None)
+
+    async def _work() -> None:
+        while (indexed := await pending.get()) is not None:
+            (index, item) = indexed
+            start = time.perf_counter()
+            try:
+                result = await handler(item)
+            except Exception as e:
+                await results.put(BatchResult(index, item, None, e, time.perf_counter() - start))
+            else:
+                await results.put(BatchResult(index, item, result, None, time.perf_counter() - start))
+        await results.put(None)
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(_produce())
+        for _ in range(concurrency):
+            group.create_task(_work())
+        finished = 0
+        while finished < concurrency:
+            if (batch_result := await results.get()) is None:
+                finished += 1
+            else:
+                yield batch_result
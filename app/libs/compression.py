@@ -0,0 +1,150 @@
+"""
+compression.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import zlib
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Literal
+
+from starlette.datastructures import Headers, MutableHeaders
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+type Encoding = Literal["zstd", "gzip"]
+
+ZSTD_AVAILABLE = find_spec("zstandard") is not None
+# Preferred first, zstd compresses faster and smaller than gzip at its default level
+COMPRESSION_ENCODINGS: tuple[Encoding, ...] = ("zstd", "gzip") if ZSTD_AVAILABLE else ("gzip",)
+COMPRESSION_MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Events must reach the client as soon as they are sent
+UNCOMPRESSED_CONTENT_TYPES = ("text/event-stream",)
+
+
+###
+# Define Encodings
+###
+def accept_encoding_header(encodings: tuple[Encoding, ...] = COMPRESSION_ENCODINGS) -> str:
+    """Get the Accept-Encoding header requesting the encodings."""
+    return ", ".join(encodings)
+
+
+def negotiate(accept_encoding: str, encodings: tuple[Encoding, ...] = COMPRESSION_ENCODINGS) -> Encoding | None:
+    """Select the preferred encoding accepted by the client, if any."""
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        (name, _, params) = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0.0:
+            return encoding
+    return None
+
+
+class Compressor:
+    """Incremental compressor of a response body."""
+
+    def __init__(self, encoding: Encoding) -> None:
+        """Initialize Compressor."""
+        self.encoding = encoding
+        if encoding == "zstd":
+            import zstandard  # noqa: PLC0415
+
+            self._zstd = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, *, final: bool) -> bytes:
+        """Compress a chunk, flushing it so that the client can decode it at once."""
+        if self.encoding == "zstd":
+            import zstandard  # noqa: PLC0415
+
+            mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            return bytes(self._zstd.compress(data) + self._zstd.flush(mode))
+        return self._gzip.compress(data) + self._gzip.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+###
+# Define Middleware
+###
+class CompressionMiddleware:
+    """ASGI middleware compressing responses above a size with the encoding negotiated with the client."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        encodings: tuple[Encoding, ...] = COMPRESSION_ENCODINGS,
+    ) -> None:
+        """Initialize Compression Middleware."""
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = encodings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request."""
+        encoding = (
+            negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+            if scope["type"] == "http"
+            else None
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        compressor: Compressor | None = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first chunk tells whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body: bytes = message.get("body", b"")
+            more_body: bool = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if self._compressible(headers, body, more_body=more_body):
+                    compressor = Compressor(encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if more_body:
+                        del headers["Content-Length"]
+                    else:
+                        body = compressor.compress(body, final=True)
+                        headers["Content-Length"] = str(len(body))
+                        message = {**message, "body": body}
+                        compressor = None
+                await send(start)
+                start = None
+            if compressor is not None:
+                message = {**message, "body": compressor.compress(body, final=not more_body)}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compressible(self, headers: MutableHeaders, body: bytes, *, more_body: bool) -> bool:
+        """Check whether to compress a response from its headers and its first chunk."""
+        if "content-encoding" in headers:
+            return False
+        if headers.get("content-type", "").startswith(UNCOMPRESSED_CONTENT_TYPES):
+            return False
+        return more_body or len(body) >= self.minimum_size
@@ -0,0 +1,152 @@
+"""
+executors.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Literal
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+EXECUTOR_IO_WORKERS = 16
+EXECUTOR_CPU_WORKERS = os.process_cpu_count() or 1
+LOOP_LAG_INTERVAL = 0.25
+
+type ExecutorKind = Literal["thread", "process", "interpreter"]
+
+# Python 3.14 runs each worker in a subinterpreter of its own, with its own GIL
+INTERPRETER_POOL_AVAILABLE = hasattr(concurrent.futures, "InterpreterPoolExecutor")
+
+
+###
+# Define Executor Pool
+###
+class ExecutorPool:
+    """
+    Executor of a bounded number of workers, running blocking calls off the event loop.
+
+    A thread pool runs a call in the context of its caller, e.g. with the config of a tool call.
+    A process or interpreter pool runs a call in parallel with the event loop beyond the GIL,
+    so that the function and its arguments must be picklable, e.g. a function at module level.
+    The executor is started on first use. Its calls are counted, so that the queue depth is read at scrape time.
+    """
+
+    def __init__(self, name: str, kind: ExecutorKind = "thread", max_workers: int = EXECUTOR_IO_WORKERS) -> None:
+        """Initialize Executor Pool."""
+        if kind == "interpreter" and not INTERPRETER_POOL_AVAILABLE:
+            logger.warning("interpreter pools need Python 3.14, using a process pool, pool: {}", name)
+            kind = "process"
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self._executor: concurrent.futures.Executor | None = None
+        # Calls complete on the threads of the executor
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        """Get the executor, started on first use."""
+        if self._executor is None:
+            if self.kind == "interpreter":
+                self._executor = concurrent.futures.InterpreterPoolExecutor(self.max_workers)  # type: ignore[attr-defined,unused-ignore]
+            elif self.kind == "process":
+                # A forked worker would inherit the locks held by the threads of the server
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers,
+                    thread_name_prefix=f"{self.name}-pool",
+                )
+            logger.info(
+                "executor pool started, pool: {}, kind: {}, workers: {}",
+                self.name,
+                self.kind,
+                self.max_workers,
+            )
+        return self._executor
+
+    def in_flight(self) -> int:
+        """Get the number of calls submitted and not completed yet."""
+        return self.submitted - self.completed
+
+    def running(self) -> int:
+        """Get the number of calls running on a worker."""
+        return min(self.in_flight(), self.max_workers)
+
+    def queued(self) -> int:
+        """Get the number of calls waiting for a worker, the executor running them in submission order."""
+        return max(self.in_flight() - self.max_workers, 0)
+
+    async def run[R](self, func: Callable[..., R], /, *args: Any) -> R:  # noqa: ANN401
+        """Run the function on a worker, and wait for its result without blocking the event loop."""
+        call = (
+            functools.partial(contextvars.copy_context().run, func, *args)
+            if self.kind == "thread"
+            else functools.partial(func, *args)
+        )
+        # Counted before submitting, since the call may complete before submit returns
+        with self._lock:
+            self.submitted += 1
+        try:
+            future = self.executor.submit(call)
+        except BaseException:
+            with self._lock:
+                self.submitted -= 1
+            raise
+        # Counted on completion, since a cancelled caller does not stop a call already running
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, future: concurrent.futures.Future[Any]) -> None:
+        """Count a completed call."""
+        with self._lock:
+            self.completed += 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """Shut down the executor, cancelling the calls waiting for a worker."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+###
+# Define Loop Lag Monitor
+###
+class LoopLagMonitor:
+    """Monitor of the lag of the event loop, the delay of a timer behind its schedule while a call blocks the loop."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL) -> None:
+        """Initialize Loop Lag Monitor."""
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        """Measure the lag every interval until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(loop.time() - start - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
@@ -0,0 +1,67 @@
+"""
+health.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+from starlette.responses import JSONResponse
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from starlette.requests import Request
+
+HEALTH_ROUTE = "/healthz"
+READY_ROUTE = "/readyz"
+
+
+###
+# Define Readiness
+###
+class Readiness:
+    """
+    Readiness of a server, reported once its warm-up has run.
+
+    The server is alive as soon as it listens, and ready once every warm-up step has run.
+    A failed step is logged and reported, but does not hold the server back,
+    since the request it warms up can still succeed later.
+    """
+
+    def __init__(self) -> None:
+        """Initialize Readiness."""
+        self.ready = False
+        self.steps: dict[str, dict[str, Any]] = {}
+
+    async def warm_up(self, steps: dict[str, Callable[[], Awaitable[None]]]) -> None:
+        """Run the warm-up steps in order, then report ready."""
+        start = time.perf_counter()
+        for name, step in steps.items():
+            step_start = time.perf_counter()
+            result: dict[str, Any] = {"ok": True}
+            try:
+                await step()
+            except Exception as e:
+                logger.warning("warm-up step failed, step: {}, error: {}", name, e)
+                result = {"ok": False, "error": str(e)}
+            result["seconds"] = round(time.perf_counter() - step_start, 3)
+            self.steps[name] = result
+        self.ready = True
+        logger.info("warm-up done, seconds: {:.3f}", time.perf_counter() - start)
+
+    async def healthz(self, request: Request) -> JSONResponse:  # noqa: ARG002
+        """Report that the server is alive."""
+        return JSONResponse({"status": "ok"})
+
+    async def readyz(self, request: Request) -> JSONResponse:  # noqa: ARG002
+        """Report whether the server is ready, with the results of the warm-up steps."""
+        return JSONResponse(
+            {"status": "ready" if self.ready else "warming_up", "steps": self.steps},
+            status_code=200 if self.ready else 503,
+        )
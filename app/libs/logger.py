@@ -7,35 +7,65 @@ Author  : aumezawa
 
 from __future__ import annotations
 
+import json
 import logging
 import os
+import queue
+import random
 import sys
-from typing import TYPE_CHECKING, cast
+import threading
+import traceback
+from typing import TYPE_CHECKING, Protocol
 
 from dotenv import load_dotenv
 from loguru import logger
 
 if TYPE_CHECKING:
-    from types import FrameType
+    from collections.abc import Callable
+    from typing import TextIO
+
+    from loguru import Record
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
+    "<level>{level: <8}</level> | "
+    "<cyan>{module}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+LOG_QUEUE_MAX_SIZE = 10000
 
 
 class InterceptHandler(logging.Handler):
     """Logs to loguru from Python logging module"""
 
+    def __init__(self, level: int | str = 0) -> None:
+        """Initialize the handler."""
+        super().__init__(level)
+        self._levels: dict[str, str | int] = {}
+
+    def _level(self, record: logging.LogRecord) -> str | int:
+        level = self._levels.get(record.levelname)
+        if level is None:
+            try:
+                level = logger.level(record.levelname).name
+            except ValueError:
+                level = record.levelno
+            self._levels[record.levelname] = level
+        return level
+
     def emit(self, record: logging.LogRecord) -> None:
         """Emit a record."""
+
+        # Take the caller from the stdlib record instead of walking the stack
+        def patch(loguru_record: Record) -> None:
+            loguru_record["name"] = record.name
+            loguru_record["module"] = record.module
+            loguru_record["function"] = record.funcName
+            loguru_record["line"] = record.lineno
+
+        logger_with_opts = logger.opt(exception=record.exc_info).patch(patch)
         try:
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = str(record.levelno)
-
-        frame, depth = logging.currentframe(), 1
-        while frame.f_code.co_filename in (logging.__file__, __file__):
-            frame = cast("FrameType", frame.f_back)
-            depth += 1
-        logger_with_opts = logger.opt(depth=depth, exception=record.exc_info)
-        try:
-            logger_with_opts.log(level, "{}", record.getMessage())
+            logger_with_opts.log(self._level(record), "{}", record.getMessage())
         except Exception as e:
             safe_msg = getattr(record, "msg", None) or str(record)
             logger_with_opts.warning(
@@ -45,21 +75,108 @@ class InterceptHandler(logging.Handler):
             )
 
 
+class Stream(Protocol):
+    """Text stream the sinks write to."""
+
+    def write(self, message: str, /) -> object:
+        """Write a message."""
+        ...
+
+    def flush(self) -> object:
+        """Flush the stream."""
+        ...
+
+
+class QueueSink:
+    """Sink handing formatted messages to a background writer thread."""
+
+    def __init__(self, stream: Stream, max_size: int = LOG_QUEUE_MAX_SIZE) -> None:
+        """Initialize the sink."""
+        self.stream = stream
+        self._queue: queue.Queue[str | None] = queue.Queue(max_size)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str) -> None:
+        """Queue a message, blocking only while the writer is a full queue behind."""
+        self._queue.put(message)
+
+    def stop(self) -> None:
+        """Write the queued messages and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            message = self._queue.get()
+            # Write the backlog at once and flush per batch instead of per message
+            while message is not None:
+                self.stream.write(message)
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.stream.flush()
+            if message is None:
+                return
+
+
+def json_format(record: Record) -> str:
+    """Format a record as a JSON line with the bound extras."""
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "name": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        **{key: value for key, value in record["extra"].items() if key != "json"},
+    }
+    exception = record["exception"]
+    if exception is not None:
+        entry["exception"] = "".join(traceback.format_exception(exception.type, exception.value, exception.traceback))
+    record["extra"]["json"] = json.dumps(entry, default=str, ensure_ascii=False)
+    return "{extra[json]}\n"
+
+
+def debug_sampler(rate: float) -> Callable[[Record], bool] | None:
+    """Make a filter passing the given ratio of DEBUG records and every other record."""
+    debug_level = logger.level("DEBUG").no
+
+    def sample(record: Record) -> bool:
+        return record["level"].no != debug_level or random.random() < rate  # noqa: S311
+
+    return sample if rate < 1.0 else None
+
+
 def setup_logger(
     modules: list[str] | None = None,
+    *,
+    serialize: bool | None = None,
+    background: bool | None = None,
+    debug_sample_rate: float | None = None,
+    stream: TextIO | None = None,
 ) -> None:
     """Logger setup."""
     load_dotenv()
     log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    if serialize is None:
+        serialize = os.environ.get("LOG_FORMAT", "text").lower() == "json"
+    if background is None:
+        background = os.environ.get("LOG_BACKGROUND", "true").lower() == "true"
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+    stream = stream or sys.stdout
 
     logger.remove()
     logger.add(
-        sink=sys.stdout,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
-        "<level>{level: <8}</level> | "
-        "<cyan>{module}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
-        "<level>{message}</level>",
+        sink=QueueSink(stream) if background else stream,
+        format=json_format if serialize else TEXT_FORMAT,
         level=f"{log_level}",
+        filter=debug_sampler(debug_sample_rate),
+        colorize=False if serialize else stream.isatty(),
     )
 
     for module in modules or []:
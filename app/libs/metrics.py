@@ -0,0 +1,229 @@
+"""
+metrics.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import bisect
+import time
+from typing import TYPE_CHECKING
+
+from starlette.responses import PlainTextResponse
+from starlette.routing import Match
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+    from starlette.requests import Request
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Updates are plain increments on dicts and lists without locks. Most of them run on the event loop,
+# and an increment rarely lost between threads is acceptable for monitoring.
+
+
+###
+# Define Metrics
+###
+def _escape(value: str) -> str:
+    """Escape a label value as the text format requires."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Metric exposed in the Prometheus text format."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        """Initialize Metric."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def samples(self) -> Iterator[str]:
+        """Iterate the sample lines of the metric."""
+        return iter(())
+
+    def render(self) -> Iterator[str]:
+        """Iterate the lines of the metric."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    """Monotonically increasing metric."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        """Initialize Counter."""
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        """Increase the counter of the label values."""
+        self.values[labelvalues] = self.values.get(labelvalues, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        """Iterate the sample lines of the metric."""
+        for labelvalues, value in list(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {value}"
+
+
+class Gauge(Metric):
+    """Metric going up and down, or read from a function at scrape time."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        function: Callable[[], dict[tuple[str, ...], float]] | None = None,
+    ) -> None:
+        """Initialize Gauge."""
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+        self.function = function
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        """Increase the gauge of the label values."""
+        self.values[labelvalues] = self.values.get(labelvalues, 0.0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1.0) -> None:
+        """Decrease the gauge of the label values."""
+        self.values[labelvalues] = self.values.get(labelvalues, 0.0) - amount
+
+    def set(self, *labelvalues: str, value: float) -> None:
+        """Set the gauge of the label values."""
+        self.values[labelvalues] = value
+
+    def samples(self) -> Iterator[str]:
+        """Iterate the sample lines of the metric."""
+        values = self.function() if self.function is not None else self.values
+        for labelvalues, value in list(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {value}"
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        """Initialize Histogram."""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # counts per bucket and +Inf, followed by the sum
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """Observe a value of the label values."""
+        counts = self.values.get(labelvalues)
+        if counts is None:
+            counts = self.values[labelvalues] = [0.0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> Iterator[str]:
+        """Iterate the sample lines of the metric."""
+        for labelvalues, counts in list(self.values.items()):
+            cumulative = 0.0
+            for bound, count in zip([*self.buckets, float("inf")], counts[:-1], strict=True):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, f'le="{le}"')} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {counts[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}"
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        """Initialize Metrics Registry."""
+        self.metrics: dict[str, Metric] = {}
+
+    def register[T: Metric](self, metric: T) -> T:
+        """Register a metric."""
+        if metric.name in self.metrics:
+            msg = f"Metric already registered: {metric.name}"
+            raise ValueError(msg)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+    async def endpoint(self, request: Request) -> PlainTextResponse:  # noqa: ARG002
+        """Serve the metrics to a scraper."""
+        return PlainTextResponse(self.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+###
+# Define Middleware
+###
+def _route(scope: Scope) -> str:
+    """Get the route template of a request, matched again for the routes not recording it, e.g. added by `add_route`."""
+    route = scope.get("route")
+    if route is None:
+        routes = getattr(scope.get("router"), "routes", [])
+        route = next((item for item in routes if item.matches(scope)[0] == Match.FULL), None)
+    return str(getattr(route, "path", "unmatched"))
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting HTTP requests and measuring their latency."""
+
+    def __init__(self, app: ASGIApp, requests: Counter, latency: Histogram) -> None:
+        """Initialize Metrics Middleware."""
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The route template keeps the cardinality bounded, unlike the path
+            route = _route(scope)
+            self.requests.inc(scope["method"], route, status)
+            self.latency.observe(time.perf_counter() - start, scope["method"], route)
@@ -0,0 +1,110 @@
+"""
+scheduler.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from itertools import takewhile
+from typing import TYPE_CHECKING, Any, cast
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Hashable
+
+FOLLOW_UP_SEPARATOR = "\n\n"
+
+
+@dataclass(slots=True)
+class _Turn:
+    """Query waiting for its turn on a thread."""
+
+    query: str
+    group: Hashable
+    future: asyncio.Future[Any]
+
+
+@dataclass(slots=True)
+class _Thread:
+    """Runs of a thread, one at a time in arrival order."""
+
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    pending: list[_Turn] = field(default_factory=list)
+    users: int = 0
+
+
+class ThreadScheduler:
+    """
+    Scheduler serializing the runs on a thread, while runs on different threads stay parallel.
+
+    With `merge`, the follow-ups queued behind a run are merged into a single turn,
+    run by the first of them, and every merged caller gets the result of that turn.
+    Only consecutive queries of no group are merged: a query of a group, e.g. resuming an interrupt, runs on its own.
+    """
+
+    def __init__(self, *, merge: bool = False, separator: str = FOLLOW_UP_SEPARATOR) -> None:
+        """Initialize Thread Scheduler."""
+        self.merge = merge
+        self.separator = separator
+        self.merged = 0
+        self._threads: dict[str, _Thread] = {}
+
+    def queued(self) -> int:
+        """Get the number of queries waiting for their turn."""
+        return sum(len(thread.pending) for thread in self._threads.values())
+
+    def active(self) -> int:
+        """Get the number of threads with a run in progress."""
+        return sum(1 for thread in self._threads.values() if thread.lock.locked())
+
+    async def run[R](
+        self,
+        thread_id: str,
+        query: str,
+        func: Callable[[str], Awaitable[R]],
+        *,
+        group: Hashable = None,
+    ) -> R:
+        """Run the function on the query in the turn of the thread, or get the result of the turn merging it."""
+        thread = self._threads.setdefault(thread_id, _Thread())
+        turn = _Turn(query, group, asyncio.get_running_loop().create_future())
+        thread.pending.append(turn)
+        thread.users += 1
+        try:
+            async with thread.lock:
+                if turn.future.done():
+                    # Run by the merged turn of an earlier follow-up
+                    return cast("R", turn.future.result())
+
+                # The earlier turns have all been run, so the turn is at the head of the queue
+                turns = (
+                    list(takewhile(lambda item: not item.group, thread.pending)) if self.merge and not group else [turn]
+                )
+                for item in turns:
+                    thread.pending.remove(item)
+                followers = [item for item in turns if item is not turn]
+                self.merged += len(followers)
+                try:
+                    result = await func(self.separator.join(item.query for item in turns))
+                except asyncio.CancelledError:
+                    # Give the merged follow-ups back their own turns
+                    thread.pending[:0] = followers
+                    self.merged -= len(followers)
+                    raise
+                except Exception as e:
+                    for item in followers:
+                        item.future.set_exception(e)
+                    raise
+                for item in followers:
+                    item.future.set_result(result)
+                return result
+        finally:
+            # Drop the turn of a cancelled caller, so that it is not merged
+            if turn in thread.pending:
+                thread.pending.remove(turn)
+            thread.users -= 1
+            if thread.users == 0:
+                del self._threads[thread_id]
@@ -0,0 +1,35 @@
+"""
+serialization.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import json
+from importlib.util import find_spec
+from typing import Any
+
+ORJSON_AVAILABLE = find_spec("orjson") is not None
+
+
+###
+# Define Serializer
+###
+def dumps(content: Any) -> bytes:  # noqa: ANN401
+    """Serialize the content to compact JSON, with orjson when it is available."""
+    if ORJSON_AVAILABLE:
+        import orjson  # noqa: PLC0415
+
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def loads(content: bytes | str) -> Any:  # noqa: ANN401
+    """Deserialize JSON, with orjson when it is available."""
+    if ORJSON_AVAILABLE:
+        import orjson  # noqa: PLC0415
+
+        return orjson.loads(content)
+    return json.loads(content)
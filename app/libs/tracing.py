@@ -0,0 +1,534 @@
+"""
+tracing.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import re
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from loguru import logger
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from os import PathLike
+    from uuid import UUID
+
+    from langchain_core.outputs import ChatGenerationChunk, GenerationChunk, LLMResult
+
+TRACE_RING_BUFFER_SIZE = 4096
+TRACE_EXPORT_BATCH_SIZE = 512
+TRACE_EXPORT_INTERVAL = 1.0
+TRACE_EXPORT_TIMEOUT = 10.0
+TRACE_SERVICE_NAME = "langgraph-templete"
+TRACEPARENT_HEADER = "traceparent"
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+###
+# Define Span
+###
+@dataclass(slots=True)
+class Span:
+    """Timed operation of a trace."""
+
+    name: str
+    trace_id: str
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    parent_id: str | None = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    status: str = "ok"
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float | None:
+        """Get the duration of the span in milliseconds."""
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns is not None else None
+
+    @property
+    def traceparent(self) -> str:
+        """Get the W3C traceparent of the span."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def elapsed_ms(self, since: Span) -> float:
+        """Get the milliseconds from the start of another span to the start of this span."""
+        return (self.start_ns - since.start_ns) / 1e6
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert the span into a dict."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def parse_traceparent(traceparent: str | None) -> tuple[str, str] | None:
+    """Parse a W3C traceparent into the trace id and the parent span id."""
+    if not traceparent:
+        return None
+    match = TRACEPARENT_PATTERN.match(traceparent.strip().lower())
+    if match is None or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return (match.group(1), match.group(2))
+
+
+###
+# Define Exporters
+###
+class SpanExporter(ABC):
+    """Destination of finished spans."""
+
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        """Export a finished span without blocking the caller."""
+
+    def shutdown(self) -> None:  # noqa: B027
+        """Export the pending spans and release resources."""
+
+
+class RingBufferExporter(SpanExporter):
+    """Exporter keeping the latest spans in memory."""
+
+    def __init__(self, max_size: int = TRACE_RING_BUFFER_SIZE) -> None:
+        """Initialize Ring Buffer Exporter."""
+        self._spans: deque[Span] = deque(maxlen=max_size)
+
+    @property
+    def spans(self) -> list[Span]:
+        """Get the kept spans, oldest first."""
+        return list(self._spans)
+
+    def export(self, span: Span) -> None:
+        """Keep a finished span."""
+        self._spans.append(span)
+
+    def clear(self) -> None:
+        """Drop the kept spans."""
+        self._spans.clear()
+
+
+class BatchSpanExporter(SpanExporter):
+    """Exporter writing batches of spans from a background thread."""
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = TRACE_EXPORT_BATCH_SIZE,
+        interval: float = TRACE_EXPORT_INTERVAL,
+    ) -> None:
+        """Initialize Batch Span Exporter."""
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue: queue.Queue[Span | None] = queue.Queue(batch_size * 16)
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        """Queue a finished span, dropping it if the writer is too far behind."""
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self) -> None:
+        """Export the pending spans and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    @abstractmethod
+    def write(self, spans: list[Span]) -> None:
+        """Write a batch of spans."""
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[Span] = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stopping = True
+                    break
+                batch.append(span)
+            if not batch:
+                continue
+            try:
+                self.write(batch)
+            except Exception as e:
+                logger.warning("trace export failed: {}, spans: {}, error: {!r}", type(self).__name__, len(batch), e)
+
+
+class JsonlExporter(BatchSpanExporter):
+    """Exporter appending spans to a JSON Lines file."""
+
+    def __init__(
+        self,
+        path: str | PathLike[str],
+        *,
+        batch_size: int = TRACE_EXPORT_BATCH_SIZE,
+        interval: float = TRACE_EXPORT_INTERVAL,
+    ) -> None:
+        """Initialize JSONL Exporter."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(batch_size=batch_size, interval=interval)
+
+    def write(self, spans: list[Span]) -> None:
+        """Append a batch of spans to the file."""
+        with self.path.open("a", encoding="utf-8") as file:
+            file.writelines(json.dumps(span.to_dict(), default=str, ensure_ascii=False) + "\n" for span in spans)
+
+
+class OtlpJsonExporter(BatchSpanExporter):
+    """Exporter posting spans to an OTLP/HTTP collector in the JSON encoding."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        *,
+        service_name: str = TRACE_SERVICE_NAME,
+        headers: dict[str, str] | None = None,
+        timeout: float = TRACE_EXPORT_TIMEOUT,
+        batch_size: int = TRACE_EXPORT_BATCH_SIZE,
+        interval: float = TRACE_EXPORT_INTERVAL,
+    ) -> None:
+        """Initialize OTLP JSON Exporter."""
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self._client = httpx.Client(headers=headers, timeout=timeout)
+        super().__init__(batch_size=batch_size, interval=interval)
+
+    def shutdown(self) -> None:
+        """Export the pending spans and close the HTTP client."""
+        super().shutdown()
+        self._client.close()
+
+    @staticmethod
+    def _value(value: Any) -> dict[str, Any]:  # noqa: ANN401
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def encode(self, spans: list[Span]) -> dict[str, Any]:
+        """Encode a batch of spans into an OTLP ExportTraceServiceRequest."""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}],
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [
+                                {
+                                    "traceId": span.trace_id,
+                                    "spanId": span.span_id,
+                                    "parentSpanId": span.parent_id or "",
+                                    "name": span.name,
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(span.start_ns),
+                                    "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                                    "attributes": [
+                                        {"key": key, "value": self._value(value)}
+                                        for key, value in span.attributes.items()
+                                        if value is not None
+                                    ],
+                                    "status": {"code": 2 if span.status == "error" else 1},
+                                }
+                                for span in spans
+                            ],
+                        },
+                    ],
+                },
+            ],
+        }
+
+    def write(self, spans: list[Span]) -> None:
+        """Post a batch of spans to the collector."""
+        response = self._client.post(self.url, json=self.encode(spans))
+        response.raise_for_status()
+
+
+###
+# Define Tracer
+###
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Factory of spans handing finished spans to the exporters."""
+
+    def __init__(self, exporters: list[SpanExporter] | None = None) -> None:
+        """Initialize Tracer."""
+        self.exporters = exporters if exporters is not None else [RingBufferExporter()]
+
+    def start_span(
+        self,
+        name: str,
+        *,
+        parent: Span | None = None,
+        traceparent: str | None = None,
+        attributes: dict[str, Any] | None = None,
+    ) -> Span:
+        """Start a span under the parent, the remote parent or the current span."""
+        parent = parent or current_span.get()
+        remote = parse_traceparent(traceparent) if parent is None else None
+        if parent is not None:
+            (trace_id, parent_id) = (parent.trace_id, parent.span_id)
+        elif remote is not None:
+            (trace_id, parent_id) = remote
+        else:
+            (trace_id, parent_id) = (secrets.token_hex(16), None)
+        return Span(name=name, trace_id=trace_id, parent_id=parent_id, attributes=attributes or {})
+
+    def end_span(self, span: Span, *, error: BaseException | None = None) -> None:
+        """End a span and export it."""
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.status = "error"
+            span.attributes["error"] = repr(error)
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        *,
+        traceparent: str | None = None,
+        attributes: dict[str, Any] | None = None,
+    ) -> Iterator[Span]:
+        """Run the block in a span made current."""
+        span = self.start_span(name, traceparent=traceparent, attributes=attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            current_span.reset(token)
+
+    def shutdown(self) -> None:
+        """Export the pending spans of every exporter."""
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+###
+# Define Callback Handler
+###
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Callback handler recording graph nodes, model calls and tool calls as spans."""
+
+    run_inline = True
+
+    def __init__(self, tracer: Tracer, parent: Span) -> None:
+        """Initialize Tracing Callback Handler."""
+        self.tracer = tracer
+        self.parent = parent
+        self._spans: dict[UUID, Span] = {}
+        self._parents: dict[UUID, UUID | None] = {}
+
+    def _traced_parent(self, parent_run_id: UUID | None) -> Span:
+        # Walk up untraced runs such as routers to the nearest span
+        while parent_run_id is not None:
+            span = self._spans.get(parent_run_id)
+            if span is not None:
+                return span
+            parent_run_id = self._parents.get(parent_run_id)
+        return self.parent
+
+    def _start(self, run_id: UUID, parent_run_id: UUID | None, name: str, attributes: dict[str, Any]) -> Span:
+        parent = self._traced_parent(parent_run_id)
+        span = self.tracer.start_span(name, parent=parent, attributes=attributes)
+        if parent is not self.parent:
+            # Time between the start of the enclosing node and the start of the call
+            span.attributes["queue_wait_ms"] = span.elapsed_ms(parent)
+        self._spans[run_id] = span
+        return span
+
+    def _end(self, run_id: UUID, error: BaseException | None = None) -> Span | None:
+        self._parents.pop(run_id, None)
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            self.tracer.end_span(span, error=error)
+        return span
+
+    def on_chain_start(
+        self,
+        serialized: dict[str, Any] | None,  # noqa: ARG002
+        inputs: dict[str, Any] | Any,  # noqa: ARG002, ANN401
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> None:
+        """Start a span if the chain is a graph node."""
+        self._parents[run_id] = parent_run_id
+        node = (metadata or {}).get("langgraph_node")
+        if node is not None and kwargs.get("name") == node:
+            self._start(
+                run_id,
+                parent_run_id,
+                f"node.{node}",
+                {"node": node, "step": (metadata or {}).get("langgraph_step")},
+            )
+
+    def on_chain_end(
+        self,
+        outputs: dict[str, Any] | Any,  # noqa: ARG002, ANN401
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """End the span of a graph node."""
+        self._end(run_id)
+
+    def on_chain_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """End the span of a graph node with an error."""
+        # GraphInterrupt is how the approval node pauses, not a failure
+        self._end(run_id, error=None if type(error).__name__ == "GraphInterrupt" else error)
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any] | None,  # noqa: ARG002
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> None:
+        """Start the span of a model call."""
+        self._parents[run_id] = parent_run_id
+        invocation_params = kwargs.get("invocation_params") or {}
+        self._start(
+            run_id,
+            parent_run_id,
+            "llm.call",
+            {
+                "model": (metadata or {}).get("ls_model_name") or invocation_params.get("model"),
+                "input_messages": sum(len(batch) for batch in messages),
+            },
+        )
+
+    def on_llm_new_token(
+        self,
+        token: str,  # noqa: ARG002
+        *,
+        chunk: GenerationChunk | ChatGenerationChunk | None = None,  # noqa: ARG002
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """Record the time to the first token of a model call."""
+        span = self._spans.get(run_id)
+        if span is not None and "ttft_ms" not in span.attributes:
+            span.attributes["ttft_ms"] = (time.time_ns() - span.start_ns) / 1e6
+
+    def on_llm_end(
+        self,
+        response: LLMResult,
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """End the span of a model call with the token counts."""
+        span = self._spans.get(run_id)
+        if span is not None:
+            # A call not streamed gets its first token with the whole response
+            span.attributes.setdefault("ttft_ms", (time.time_ns() - span.start_ns) / 1e6)
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    for key in ["input_tokens", "output_tokens", "total_tokens"]:
+                        if key in usage:
+                            span.attributes[key] = span.attributes.get(key, 0) + usage[key]
+        self._end(run_id)
+
+    def on_llm_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """End the span of a model call with an error."""
+        self._end(run_id, error=error)
+
+    def on_tool_start(
+        self,
+        serialized: dict[str, Any] | None,
+        input_str: str,  # noqa: ARG002
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> None:
+        """Start the span of a tool call."""
+        self._parents[run_id] = parent_run_id
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start(run_id, parent_run_id, f"tool.{name}", {"tool": name})
+
+    def on_tool_end(
+        self,
+        output: Any,  # noqa: ARG002, ANN401
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """End the span of a tool call."""
+        self._end(run_id)
+
+    def on_tool_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any,  # noqa: ARG002, ANN401
+    ) -> None:
+        """End the span of a tool call with an error."""
+        self._end(run_id, error=error)
@@ -0,0 +1,110 @@
+"""
+usage.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Literal
+
+MAX_LLM_CALLS_PER_TURN = 16
+BUDGET_DOWNGRADE_RATIO = 0.8
+USAGE_LEDGER_MAX_TENANTS = 1024
+
+
+@dataclass(frozen=True, slots=True)
+class TokenPrice:
+    """Price of a model in USD per million tokens."""
+
+    input: float
+    output: float
+
+    def cost(self, input_tokens: float, output_tokens: float) -> float:
+        """Get the cost of the tokens in USD."""
+        return (input_tokens * self.input + output_tokens * self.output) / 1_000_000
+
+
+TOKEN_PRICES: dict[str, TokenPrice] = {
+    "gemini-2.5-pro": TokenPrice(input=1.25, output=10.0),
+    "gemini-2.5-flash": TokenPrice(input=0.30, output=2.50),
+    "gemini-2.5-flash-lite": TokenPrice(input=0.10, output=0.40),
+}
+
+
+def add_usage(left: dict[str, float] | None, right: dict[str, float] | None) -> dict[str, float]:
+    """Sum two usage records, used as the reducer of the graph state."""
+    usage = dict(left or {})
+    for key, value in (right or {}).items():
+        usage[key] = usage.get(key, 0) + value
+    return usage
+
+
+def make_usage(usage_metadata: dict[str, Any] | None, model_name: str | None) -> dict[str, float]:
+    """Make a usage record of an LLM call from its usage metadata."""
+    input_tokens = float((usage_metadata or {}).get("input_tokens", 0))
+    output_tokens = float((usage_metadata or {}).get("output_tokens", 0))
+    price = TOKEN_PRICES.get(model_name or "")
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": float((usage_metadata or {}).get("total_tokens", input_tokens + output_tokens)),
+        "cost": price.cost(input_tokens, output_tokens) if price is not None else 0.0,
+        "llm_calls": 1.0,
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class TokenBudget:
+    """Token budgets of a thread and of a tenant, with a cap on LLM calls per turn."""
+
+    max_thread_tokens: int | None = None
+    max_tenant_tokens: int | None = None
+    downgrade_ratio: float = BUDGET_DOWNGRADE_RATIO
+    max_llm_calls_per_turn: int = MAX_LLM_CALLS_PER_TURN
+
+    def level(self, thread_tokens: float, tenant_tokens: float) -> Literal["ok", "downgrade", "exhausted"]:
+        """Get how close the usage is to the budgets."""
+        ratio = max(
+            thread_tokens / self.max_thread_tokens if self.max_thread_tokens else 0.0,
+            tenant_tokens / self.max_tenant_tokens if self.max_tenant_tokens else 0.0,
+        )
+        if ratio >= 1.0:
+            return "exhausted"
+        if ratio >= self.downgrade_ratio:
+            return "downgrade"
+        return "ok"
+
+
+class UsageLedger:
+    """
+    Usage aggregated per tenant across threads.
+
+    The tenants are given by callers, so that the ledger keeps the most recently charged tenants only.
+    """
+
+    def __init__(self, max_tenants: int = USAGE_LEDGER_MAX_TENANTS) -> None:
+        """Initialize Usage Ledger."""
+        self.max_tenants = max_tenants
+        self._usages: OrderedDict[str, dict[str, float]] = OrderedDict()
+
+    def add(self, tenant_id: str, usage: dict[str, float]) -> None:
+        """Add the usage of an LLM call to the tenant, evicting the least recently charged tenant if full."""
+        self._usages[tenant_id] = add_usage(self._usages.get(tenant_id), usage)
+        self._usages.move_to_end(tenant_id)
+        while len(self._usages) > self.max_tenants:
+            self._usages.popitem(last=False)
+
+    def get(self, tenant_id: str) -> dict[str, float]:
+        """Get the usage of the tenant."""
+        return dict(self._usages.get(tenant_id, {}))
+
+    def reset(self, tenant_id: str | None = None) -> None:
+        """Reset the usage of the tenant, or of every tenant."""
+        if tenant_id is None:
+            self._usages.clear()
+        else:
+            self._usages.pop(tenant_id, None)
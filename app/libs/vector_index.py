@@ -0,0 +1,278 @@
+"""
+vector_index.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
+
+import numpy as np
+from loguru import logger
+
+from app.libs.serialization import dumps, loads
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from numpy.typing import NDArray
+
+VECTOR_INDEX_BLOCK_ROWS = 65536
+VECTOR_INDEX_PROBES = 8
+VECTOR_INDEX_SAMPLE_ROWS = 65536
+VECTOR_INDEX_ITERATIONS = 10
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "offsets.u64"
+CENTROIDS_FILE = "centroids.f32"
+LISTS_FILE = "lists.i64"
+LIST_OFFSETS_FILE = "list_offsets.i64"
+
+
+def normalize(vectors: NDArray[Any]) -> NDArray[np.float32]:
+    """Normalize the rows of the vectors to unit length, so that their dot product is the cosine similarity."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return cast("NDArray[np.float32]", vectors / np.maximum(norms, np.finfo(np.float32).tiny))
+
+
+def _top_k(
+    best: tuple[NDArray[np.float32], NDArray[np.int64]],
+    scores: NDArray[np.float32],
+    rows: NDArray[np.int64],
+    k: int,
+) -> tuple[NDArray[np.float32], NDArray[np.int64]]:
+    """Merge the scores of a block of rows into the best k so far."""
+    if len(scores) > k:
+        top = np.argpartition(scores, -k)[-k:]
+        (scores, rows) = (scores[top], rows[top])
+    merged = (np.concatenate([best[0], scores]), np.concatenate([best[1], rows]))
+    if len(merged[0]) > k:
+        top = np.argpartition(merged[0], -k)[-k:]
+        merged = (merged[0][top], merged[1][top])
+    return merged
+
+
+###
+# Define Vector Index
+###
+class VectorIndex:
+    """
+    Vector index on disk, searched by cosine similarity without loading the vectors in memory.
+
+    The vectors are appended to a float32 matrix, memory-mapped for the search, scanned by blocks of rows.
+    Each row has a JSON record in a sidecar file, read by its offset, e.g. the id and the text of a chunk.
+    `partition` groups the rows around centroids, so that a search scans the rows of the nearest partitions only.
+    Rows added later are scanned in full until the index is partitioned again, so adding never rebuilds it.
+    The count of committed rows is written last, so that an interrupted add is discarded when the index is opened.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        """Initialize Vector Index, opening the index in the directory or creating an empty one."""
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path = self.path / META_FILE
+        self.meta: dict[str, Any] = (
+            loads(meta_path.read_bytes()) if meta_path.exists() else {"dim": None, "count": 0, "partitioned": 0}
+        )
+        self._vectors: NDArray[np.float32] | None = None
+        self._offsets: NDArray[np.uint64] | None = None
+        self._partitions: tuple[NDArray[np.float32], NDArray[np.int64], NDArray[np.int64]] | None = None
+        self._discard_uncommitted()
+
+    def __len__(self) -> int:
+        """Get the number of rows."""
+        return int(self.meta["count"])
+
+    @property
+    def dim(self) -> int | None:
+        """Get the dimension of the vectors, or None before the first add."""
+        return cast("int | None", self.meta["dim"])
+
+    @property
+    def partitioned(self) -> int:
+        """Get the number of rows in the partitions, the later rows being scanned in full."""
+        return int(self.meta["partitioned"])
+
+    def _discard_uncommitted(self) -> None:
+        """Truncate the files to the committed rows."""
+        count = len(self)
+        end = int(self._offsets_map()[-1]) if count else 0
+        for name, size in (
+            (VECTORS_FILE, count * (self.dim or 0) * 4),
+            (OFFSETS_FILE, count * 8),
+            (RECORDS_FILE, end),
+        ):
+            file = self.path / name
+            if file.exists() and file.stat().st_size > size:
+                logger.warning("vector index discarding uncommitted rows, file: {}", file)
+                os.truncate(file, size)
+
+    def _replace(self, name: str, data: bytes) -> None:
+        """Write a file atomically, since a search of another process may map it."""
+        temp = self.path / f"{name}.tmp"
+        temp.write_bytes(data)
+        temp.replace(self.path / name)
+
+    def _commit(self, **meta: Any) -> None:  # noqa: ANN401
+        """Write the metadata atomically."""
+        self.meta.update(meta)
+        self._replace(META_FILE, dumps(self.meta))
+
+    def _vectors_map(self) -> NDArray[np.float32]:
+        """Map the committed vectors."""
+        if self._vectors is None or len(self._vectors) != len(self):
+            self._vectors = (
+                np.memmap(self.path / VECTORS_FILE, dtype=np.float32, mode="r", shape=(len(self), self.dim or 0))
+                if len(self)
+                else np.empty((0, self.dim or 0), dtype=np.float32)
+            )
+        return self._vectors
+
+    def _offsets_map(self) -> NDArray[np.uint64]:
+        """Map the end offsets of the committed records."""
+        if self._offsets is None or len(self._offsets) != len(self):
+            self._offsets = (
+                np.memmap(self.path / OFFSETS_FILE, dtype=np.uint64, mode="r", shape=(len(self),))
+                if len(self)
+                else np.empty(0, dtype=np.uint64)
+            )
+        return self._offsets
+
+    def add(self, vectors: NDArray[Any], records: Sequence[dict[str, Any]]) -> None:
+        """Append the vectors and their records."""
+        vectors = normalize(vectors)
+        if len(vectors) != len(records):
+            msg = f"vectors and records differ in length: {len(vectors)} != {len(records)}"
+            raise ValueError(msg)
+        if self.dim is not None and vectors.shape[1] != self.dim:
+            msg = f"vectors of dimension {vectors.shape[1]} added to an index of dimension {self.dim}"
+            raise ValueError(msg)
+        if not records:
+            return
+
+        lines = [dumps(record) + b"\n" for record in records]
+        end = int(self._offsets_map()[-1]) if len(self) else 0
+        offsets = end + np.cumsum([len(line) for line in lines], dtype=np.uint64)
+        for name, data in (
+            (VECTORS_FILE, vectors.tobytes()),
+            (OFFSETS_FILE, offsets.astype(np.uint64).tobytes()),
+            (RECORDS_FILE, b"".join(lines)),
+        ):
+            with (self.path / name).open("ab") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+        self._commit(dim=int(vectors.shape[1]), count=len(self) + len(records))
+
+    def records(self, rows: Sequence[int]) -> list[dict[str, Any]]:
+        """Read the records of the rows."""
+        offsets = self._offsets_map()
+        records = []
+        with (self.path / RECORDS_FILE).open("rb") as file:
+            for row in rows:
+                start = int(offsets[row - 1]) if row else 0
+                file.seek(start)
+                records.append(loads(file.read(int(offsets[row]) - start)))
+        return records
+
+    def _partitions_map(self) -> tuple[NDArray[np.float32], NDArray[np.int64], NDArray[np.int64]] | None:
+        """Map the centroids, the rows grouped by partition and the offsets of the partitions."""
+        if not self.partitioned:
+            return None
+        if self._partitions is None:
+            list_offsets = np.fromfile(self.path / LIST_OFFSETS_FILE, dtype=np.int64)
+            centroids = np.fromfile(self.path / CENTROIDS_FILE, dtype=np.float32).reshape(-1, self.dim or 0)
+            if len(list_offsets) != len(centroids) + 1 or list_offsets[-1] != self.partitioned:
+                # Partitioning was interrupted, the previous files being partly replaced
+                logger.warning("vector index partitions are inconsistent, scanning in full, path: {}", self.path)
+                self.meta["partitioned"] = 0
+                return None
+            self._partitions = (
+                centroids,
+                np.memmap(self.path / LISTS_FILE, dtype=np.int64, mode="r", shape=(self.partitioned,)),
+                list_offsets,
+            )
+        return self._partitions
+
+    def partition(
+        self,
+        lists: int | None = None,
+        *,
+        sample_rows: int = VECTOR_INDEX_SAMPLE_ROWS,
+        iterations: int = VECTOR_INDEX_ITERATIONS,
+        block_rows: int = VECTOR_INDEX_BLOCK_ROWS,
+    ) -> None:
+        """Group the rows around centroids learned by k-means on a sample, about the square root of the rows."""
+        vectors = self._vectors_map()
+        count = len(vectors)
+        lists = min(lists or max(1, int(np.sqrt(count))), count)
+        if not lists:
+            return
+
+        rng = np.random.default_rng(0)
+        sample = vectors[np.sort(rng.choice(count, size=min(sample_rows, count), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            # An empty partition keeps its centroid
+            filled = np.bincount(assignments, minlength=lists) > 0
+            centroids[filled] = normalize(sums[filled])
+
+        assignments = np.concatenate(
+            [
+                np.argmax(vectors[start : start + block_rows] @ centroids.T, axis=1)
+                for start in range(0, count, block_rows)
+            ],
+        )
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.searchsorted(assignments[order], np.arange(lists + 1)).astype(np.int64)
+        self._replace(CENTROIDS_FILE, centroids.astype(np.float32).tobytes())
+        self._replace(LISTS_FILE, order.tobytes())
+        self._replace(LIST_OFFSETS_FILE, list_offsets.tobytes())
+        self._partitions = None
+        self._commit(partitioned=count)
+        logger.info("vector index partitioned, rows: {}, lists: {}", count, lists)
+
+    def search(
+        self,
+        query: NDArray[Any],
+        k: int,
+        *,
+        probes: int = VECTOR_INDEX_PROBES,
+        block_rows: int = VECTOR_INDEX_BLOCK_ROWS,
+    ) -> list[tuple[int, float]]:
+        """Get the k rows most similar to the query with their scores, scanning the nearest `probes` partitions."""
+        vectors = self._vectors_map()
+        if not len(vectors) or k <= 0:
+            return []
+        query = normalize(query)[0]
+        best = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+
+        partitions = self._partitions_map()
+        start = 0
+        if partitions is not None:
+            (centroids, lists, list_offsets) = partitions
+            nearest = np.argsort(centroids @ query)[::-1][:probes]
+            # Reading the candidate rows in order keeps the reads of the mapped file sequential
+            candidates = np.sort(np.concatenate([lists[list_offsets[i] : list_offsets[i + 1]] for i in nearest]))
+            for block in range(0, len(candidates), block_rows):
+                rows = candidates[block : block + block_rows]
+                best = _top_k(best, vectors[rows] @ query, rows, k)
+            start = self.partitioned
+
+        # The rows added after partitioning are scanned in full
+        for block in range(start, len(vectors), block_rows):
+            scores = vectors[block : block + block_rows] @ query
+            best = _top_k(best, scores, np.arange(block, block + len(scores), dtype=np.int64), k)
+
+        order = np.argsort(best[0])[::-1]
+        return [(int(best[1][i]), float(best[0][i])) for i in order]
@@ -7,24 +7,73 @@ Author  : aumezawa
 
 from __future__ import annotations
 
+import asyncio
 import functools
 import operator
-from typing import TYPE_CHECKING, Any
+import random
+import time
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Any, Self
 from uuid import uuid4
 
 import httpx
 from a2a.client import ClientConfig, ClientFactory
-from a2a.client.card_resolver import A2ACardResolver
-from a2a.types import AgentCard, Message, Part, Role, TaskQueryParams, TaskState, TextPart, TransportProtocol
+from a2a.client.errors import A2AClientError, A2AClientHTTPError, A2AClientJSONError
+from a2a.types import (
+    AgentCard,
+    Message,
+    Part,
+    PushNotificationConfig,
+    Role,
+    Task,
+    TaskArtifactUpdateEvent,
+    TaskIdParams,
+    TaskQueryParams,
+    TaskState,
+    TaskStatusUpdateEvent,
+    TextPart,
+    TransportProtocol,
+)
 from langchain_core.messages.content import TextContentBlock, create_text_block
+from langchain_core.runnables import RunnableConfig  # noqa: TC002 - resolved at runtime to inject the config
 from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langgraph.config import get_stream_writer
 from loguru import logger
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+
+from app.libs.compression import accept_encoding_header
+from app.libs.serialization import loads
+from app.libs.tracing import TRACEPARENT_HEADER, current_span
+from app.tools.a2a_task_store import InMemoryTaskIdStore, TaskIdStore
+from app.tools.a2a_webhook import PENDING_STATES, A2aWebhookReceiver
 
 if TYPE_CHECKING:
-    from langchain_core.runnables import RunnableConfig
+    from types import TracebackType
+
+    from grpc.aio import Channel
+    from langgraph.types import StreamWriter
+
+HTTP_TIMEOUT = 60.0
+HTTP_CONNECT_TIMEOUT = 10.0
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY = 30.0
+HTTP2_AVAILABLE = find_spec("h2") is not None
+GRPC_AVAILABLE = find_spec("grpc") is not None
+
+AGENT_CARD_TTL = 300.0
 
-TASK_RETRY_OUT = 60
+TASK_WAIT_TIMEOUT = 300.0
+TASK_POLL_INTERVAL_MIN = 0.1
+TASK_POLL_INTERVAL_MAX = 5.0
+
+
+def get_writer() -> StreamWriter | None:
+    """Get the stream writer of the calling graph, if any."""
+    try:
+        return get_stream_writer()
+    except (KeyError, RuntimeError):
+        return None
 
 
 class RequestMessage(BaseModel):
@@ -60,58 +109,160 @@ class A2aServer:
         *,
         agent_card_path: str = "/.well-known/agent-card.json",
         transports: list[TransportProtocol | str] | None = None,
-        streaming: bool = False,
+        streaming: bool = True,
         api_token: str | None = None,
+        push_notifications: bool = False,
+        webhook_url: str | None = None,
+        webhook_receiver: A2aWebhookReceiver | None = None,
+        agent_card_ttl: float = AGENT_CARD_TTL,
+        http_client: httpx.AsyncClient | None = None,
+        task_id_store: TaskIdStore | None = None,
     ) -> None:
         """Initialize A2A Server."""
         self.name = name
         self.base_url = base_url
         self.agent_card_path = agent_card_path
-        self.transports = transports or ["JSON-RPC", "HTTP+JSON"]
+        # Prefer the binary, multiplexed transport when the agent offers it
+        self.transports = transports or [*(["GRPC"] if GRPC_AVAILABLE else []), "JSON-RPC", "HTTP+JSON"]
         self.streaming = streaming
         self.api_token = api_token
-        self.http_headers = (
-            {
-                "Authorization": f"Bearer {api_token}",
-            }
-            if api_token
-            else None
-        )
-        self.task_id_store: dict[str, str] = {}
+        self.http_headers = {
+            # Match the encodings the A2A server compresses with
+            "Accept-Encoding": accept_encoding_header(),
+            **({"Authorization": f"Bearer {api_token}"} if api_token else {}),
+        }
+        self.task_id_store = task_id_store or InMemoryTaskIdStore()
+        # A callback url on the local host is unreachable by an agent on another host
+        if webhook_url is not None and webhook_receiver is None:
+            webhook_receiver = A2aWebhookReceiver(public_url=webhook_url)
+        if push_notifications and (webhook_receiver is None or webhook_receiver.public_url is None):
+            msg = "push notifications need the public url of the webhook receiver"
+            raise ValueError(msg)
+        self.push_notifications = push_notifications
+        self.webhook_receiver = webhook_receiver
+        self.agent_card_ttl = agent_card_ttl
+        self._agent_card: AgentCard | None = None
+        self._agent_card_etag: str | None = None
+        self._agent_card_expiry = 0.0
+        self._http_client = http_client
+        self._grpc_channels: list[Channel] = []
 
-    async def get_agent_card(self) -> AgentCard:
-        """Get agent card from A2A server."""
-        resolver = A2ACardResolver(
-            base_url=self.base_url,
-            httpx_client=httpx.AsyncClient(
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client shared by every request to the A2A server."""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
                 headers=self.http_headers,
-            ),
-            agent_card_path=self.agent_card_path,
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                http2=HTTP2_AVAILABLE,
+            )
+        return self._http_client
+
+    async def __aenter__(self) -> Self:
+        """Enter the async context."""
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Exit the async context."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Release resources held by the A2A server client."""
+        if self.webhook_receiver is not None:
+            await self.webhook_receiver.stop()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        for channel in self._grpc_channels:
+            await channel.close()
+        self._grpc_channels.clear()
+
+    def _grpc_channel(self, url: str) -> Channel:
+        """Open a gRPC channel to the A2A server, closed with the client."""
+        import grpc  # noqa: PLC0415
+
+        channel = grpc.aio.insecure_channel(url)
+        self._grpc_channels.append(channel)
+        return channel
+
+    async def get_agent_card(self, *, refresh: bool = False) -> AgentCard:
+        """Get agent card from A2A server."""
+        if not refresh and self._agent_card is not None and time.monotonic() < self._agent_card_expiry:
+            return self._agent_card
+
+        url = f"{self.base_url.rstrip('/')}/{self.agent_card_path.lstrip('/')}"
+        headers = (
+            {"If-None-Match": self._agent_card_etag}
+            if self._agent_card is not None and self._agent_card_etag is not None
+            else None
         )
-        return await resolver.get_agent_card()
+        try:
+            response = await self.http_client.get(url, headers=headers)
+            if response.status_code == httpx.codes.NOT_MODIFIED and self._agent_card is not None:
+                logger.debug("a2a agent card not modified: {}", url)
+            else:
+                response.raise_for_status()
+                self._agent_card = AgentCard.model_validate(loads(response.content))
+                self._agent_card_etag = response.headers.get("ETag")
+                logger.debug("a2a agent card fetched: {}", url)
+        except httpx.HTTPStatusError as e:
+            msg = f"Failed to fetch agent card from {url}: {e}"
+            raise A2AClientHTTPError(e.response.status_code, msg) from e
+        except (ValueError, ValidationError) as e:
+            msg = f"Failed to parse agent card from {url}: {e}"
+            raise A2AClientJSONError(msg) from e
+        except httpx.RequestError as e:
+            msg = f"Network communication error fetching agent card from {url}: {e}"
+            raise A2AClientHTTPError(httpx.codes.SERVICE_UNAVAILABLE, msg) from e
+
+        self._agent_card_expiry = time.monotonic() + self.agent_card_ttl
+        return self._agent_card
 
     async def get_tools(self) -> list[BaseTool]:
         """Get tools on A2A server."""
         agent_card = await self.get_agent_card()
 
+        push_notification_configs: list[PushNotificationConfig] = []
+        receiver: A2aWebhookReceiver | None = None
+        if self.push_notifications and self.webhook_receiver and agent_card.capabilities.push_notifications:
+            receiver = self.webhook_receiver
+            await receiver.start()
+            push_notification_configs.append(
+                PushNotificationConfig(
+                    id=str(uuid4()),
+                    url=receiver.url,
+                    token=receiver.token,
+                ),
+            )
+
         factory = ClientFactory(
             config=ClientConfig(
-                streaming=False,
-                polling=False,
-                httpx_client=httpx.AsyncClient(
-                    headers=self.http_headers,
-                ),
+                streaming=self.streaming,
+                polling=receiver is not None,
+                httpx_client=self.http_client,
+                grpc_channel_factory=self._grpc_channel if GRPC_AVAILABLE else None,
                 supported_transports=self.transports,
                 accepted_output_modes=[
                     "text",
                     "text/plain",
                 ],
-                push_notification_configs=[],
+                push_notification_configs=push_notification_configs,
                 extensions=[],
             ),
         )
 
         client = factory.create(card=agent_card)
+        streaming = self.streaming and bool(agent_card.capabilities.streaming)
 
         """
         def create_metadata(
@@ -141,12 +292,72 @@ class A2aServer:
             msg = "Not supported content type"
             raise ToolException(msg)
 
-        async def send_message(
-            text: str,
-            config: RunnableConfig,
-        ) -> list[TextContentBlock]:
-            thread_id = config.get("configurable", {}).get("thread_id") or str(uuid4())
-            task_id = self.task_id_store.get(thread_id)
+        def write_artifact(writer: StreamWriter | None, update: TaskArtifactUpdateEvent) -> None:
+            if writer is None:
+                return
+            writer(
+                {
+                    "a2a_agent": self.name,
+                    "a2a_task_id": update.task_id,
+                    "a2a_context_id": update.context_id,
+                    "text": "".join(
+                        [
+                            part.root.text if part.root.kind == "text" and isinstance(part.root.text, str) else ""
+                            for part in update.artifact.parts
+                        ],
+                    ),
+                },
+            )
+
+        async def wait_task(task: Task, writer: StreamWriter | None) -> Task:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + TASK_WAIT_TIMEOUT
+            notified = receiver is not None and receiver.running
+
+            # Follow events of task streamed by the server, unless notified by it
+            if task.status.state in PENDING_STATES and streaming and not notified:
+                try:
+                    async with asyncio.timeout_at(deadline):
+                        async for _, update in client.resubscribe(TaskIdParams(id=task.id)):
+                            logger.debug("a2a resubscribed update: {}", update)
+                            if isinstance(update, TaskArtifactUpdateEvent):
+                                write_artifact(writer, update)
+                            elif isinstance(update, TaskStatusUpdateEvent) and update.final:
+                                break
+                    task = await client.get_task(TaskQueryParams(id=task.id))
+                    logger.debug("a2a response task: {}", task)
+                except (A2AClientError, NotImplementedError, TimeoutError) as e:
+                    logger.debug("a2a resubscribe unavailable, task: {}, error: {}", task.id, e)
+
+            # Get result of task with exponential backoff, or as soon as it is notified by the server,
+            # so that a notification never delivered delays the result by a poll interval only
+            delay = TASK_POLL_INTERVAL_MIN
+            while task.status.state in PENDING_STATES and (remaining := deadline - loop.time()) > 0:
+                interval = min(delay * random.uniform(0.5, 1.0), remaining)  # noqa: S311
+                notified_task = None
+                if receiver is not None and notified:
+                    notified_task = await receiver.wait_task(task.id, timeout=interval)
+                else:
+                    await asyncio.sleep(interval)
+                if notified_task is not None:
+                    task = notified_task
+                    logger.debug("a2a notified task: {}", task)
+                else:
+                    task = await client.get_task(TaskQueryParams(id=task.id))
+                    logger.debug("a2a response task: {}", task)
+                delay = min(delay * 2, TASK_POLL_INTERVAL_MAX)
+
+            if receiver is not None:
+                receiver.discard(task.id)
+            return task
+
+        async def exchange_message(text: str, thread_id: str) -> list[TextContentBlock]:
+            # The lock is held around the store only, since the exchange may take as long as a task
+            async with self.task_id_store.lock(thread_id):
+                task_id = await self.task_id_store.get(thread_id)
+            if receiver is not None and task_id is not None:
+                receiver.discard(task_id)
+            span = current_span.get()
             message = Message(
                 message_id=str(uuid4()),
                 task_id=task_id,
@@ -155,43 +366,56 @@ class A2aServer:
                 parts=[
                     Part(root=TextPart(text=text)),
                 ],
+                # Propagate the trace context to the remote agent
+                metadata={TRACEPARENT_HEADER: span.traceparent} if span is not None else None,
             )
-            logger.debug(f"a2a send message: {message}")
+            logger.debug("a2a send message: {}", message)
+            writer = get_writer()
             tool_contents: list[TextContentBlock] = []
+            task: Task | None = None
             # Get result of message:send
             async for response in client.send_message(message):
-                logger.debug(f"a2a response: {response}")
+                logger.debug("a2a response: {}", response)
                 if isinstance(response, Message):
                     tool_contents += [convert_content(part) for part in response.parts]
                 else:
-                    (task, _) = response
-                    # Get result of task
-                    retry = 0
-                    while task.status.state in [TaskState.submitted, TaskState.working] and retry < TASK_RETRY_OUT:
-                        task = await client.get_task(TaskQueryParams(id=task.id))
-                        logger.debug(f"a2a response task: {task}")
-                        retry += 1
-
-                    if task.status.state == TaskState.completed:
-                        if task.artifacts is not None:
-                            tool_contents += functools.reduce(  # converting list of list to list
-                                operator.iadd,
-                                [[convert_content(part) for part in artifact.parts] for artifact in task.artifacts],
-                                [],
-                            )
-                        if self.task_id_store.get(thread_id):
-                            del self.task_id_store[thread_id]
-                    elif task.status.state == TaskState.input_required:
-                        if task.status.message is not None:
-                            tool_contents += [convert_content(part) for part in task.status.message.parts]
-                        self.task_id_store[thread_id] = task.id
-                    else:
-                        msg = extract_text(task.status.message) if task.status.message else "An unknown error occurred."
-                        msg += f" task: {task_id}, status: {task.status.state}"
-                        raise ToolException(msg)
+                    (task, update) = response
+                    if isinstance(update, TaskArtifactUpdateEvent):
+                        write_artifact(writer, update)
+
+            if task is None:
+                return tool_contents
+
+            # Get result of task
+            task = await wait_task(task, writer)
+            if task.status.state == TaskState.completed:
+                if task.artifacts is not None:
+                    tool_contents += functools.reduce(  # converting list of list to list
+                        operator.iadd,
+                        [[convert_content(part) for part in artifact.parts] for artifact in task.artifacts],
+                        [],
+                    )
+                async with self.task_id_store.lock(thread_id):
+                    await self.task_id_store.delete(thread_id)
+            elif task.status.state == TaskState.input_required:
+                if task.status.message is not None:
+                    tool_contents += [convert_content(part) for part in task.status.message.parts]
+                async with self.task_id_store.lock(thread_id):
+                    await self.task_id_store.set(thread_id, task.id)
+            else:
+                msg = extract_text(task.status.message) if task.status.message else "An unknown error occurred."
+                msg += f" task: {task.id}, status: {task.status.state}"
+                raise ToolException(msg)
             # Finally result
             return tool_contents
 
+        async def send_message(
+            text: str,
+            config: RunnableConfig,
+        ) -> list[TextContentBlock]:
+            thread_id = config.get("configurable", {}).get("thread_id") or str(uuid4())
+            return await exchange_message(text, thread_id)
+
         return [
             StructuredTool(
                 name=agent_card.name,
@@ -0,0 +1,209 @@
+"""
+a2a_multi_client.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Literal, Self
+from uuid import uuid4
+
+from langchain_core.messages.content import TextContentBlock, create_text_block
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from loguru import logger
+
+from app.tools.a2a_client import RequestMessage
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+    from app.tools.a2a_client import A2aServer
+
+AGENT_TIMEOUT = 120.0
+LATENCY_SMOOTHING = 0.2
+
+
+@dataclass(slots=True)
+class AgentStats:
+    """Latency and reliability statistics of a remote agent."""
+
+    calls: int = 0
+    failures: int = 0
+    latency: float = 0.0
+
+    @property
+    def score(self) -> float:
+        """Get the expected cost of calling the agent, lower is better."""
+        if self.calls == 0:
+            return 0.0
+        return self.latency * (1.0 + self.failures / self.calls)
+
+    def record(self, elapsed: float, *, success: bool) -> None:
+        """Record the result of a call."""
+        self.calls += 1
+        if not success:
+            self.failures += 1
+        self.latency = (
+            elapsed if self.calls == 1 else (1 - LATENCY_SMOOTHING) * self.latency + LATENCY_SMOOTHING * elapsed
+        )
+
+    def record_cancelled(self, elapsed: float) -> None:
+        """Record a call cancelled before its answer, e.g. losing a race, whose latency is at least the elapsed time."""
+        self.calls += 1
+        self.latency = max(self.latency, elapsed)
+
+
+class A2aServerGroup:
+    """Group of A2A Servers answering the same requests."""
+
+    def __init__(
+        self,
+        name: str,
+        servers: list[A2aServer],
+        *,
+        strategy: Literal["first", "vote", "gather"] = "first",
+        fanout: int | None = None,
+        quorum: int | None = None,
+        timeout: float = AGENT_TIMEOUT,
+    ) -> None:
+        """Initialize A2A Server Group."""
+        if not servers:
+            msg = "servers must not be empty."
+            raise ValueError(msg)
+        if strategy not in ["first", "vote", "gather"]:
+            msg = "strategy must be 'first', 'vote' or 'gather'."
+            raise ValueError(msg)
+        names = [server.name for server in servers]
+        if len(set(names)) != len(names):
+            msg = f"server names must be unique: {names}"
+            raise ValueError(msg)
+        self.name = name
+        self.servers = servers
+        self.strategy = strategy
+        self.fanout = fanout or len(servers)
+        self.quorum = quorum or len(servers) // 2 + 1
+        self.timeout = timeout
+        self.stats: dict[str, AgentStats] = {server.name: AgentStats() for server in servers}
+
+    async def __aenter__(self) -> Self:
+        """Enter the async context."""
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Exit the async context."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Release resources held by every A2A server client."""
+        await asyncio.gather(*[server.close() for server in self.servers])
+
+    def select(self, count: int) -> list[A2aServer]:
+        """Select the agents expected to answer fastest."""
+        return sorted(self.servers, key=lambda server: self.stats[server.name].score)[:count]
+
+    async def get_tools(self) -> list[BaseTool]:
+        """Get a tool dispatching requests to the A2A servers."""
+        server_tools = await asyncio.gather(*[server.get_tools() for server in self.servers])
+        tools = {server.name: tools[0] for server, tools in zip(self.servers, server_tools, strict=True)}
+
+        async def call(server: A2aServer, text: str, config: RunnableConfig) -> list[TextContentBlock]:
+            start = time.perf_counter()
+            try:
+                async with asyncio.timeout(self.timeout):
+                    result = await tools[server.name].ainvoke({"text": text}, config=config)
+            except asyncio.CancelledError:
+                # An agent losing every race would otherwise stay unmeasured, and be selected first
+                self.stats[server.name].record_cancelled(time.perf_counter() - start)
+                raise
+            except Exception:
+                self.stats[server.name].record(time.perf_counter() - start, success=False)
+                raise
+            self.stats[server.name].record(time.perf_counter() - start, success=True)
+            logger.debug("a2a group {}, agent: {}, stats: {}", self.name, server.name, self.stats[server.name])
+            return list(result)
+
+        async def first(servers: list[A2aServer], text: str, config: RunnableConfig) -> list[TextContentBlock]:
+            pending = {asyncio.create_task(call(server, text, config)): server for server in servers}
+            errors: list[str] = []
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        server = pending.pop(future)
+                        if future.exception() is None:
+                            return future.result()
+                        errors.append(f"{server.name}: {future.exception()!r}")
+            finally:
+                for future in pending:
+                    future.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            msg = "All agents failed. " + "; ".join(errors)
+            raise ToolException(msg)
+
+        async def gather(servers: list[A2aServer], text: str, config: RunnableConfig) -> list[TextContentBlock]:
+            results = await asyncio.gather(*[call(server, text, config) for server in servers], return_exceptions=True)
+            contents: list[TextContentBlock] = []
+            for server, result in zip(servers, results, strict=True):
+                if isinstance(result, BaseException):
+                    contents.append(create_text_block(text=f"[{server.name}] failed: {result!r}"))
+                else:
+                    contents += [create_text_block(text=f"[{server.name}] {block.get('text', '')}") for block in result]
+            return contents
+
+        async def vote(servers: list[A2aServer], text: str, config: RunnableConfig) -> list[TextContentBlock]:
+            results = await asyncio.gather(*[call(server, text, config) for server in servers], return_exceptions=True)
+            answers = [result for result in results if not isinstance(result, BaseException)]
+            ballots = Counter(
+                " ".join("".join(block.get("text", "") for block in answer).split()) for answer in answers
+            )
+            if not ballots:
+                msg = "All agents failed."
+                raise ToolException(msg)
+            (ballot, count) = ballots.most_common(1)[0]
+            if count < min(self.quorum, len(servers)):
+                msg = f"No answer reached the quorum of {self.quorum}, votes: {dict(ballots)}"
+                raise ToolException(msg)
+            return [create_text_block(text=ballot)]
+
+        async def send_message(
+            text: str,
+            config: RunnableConfig,
+        ) -> list[TextContentBlock]:
+            thread_id = config.get("configurable", {}).get("thread_id") or str(uuid4())
+            config = RunnableConfig(
+                {**config, "configurable": {**config.get("configurable", {}), "thread_id": thread_id}},
+            )
+
+            # Continue the conversation with the agent waiting for an input
+            for server in self.servers:
+                if await server.task_id_store.get(thread_id) is not None:
+                    return await call(server, text, config)
+
+            if self.strategy == "first":
+                return await first(self.select(self.fanout), text, config)
+            if self.strategy == "vote":
+                return await vote(self.select(self.fanout), text, config)
+            return await gather(self.select(self.fanout), text, config)
+
+        description = next(iter(tools.values())).description
+        return [
+            StructuredTool(
+                name=self.name,
+                description=description,
+                args_schema=RequestMessage,
+                coroutine=send_message,
+                response_format="content",
+            ),
+        ]
@@ -0,0 +1,194 @@
+"""
+a2a_task_store.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+from weakref import WeakValueDictionary
+
+if TYPE_CHECKING:
+    from os import PathLike
+
+TASK_ID_STORE_MAX_SIZE = 10000
+TASK_ID_STORE_TTL = 24 * 60 * 60.0
+TASK_ID_STORE_SPEC = "memory"
+
+
+class TaskIdStore(ABC):
+    """Store of pending remote task ids keyed by thread id."""
+
+    def __init__(
+        self,
+        *,
+        max_size: int = TASK_ID_STORE_MAX_SIZE,
+        ttl: float = TASK_ID_STORE_TTL,
+    ) -> None:
+        """Initialize Task ID Store."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self._locks: WeakValueDictionary[str, asyncio.Lock] = WeakValueDictionary()
+
+    def lock(self, thread_id: str) -> asyncio.Lock:
+        """Get the lock serializing coroutines working on the same thread."""
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = self._locks[thread_id] = asyncio.Lock()
+        return lock
+
+    @abstractmethod
+    async def get(self, thread_id: str) -> str | None:
+        """Get the pending task id of the thread."""
+
+    @abstractmethod
+    async def set(self, thread_id: str, task_id: str) -> None:
+        """Set the pending task id of the thread."""
+
+    @abstractmethod
+    async def delete(self, thread_id: str) -> None:
+        """Delete the pending task id of the thread."""
+
+
+class InMemoryTaskIdStore(TaskIdStore):
+    """In-memory Task ID Store bounded by size and TTL."""
+
+    def __init__(
+        self,
+        *,
+        max_size: int = TASK_ID_STORE_MAX_SIZE,
+        ttl: float = TASK_ID_STORE_TTL,
+    ) -> None:
+        """Initialize In-memory Task ID Store."""
+        super().__init__(max_size=max_size, ttl=ttl)
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Get the number of entries including expired ones not evicted yet."""
+        return len(self._entries)
+
+    async def get(self, thread_id: str) -> str | None:
+        """Get the pending task id of the thread."""
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            return None
+        (task_id, expiry) = entry
+        if expiry <= time.monotonic():
+            del self._entries[thread_id]
+            return None
+        return task_id
+
+    async def set(self, thread_id: str, task_id: str) -> None:
+        """Set the pending task id of the thread."""
+        now = time.monotonic()
+        self._entries[thread_id] = (task_id, now + self.ttl)
+        self._entries.move_to_end(thread_id)
+        # entries are ordered by expiry since ttl is constant
+        while self._entries and next(iter(self._entries.values()))[1] <= now:
+            self._entries.popitem(last=False)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, thread_id: str) -> None:
+        """Delete the pending task id of the thread."""
+        self._entries.pop(thread_id, None)
+
+
+class SqliteTaskIdStore(TaskIdStore):
+    """On-disk Task ID Store shared between processes."""
+
+    def __init__(
+        self,
+        path: str | PathLike[str],
+        *,
+        max_size: int = TASK_ID_STORE_MAX_SIZE,
+        ttl: float = TASK_ID_STORE_TTL,
+        timeout: float = 5.0,
+    ) -> None:
+        """Initialize SQLite Task ID Store."""
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn_lock = threading.Lock()
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_ids ("
+                "thread_id TEXT PRIMARY KEY, task_id TEXT NOT NULL, expiry REAL NOT NULL)",
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS task_ids_expiry ON task_ids (expiry)")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._conn_lock:
+            self._conn.close()
+
+    def _get(self, thread_id: str) -> str | None:
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT task_id FROM task_ids WHERE thread_id = ? AND expiry > ?",
+                (thread_id, time.time()),
+            ).fetchone()
+        return str(row[0]) if row else None
+
+    def _set(self, thread_id: str, task_id: str) -> None:
+        now = time.time()
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO task_ids (thread_id, task_id, expiry) VALUES (?, ?, ?)",
+                    (thread_id, task_id, now + self.ttl),
+                )
+                self._conn.execute("DELETE FROM task_ids WHERE expiry <= ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM task_ids WHERE thread_id IN "
+                    "(SELECT thread_id FROM task_ids ORDER BY expiry DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete(self, thread_id: str) -> None:
+        with self._conn_lock:
+            self._conn.execute("DELETE FROM task_ids WHERE thread_id = ?", (thread_id,))
+
+    async def get(self, thread_id: str) -> str | None:
+        """Get the pending task id of the thread."""
+        return await asyncio.to_thread(self._get, thread_id)
+
+    async def set(self, thread_id: str, task_id: str) -> None:
+        """Set the pending task id of the thread."""
+        await asyncio.to_thread(self._set, thread_id, task_id)
+
+    async def delete(self, thread_id: str) -> None:
+        """Delete the pending task id of the thread."""
+        await asyncio.to_thread(self._delete, thread_id)
+
+
+def make_task_id_store(spec: str = TASK_ID_STORE_SPEC, *, name: str | None = None) -> TaskIdStore:
+    """
+    Make a task id store from its spec, `memory` or `sqlite:<path>`.
+
+    The stores of servers sharing a spec are told apart by the `name` of their server, e.g. in the file name.
+    """
+    (kind, _, path) = spec.partition(":")
+    if kind == "memory":
+        return InMemoryTaskIdStore()
+    if kind == "sqlite" and path:
+        file = Path(path)
+        return SqliteTaskIdStore(file.with_stem(f"{file.stem}.{name}") if name else file)
+    msg = f"unknown task id store: {spec}"
+    raise ValueError(msg)
@@ -0,0 +1,162 @@
+"""
+a2a_webhook.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import secrets
+import socket
+from collections import OrderedDict
+from typing import TYPE_CHECKING, override
+from urllib.parse import urlsplit
+
+import uvicorn
+from a2a.types import Task, TaskState
+from loguru import logger
+from pydantic import ValidationError
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+    from starlette.requests import Request
+
+WEBHOOK_HOST: str = "localhost"
+WEBHOOK_ROUTE: str = "/a2a/notifications"
+WEBHOOK_TOKEN_HEADER: str = "X-A2A-Notification-Token"  # noqa: S105
+WEBHOOK_MAX_RESULTS: int = 1024
+
+PENDING_STATES: list[TaskState] = [TaskState.submitted, TaskState.working]
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """Uvicorn Server which leaves signal handling to the host application."""
+
+    @override
+    @contextlib.contextmanager
+    def capture_signals(self) -> Generator[None]:
+        yield
+
+
+class A2aWebhookReceiver:
+    """
+    A2A Push Notification Receiver Class.
+
+    The remote agent posts to `public_url`, the url it reaches the receiver at, e.g. through a reverse proxy.
+    The receiver listens on `host` and `port`, the port of the public url if not given, at the route of the public url.
+    """
+
+    def __init__(
+        self,
+        *,
+        host: str = WEBHOOK_HOST,
+        port: int = 0,
+        route: str = WEBHOOK_ROUTE,
+        max_results: int = WEBHOOK_MAX_RESULTS,
+        public_url: str | None = None,
+    ) -> None:
+        """Initialize A2A Webhook Receiver."""
+        public = urlsplit(public_url) if public_url else None
+        self.host = host
+        # Listening at the port and the route of the public url by default, e.g. forwarded as is
+        self.port = port or (public.port or 0 if public else 0)
+        self.route = (public.path if public else None) or route
+        self.public_url = public_url
+        self.max_results = max_results
+        self.token = secrets.token_urlsafe(32)
+        self._results: OrderedDict[str, Task] = OrderedDict()
+        self._waiters: dict[str, asyncio.Event] = {}
+        self._server: _EmbeddedServer | None = None
+        self._server_task: asyncio.Task[None] | None = None
+
+    @property
+    def url(self) -> str:
+        """Get the callback url given to the remote agent, the public url if any."""
+        return self.public_url or f"http://{self.host}:{self.port}{self.route}"
+
+    @property
+    def running(self) -> bool:
+        """Whether the receiver is accepting notifications."""
+        return self._server is not None and self._server.started and not self._server.should_exit
+
+    async def start(self) -> None:
+        """Start the receiver on the running event loop."""
+        if self._server is not None:
+            return
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+
+        self._server = _EmbeddedServer(
+            uvicorn.Config(
+                app=Starlette(routes=[Route(self.route, self._on_notification, methods=["POST"])]),
+                log_level="warning",
+                lifespan="off",
+            ),
+        )
+        self._server_task = asyncio.create_task(self._server.serve(sockets=[sock]))
+        while not self._server.started and not self._server_task.done():  # noqa: ASYNC110
+            await asyncio.sleep(0.01)
+        if self._server_task.done():
+            self._server_task.result()
+        logger.debug("a2a webhook receiver started: {}", self.url)
+
+    async def stop(self) -> None:
+        """Stop the receiver and release every waiter."""
+        if self._server is None or self._server_task is None:
+            return
+        self._server.should_exit = True
+        await self._server_task
+        self._server = None
+        self._server_task = None
+        for event in self._waiters.values():
+            event.set()
+        logger.debug("a2a webhook receiver stopped: {}", self.url)
+
+    def discard(self, task_id: str) -> None:
+        """Forget a result of the task received previously."""
+        self._results.pop(task_id, None)
+
+    async def wait_task(self, task_id: str, timeout: float | None = None) -> Task | None:  # noqa: ASYNC109
+        """Wait until the task leaves the submitted or working state."""
+        if task_id not in self._results:
+            event = self._waiters.setdefault(task_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+            except TimeoutError:
+                logger.debug("a2a webhook timed out, task: {}", task_id)
+            finally:
+                self._waiters.pop(task_id, None)
+        return self._results.pop(task_id, None)
+
+    async def _on_notification(self, request: Request) -> Response:
+        if not secrets.compare_digest(request.headers.get(WEBHOOK_TOKEN_HEADER, ""), self.token):
+            return Response(status_code=401)
+
+        try:
+            task = Task.model_validate_json(await request.body())
+        except ValidationError:
+            return Response(status_code=400)
+
+        logger.debug("a2a webhook notification, task: {}, state: {}", task.id, task.status.state)
+        if task.status.state in PENDING_STATES:
+            return Response(status_code=204)
+
+        self._results[task.id] = task
+        self._results.move_to_end(task.id)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+        event = self._waiters.get(task.id)
+        if event is not None:
+            event.set()
+        return Response(status_code=204)
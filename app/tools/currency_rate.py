@@ -7,14 +7,30 @@ Author  : aumezawa
 
 from __future__ import annotations
 
+import os
+from functools import cache
 from typing import TYPE_CHECKING, Any, cast
 
 import httpx
 from langchain_core.tools import tool
 
+from app.agents.tool_results import ToolResultPolicy
+
 if TYPE_CHECKING:
     from langchain_core.tools import BaseTool
 
+FRANKFURTER_API_URL = "https://api.frankfurter.app"
+FRANKFURTER_API_URL_ENV = "FRANKFURTER_API_URL"
+
+
+###
+# Define Client
+###
+@cache
+def frankfurter_client() -> httpx.Client:
+    """Get the client of the Frankfurter API, keeping its connections open across calls."""
+    return httpx.Client()
+
 
 ###
 # Define Tools
@@ -44,8 +60,8 @@ def get_exchange_rate(
             Example: {"amount": 1.0, "base": "USD", "date": "2023-11-24",
                 "rates": {"JPY": 149.6}}
     """
-    response = httpx.get(
-        url=f"https://api.frankfurter.app/{currency_date}",
+    response = frankfurter_client().get(
+        url=f"{os.environ.get(FRANKFURTER_API_URL_ENV, FRANKFURTER_API_URL)}/{currency_date}",
         params={
             "from": currency_from,
             "to": currency_to,
@@ -60,3 +76,8 @@ def get_exchange_rate(
 tools: list[BaseTool] = [
     get_exchange_rate,
 ]
+
+# A time series of rates is large, keep the rates and their dates
+tool_result_policies: dict[str, ToolResultPolicy] = {
+    get_exchange_rate.name: ToolResultPolicy(fields=("base", "date", "start_date", "end_date", "rates")),
+}
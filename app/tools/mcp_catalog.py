@@ -0,0 +1,107 @@
+"""
+mcp_catalog.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+from mcp.types import Tool as McpTool
+from pydantic import ValidationError
+
+if TYPE_CHECKING:
+    from os import PathLike
+
+MCP_CATALOG_MAX_AGE = 7 * 24 * 60 * 60.0
+
+
+class McpToolCatalog:
+    """Cache of tool catalogs of MCP servers, in memory and optionally on disk."""
+
+    def __init__(
+        self,
+        cache_dir: str | PathLike[str] | None = None,
+        *,
+        max_age: float = MCP_CATALOG_MAX_AGE,
+    ) -> None:
+        """Initialize MCP Tool Catalog."""
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_age = max_age
+        self._entries: dict[str, dict[str, Any]] = {}
+
+    def _path(self, server_url: str) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{hashlib.sha256(server_url.encode()).hexdigest()}.json"
+
+    def _load(self, server_url: str) -> dict[str, Any] | None:
+        entry = self._entries.get(server_url)
+        if entry is not None:
+            return entry
+
+        path = self._path(server_url)
+        if path is None or not path.exists():
+            return None
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning("mcp catalog unreadable: {}, error: {!r}", path, e)
+            return None
+        if not isinstance(entry, dict) or entry.get("server_url") != server_url:
+            return None
+        self._entries[server_url] = entry
+        return entry
+
+    def get(self, server_url: str, version: str | None = None) -> list[McpTool] | None:
+        """Get the cached tools of the MCP server, if fresh and of the same version."""
+        entry = self._load(server_url)
+        if entry is None:
+            return None
+        if version is not None and entry.get("version") != version:
+            return None
+        if time.time() - float(entry.get("listed_at", 0.0)) > self.max_age:
+            return None
+        try:
+            return [McpTool.model_validate(tool) for tool in entry.get("tools", [])]
+        except ValidationError as e:
+            logger.warning("mcp catalog invalid: {}, error: {!r}", server_url, e)
+            return None
+
+    def set(self, server_url: str, version: str | None, tools: list[McpTool]) -> bool:
+        """Store the tools of the MCP server, returning whether the catalog changed."""
+        previous = self._load(server_url)
+        entry = {
+            "server_url": server_url,
+            "version": version,
+            "listed_at": time.time(),
+            "tools": [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in tools],
+        }
+        changed = previous is None or previous.get("version") != version or previous.get("tools") != entry["tools"]
+        self._entries[server_url] = entry
+
+        path = self._path(server_url)
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                temp = path.with_suffix(f".{os.getpid()}.tmp")
+                temp.write_text(json.dumps(entry), encoding="utf-8")
+                temp.replace(path)
+            except OSError as e:
+                logger.warning("mcp catalog unwritable: {}, error: {!r}", path, e)
+        return changed
+
+    def invalidate(self, server_url: str) -> None:
+        """Drop the cached tools of the MCP server."""
+        self._entries.pop(server_url, None)
+        path = self._path(server_url)
+        if path is not None:
+            path.unlink(missing_ok=True)
@@ -7,13 +7,120 @@ Author  : aumezawa
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Literal
+import asyncio
+import itertools
+from typing import TYPE_CHECKING, Literal, Self
 
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_mcp_adapters.sessions import Connection, SSEConnection, StreamableHttpConnection
+import anyio
+import httpx
+from langchain_mcp_adapters.sessions import Connection, SSEConnection, StreamableHttpConnection, create_session
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from loguru import logger
+from mcp.types import ServerNotification, ToolListChangedNotification
+
+from app.tools.mcp_catalog import McpToolCatalog
 
 if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+    from types import TracebackType
+
     from langchain_core.tools import BaseTool
+    from langchain_mcp_adapters.interceptors import MCPToolCallRequest, MCPToolCallResult
+    from mcp import ClientSession
+    from mcp.types import Tool as McpTool
+
+MCP_CONNECT_TIMEOUT = 30.0
+MCP_HEALTH_CHECK_INTERVAL = 30.0
+MCP_HEALTH_CHECK_TIMEOUT = 10.0
+MCP_RECONNECT_DELAY_MIN = 0.5
+MCP_RECONNECT_DELAY_MAX = 30.0
+MCP_LIST_TOOLS_MAX_PAGES = 1000
+
+MCP_CONNECTION_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    httpx.TransportError,
+    TimeoutError,
+)
+# Raised on sending through a closed session, so that the request never reached the server
+MCP_UNSENT_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+)
+
+
+class McpSession:
+    """Live MCP Session owned by a background task."""
+
+    def __init__(self, connection: Connection) -> None:
+        """Initialize MCP Session."""
+        self.connection = connection
+        self.session: ClientSession | None = None
+        self.server_version: str | None = None
+        self._ready = asyncio.Event()
+        self._restart = asyncio.Event()
+        self._closing = False
+        self._error: Exception | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    async def start(self, timeout: float = MCP_CONNECT_TIMEOUT) -> None:  # noqa: ASYNC109
+        """Open the session and wait until it is initialized."""
+        if self._task is None:
+            self._closing = False
+            self._error = None
+            self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except TimeoutError:
+            await self.stop()
+            raise
+        if self._error is not None:
+            await self.stop()
+            raise self._error
+
+    async def stop(self) -> None:
+        """Close the session."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._restart.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def restart(self) -> None:
+        """Reopen the session in the background."""
+        self._restart.set()
+
+    async def _run(self) -> None:
+        # The transport of the session must be opened and closed in the same task.
+        delay = MCP_RECONNECT_DELAY_MIN
+        connected = False
+        while not self._closing:
+            try:
+                async with create_session(self.connection) as session:
+                    result = await session.initialize()
+                    self.server_version = result.serverInfo.version
+                    self.session = session
+                    self._ready.set()
+                    connected = True
+                    delay = MCP_RECONNECT_DELAY_MIN
+                    await self._restart.wait()
+            except Exception as e:
+                logger.warning("mcp session error: {!r}", e)
+                if not connected:
+                    self._error = e
+            finally:
+                self.session = None
+                self._ready.clear()
+                self._restart.clear()
+            if self._error is not None:
+                # Report the failure of the first connection to start()
+                self._ready.set()
+                return
+            if not self._closing:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MCP_RECONNECT_DELAY_MAX)
 
 
 class McpServer:
@@ -25,30 +132,260 @@ class McpServer:
         server_url: str,
         transport: Literal["sse", "streamable_http"] = "streamable_http",
         api_token: str | None = None,
+        *,
+        pool_size: int = 1,
+        health_check_interval: float = MCP_HEALTH_CHECK_INTERVAL,
+        catalog: McpToolCatalog | None = None,
     ) -> None:
         """Initialize MCP Server."""
         self.name = name
         self.server_url = server_url
         self.transport = transport
         self.api_token = api_token
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.catalog = catalog or McpToolCatalog()
+        self.sessions: list[McpSession] = []
+        self._next_session = itertools.count()
+        self._connect_lock = asyncio.Lock()
+        self._health_check_task: asyncio.Task[None] | None = None
+        self._revalidate_task: asyncio.Task[None] | None = None
+        self._idempotent_tools: set[str] = set()
 
-    async def get_tools(self) -> list[BaseTool]:
-        """Get tools on MCP server."""
+    @property
+    def connection(self) -> Connection:
+        """Get the connection config of the MCP server."""
         headers = {}
         if self.api_token is not None:
             headers["Authorization"] = f"Bearer {self.api_token}"
 
-        connection: Connection
+        session_kwargs = {"message_handler": self._on_message}
         if self.transport == "sse":
-            connection = SSEConnection(url=self.server_url, transport=self.transport, headers=headers)
-        elif self.transport == "streamable_http":
-            connection = StreamableHttpConnection(url=self.server_url, transport=self.transport, headers=headers)
+            return SSEConnection(
+                url=self.server_url,
+                transport=self.transport,
+                headers=headers,
+                session_kwargs=session_kwargs,
+            )
+        if self.transport == "streamable_http":
+            return StreamableHttpConnection(
+                url=self.server_url,
+                transport=self.transport,
+                headers=headers,
+                session_kwargs=session_kwargs,
+            )
+        msg = "transport must be 'sse' or 'streamable_http'."
+        raise ValueError(msg)
+
+    async def __aenter__(self) -> Self:
+        """Enter the async context."""
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Exit the async context."""
+        await self.close()
+
+    @property
+    def server_version(self) -> str | None:
+        """Get the version reported by the MCP server."""
+        return next((session.server_version for session in self.sessions if session.server_version), None)
+
+    async def connect(self) -> None:
+        """Open the pool of sessions to the MCP server."""
+        async with self._connect_lock:
+            if self.sessions:
+                return
+            connection = self.connection
+            sessions = [McpSession(connection) for _ in range(self.pool_size)]
+            results = await asyncio.gather(*[session.start() for session in sessions], return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    await asyncio.gather(*[session.stop() for session in sessions])
+                    raise result
+            self.sessions = sessions
+            self._health_check_task = asyncio.create_task(self._health_check())
+            logger.debug("mcp server connected: {}, sessions: {}", self.name, len(self.sessions))
+
+    async def close(self) -> None:
+        """Close the pool of sessions to the MCP server."""
+        if self._revalidate_task is not None:
+            self._revalidate_task.cancel()
+            await asyncio.gather(self._revalidate_task, return_exceptions=True)
+            self._revalidate_task = None
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            await asyncio.gather(self._health_check_task, return_exceptions=True)
+            self._health_check_task = None
+        await asyncio.gather(*[session.stop() for session in self.sessions])
+        self.sessions = []
+
+    def acquire(self) -> ClientSession | None:
+        """Get a live session from the pool, if any."""
+        for _ in range(len(self.sessions)):
+            session = self.sessions[next(self._next_session) % len(self.sessions)].session
+            if session is not None:
+                return session
+        return None
+
+    async def _health_check(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for pooled in self.sessions:
+                if pooled.session is None:
+                    continue
+                try:
+                    async with asyncio.timeout(MCP_HEALTH_CHECK_TIMEOUT):
+                        await pooled.session.send_ping()
+                except Exception as e:
+                    logger.warning("mcp health check failed: {}, error: {!r}", self.name, e)
+                    pooled.restart()
+
+    async def _call_tool(
+        self,
+        request: MCPToolCallRequest,
+        handler: Callable[[MCPToolCallRequest], Awaitable[MCPToolCallResult]],
+    ) -> MCPToolCallResult:
+        session = self.acquire()
+        if session is None and not self.sessions:
+            try:
+                await self.connect()
+            except Exception as e:
+                logger.warning("mcp server unavailable: {}, error: {!r}", self.name, e)
+            session = self.acquire()
+        if session is None:
+            # Fall back to a one-off session
+            return await handler(request)
+        try:
+            return await session.call_tool(request.name, request.args)
+        except MCP_CONNECTION_ERRORS as e:
+            logger.warning("mcp session broken: {}, error: {!r}", self.name, e)
+            for pooled in self.sessions:
+                if pooled.session is session:
+                    pooled.restart()
+            # A call which may have run on the server is run again only if running it twice is harmless
+            if not isinstance(e, MCP_UNSENT_ERRORS) and request.name not in self._idempotent_tools:
+                raise
+            return await handler(request)
+
+    async def list_tools(self) -> list[McpTool]:
+        """List tools on MCP server."""
+        session = self.acquire()
+        if session is None:
+            async with create_session(self.connection) as one_off_session:
+                await one_off_session.initialize()
+                return await self._list_tools(one_off_session)
+        return await self._list_tools(session)
+
+    def _remember(self, tools: list[McpTool]) -> None:
+        """Remember the tools annotated as idempotent, to retry their calls."""
+        self._idempotent_tools = {tool.name for tool in tools if tool.annotations and tool.annotations.idempotentHint}
+
+    async def _list_tools(self, session: ClientSession) -> list[McpTool]:
+        tools: list[McpTool] = []
+        cursor: str | None = None
+        for _ in range(MCP_LIST_TOOLS_MAX_PAGES):
+            result = await session.list_tools(cursor=cursor)
+            tools += result.tools
+            if not result.nextCursor:
+                return tools
+            cursor = result.nextCursor
+        msg = f"Too many pages of tools on MCP server: {self.name}"
+        raise RuntimeError(msg)
+
+    async def _on_message(self, message: object) -> None:
+        if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+            logger.debug("mcp tools changed: {}", self.name)
+            self.catalog.invalidate(self.server_url)
+            self.revalidate()
+
+    def revalidate(self) -> None:
+        """List tools on MCP server in the background and update the catalog."""
+        if self._revalidate_task is None or self._revalidate_task.done():
+            self._revalidate_task = asyncio.create_task(self._revalidate())
+
+    async def _revalidate(self) -> None:
+        try:
+            await self.connect()
+            tools = await self.list_tools()
+        except Exception as e:
+            logger.warning("mcp catalog revalidation failed: {}, error: {!r}", self.name, e)
+            return
+        self._remember(tools)
+        if self.catalog.set(self.server_url, self.server_version, tools):
+            # The tools bound to a running agent keep their schemas
+            logger.warning("mcp catalog updated, restart to bind the new tools: {}, tools: {}", self.name, len(tools))
+
+    async def get_tools(self, *, tool_name_prefix: bool = False) -> list[BaseTool]:
+        """
+        Get tools on MCP server.
+
+        The cached catalog is served if of the version of the connected server, or before connecting.
+        The catalog is revalidated in the background, and on a tool list change notified by the server,
+        but the tools returned keep their schemas: an agent binds the updated tools when restarted.
+        """
+        tools = self.catalog.get(self.server_url, self.server_version)
+        if tools is not None:
+            # Serve the cached catalog and connect in the background
+            self.revalidate()
         else:
-            msg = "transport must be 'sse' or 'streamable_http'."
-            raise ValueError(msg)
+            await self.connect()
+            tools = await self.list_tools()
+            self.catalog.set(self.server_url, self.server_version, tools)
+        self._remember(tools)
+
+        connection = self.connection
+        return [
+            convert_mcp_tool_to_langchain_tool(
+                None,
+                tool,
+                connection=connection,
+                tool_interceptors=[self._call_tool],
+                server_name=self.name,
+                tool_name_prefix=tool_name_prefix,
+            )
+            for tool in tools
+        ]
+
+
+class McpServerManager:
+    """Aggregation of MCP Servers into one tool set."""
+
+    def __init__(self, servers: list[McpServer]) -> None:
+        """Initialize MCP Server Manager."""
+        self.servers = servers
 
-        connections: dict[str, Connection] = {}
-        connections[self.name] = connection
-        client = MultiServerMCPClient(connections)
+    async def __aenter__(self) -> Self:
+        """Enter the async context."""
+        return self
 
-        return await client.get_tools()
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Exit the async context."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Close every MCP server."""
+        await asyncio.gather(*[server.close() for server in self.servers])
+
+    async def get_tools(self) -> list[BaseTool]:
+        """Get tools on every reachable MCP server, prefixed with the server name."""
+        results = await asyncio.gather(
+            *[server.get_tools(tool_name_prefix=True) for server in self.servers],
+            return_exceptions=True,
+        )
+        tools: list[BaseTool] = []
+        for server, result in zip(self.servers, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.warning("mcp server tools unavailable: {}, error: {!r}", server.name, result)
+                continue
+            tools += result
+        return tools
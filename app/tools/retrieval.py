@@ -0,0 +1,269 @@
+"""
+retrieval.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from itertools import pairwise
+from typing import TYPE_CHECKING, Any, cast
+
+import numpy as np
+from langchain_core.tools import tool
+from loguru import logger
+
+from app.agents.tool_results import ToolResultPolicy
+from app.libs.serialization import dumps, loads
+from app.libs.vector_index import VECTOR_INDEX_PROBES, VectorIndex
+
+if TYPE_CHECKING:
+    import os
+    from collections.abc import Iterable, Iterator, Sequence
+
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.tools import BaseTool
+    from numpy.typing import NDArray
+
+RAG_TOOL_NAME = "search_documents"
+RAG_TOP_K = 4
+RAG_CHUNK_SIZE = 1000
+RAG_CHUNK_OVERLAP = 200
+RAG_BATCH_SIZE = 256
+RAG_EMBEDDER = "hash"
+RAG_SOURCES_FILE = "sources.jsonl"
+HASH_EMBEDDER_DIM = 256
+GOOGLE_EMBEDDING_MODEL = "gemini-embedding-001"
+
+_WHITESPACE = re.compile(r"\s")
+
+
+###
+# Define Embedders
+###
+class Embedder(ABC):
+    """Model embedding texts into vectors, named by the spec given to `make_embedder`."""
+
+    name: str
+
+    @abstractmethod
+    def embed_documents(self, texts: Sequence[str]) -> NDArray[np.float32]:
+        """Embed the texts to index, one row each."""
+
+    def embed_query(self, text: str) -> NDArray[np.float32]:
+        """Embed a query to search with."""
+        return cast("NDArray[np.float32]", self.embed_documents([text])[0])
+
+
+class HashEmbedder(Embedder):
+    """
+    Deterministic local embedder hashing the words and word pairs of a text into signed buckets.
+
+    It needs neither a model nor a network, for tests and offline use, and matches texts sharing words only.
+    """
+
+    def __init__(self, dim: int = HASH_EMBEDDER_DIM) -> None:
+        """Initialize Hash Embedder."""
+        self.dim = dim
+        self.name = f"hash:{dim}"
+
+    def _embed(self, text: str) -> NDArray[np.float32]:
+        """Embed a text."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        for feature in [*words, *(f"{left} {right}" for left, right in pairwise(words))]:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        return vector
+
+    def embed_documents(self, texts: Sequence[str]) -> NDArray[np.float32]:
+        """Embed the texts to index, one row each."""
+        return np.stack([self._embed(text) for text in texts]) if texts else np.empty((0, self.dim), dtype=np.float32)
+
+
+class LangChainEmbedder(Embedder):
+    """Embedder calling a LangChain embeddings model, e.g. of Google Generative AI."""
+
+    def __init__(self, embeddings: Embeddings, name: str) -> None:
+        """Initialize LangChain Embedder."""
+        self.embeddings = embeddings
+        self.name = name
+
+    def embed_documents(self, texts: Sequence[str]) -> NDArray[np.float32]:
+        """Embed the texts to index, one row each."""
+        return np.asarray(self.embeddings.embed_documents(list(texts)), dtype=np.float32)
+
+    def embed_query(self, text: str) -> NDArray[np.float32]:
+        """Embed a query to search with."""
+        return np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+
+
+def make_embedder(spec: str = RAG_EMBEDDER) -> Embedder:
+    """Make an embedder from its spec, `hash[:<dim>]` or `google[:<model>]`."""
+    (kind, _, option) = spec.partition(":")
+    if kind == "hash":
+        return HashEmbedder(int(option or HASH_EMBEDDER_DIM))
+    if kind == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings  # noqa: PLC0415
+
+        model = option or GOOGLE_EMBEDDING_MODEL
+        return LangChainEmbedder(GoogleGenerativeAIEmbeddings(model=model), f"google:{model}")
+    msg = f"unknown embedder: {spec}"
+    raise ValueError(msg)
+
+
+###
+# Define Ingestion
+###
+def read_sources(index: VectorIndex) -> dict[str, str]:
+    """Read the digests of the texts of the sources ingested into the index, the latest one of each source."""
+    path = index.path / RAG_SOURCES_FILE
+    if not path.exists():
+        return {}
+    return {entry["source"]: entry["digest"] for entry in map(loads, path.read_bytes().splitlines())}
+
+
+def chunk_text(text: str, size: int = RAG_CHUNK_SIZE, overlap: int = RAG_CHUNK_OVERLAP) -> Iterator[str]:
+    """Split a text into overlapping chunks, breaking at a whitespace in the second half of a chunk if any."""
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            space = max(text.rfind(" ", start + size // 2, end), text.rfind("\n", start + size // 2, end))
+            end = space if space > 0 else end
+        chunk = text[start:end].strip()
+        if chunk:
+            yield chunk
+        if end == len(text):
+            return
+        # The next chunk starts at a word of the overlap
+        word = _WHITESPACE.search(text, max(end - overlap, start + 1), end)
+        start = word.end() if word else max(end - overlap, start + 1)
+
+
+def ingest(
+    index: VectorIndex,
+    embedder: Embedder,
+    documents: Iterable[tuple[str, str]],
+    *,
+    chunk_size: int = RAG_CHUNK_SIZE,
+    overlap: int = RAG_CHUNK_OVERLAP,
+    batch_size: int = RAG_BATCH_SIZE,
+) -> dict[str, int]:
+    """
+    Add the documents, pairs of a source and a text, to the index, streamed in batches of chunks.
+
+    Only a batch is held in memory, and the index is never rebuilt.
+    A source already ingested with the same text is skipped, and one with a changed text is added again:
+    its chunks carry the digest of the text, so that the search skips the chunks of a previous text.
+    """
+    recorded = index.meta.get("embedder")
+    if recorded is not None and recorded != embedder.name:
+        msg = f"the index is embedded by {recorded}, not by {embedder.name}"
+        raise ValueError(msg)
+    sources_path = index.path / RAG_SOURCES_FILE
+    sources = read_sources(index)
+
+    stats = {"documents": 0, "skipped": 0, "chunks": 0}
+    batch: list[dict[str, Any]] = []
+    done: list[dict[str, Any]] = []
+
+    def _flush() -> None:
+        if batch:
+            # Committed with the rows, to embed the queries alike
+            index.meta["embedder"] = embedder.name
+            index.add(embedder.embed_documents([record["text"] for record in batch]), batch)
+            stats["chunks"] += len(batch)
+            batch.clear()
+        if done:
+            # A source is recorded once all its chunks are committed
+            with sources_path.open("ab") as file:
+                file.writelines(dumps(entry) + b"\n" for entry in done)
+            done.clear()
+
+    for source, text in documents:
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        if sources.get(source) == digest:
+            stats["skipped"] += 1
+            continue
+        if source in sources:
+            logger.info("document changed, superseding its previous chunks, source: {}", source)
+        for i, chunk in enumerate(chunk_text(text, chunk_size, overlap)):
+            batch.append({"id": f"{source}@{digest[:12]}#{i}", "source": source, "digest": digest, "text": chunk})
+            if len(batch) >= batch_size:
+                _flush()
+        sources[source] = digest
+        done.append({"source": source, "digest": digest})
+        stats["documents"] += 1
+    _flush()
+    return stats
+
+
+###
+# Define Tool
+###
+def make_retrieval_tool(
+    index: VectorIndex,
+    embedder: Embedder,
+    *,
+    k: int = RAG_TOP_K,
+    probes: int = VECTOR_INDEX_PROBES,
+) -> BaseTool:
+    """Make the tool searching the index, skipping the chunks of the texts superseded by a later ingestion."""
+    sources_path = index.path / RAG_SOURCES_FILE
+    # Read again when an ingestion appends to the sources
+    sources: dict[str, Any] = {"mtime": None, "digests": {}}
+
+    def _current(record: dict[str, Any]) -> bool:
+        mtime = sources_path.stat().st_mtime_ns if sources_path.exists() else None
+        if mtime != sources["mtime"]:
+            sources.update(mtime=mtime, digests=read_sources(index))
+        # The chunks ingested before the digests were recorded cannot be told apart
+        return "digest" not in record or sources["digests"].get(record.get("source")) == record["digest"]
+
+    @tool(RAG_TOOL_NAME)
+    def search_documents(query: str) -> list[dict[str, Any]]:
+        """
+        Search the local documents for the passages relevant to a question, to answer it from them.
+
+        Args:
+            query: The question or keywords to search for.
+
+        Returns:
+            list[dict[str, Any]]: The passages, most relevant first, with their source and score.
+        """
+        vector = embedder.embed_query(query)
+        count = k
+        while True:
+            hits = index.search(vector, count, probes=probes)
+            records = index.records([row for (row, _) in hits])
+            passages = [
+                {"source": record.get("source"), "text": record.get("text"), "score": round(score, 4)}
+                for (record, (_, score)) in zip(records, hits, strict=True)
+                if _current(record)
+            ]
+            # Search further while superseded chunks take the place of current ones
+            if len(passages) >= k or len(hits) < count:
+                return passages[:k]
+            count *= 2
+
+    return search_documents
+
+
+def get_retrieval_tools(path: str | os.PathLike[str], *, k: int = RAG_TOP_K) -> list[BaseTool]:
+    """Get the tools searching the index in the directory, with the embedder it was ingested with."""
+    index = VectorIndex(path)
+    return [make_retrieval_tool(index, make_embedder(index.meta.get("embedder", RAG_EMBEDDER)), k=k)]
+
+
+###
+# Export Tools
+###
+# The passages are the grounding of the answer, so they are not compacted
+tool_result_policies: dict[str, ToolResultPolicy] = {
+    RAG_TOOL_NAME: ToolResultPolicy(max_tokens=None),
+}
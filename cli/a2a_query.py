@@ -8,12 +8,18 @@ Author  : aumezawa
 from __future__ import annotations
 
 import argparse
+import asyncio
+import json
 import time
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from uuid import uuid4
 
 import httpx
-import httpx_sse
+
+from app.libs.serialization import loads
+
+if TYPE_CHECKING:
+    from app.benchmarks.a2a_load import Flow, Transport
 
 
 def get_agnet_card(
@@ -23,7 +29,7 @@ def get_agnet_card(
     """Get Agent Card."""
     with httpx.Client(timeout=60) as client:
         response = client.get(f"{url}{route}")
-        result = response.json()
+        result = loads(response.content)
         print("=== Get Agent Card ===")
         print(result)
         print()
@@ -59,7 +65,7 @@ def get_task(
         response = client.get(
             url=f"{url}{api_version}/tasks/{task_id}",
         )
-        result = response.json()
+        result = loads(response.content)
         print(f"=== Get Task (task_id={task_id}) ===")
         print(result)
         print()
@@ -84,7 +90,7 @@ def post_message(
             },
             json=make_message(query, context_id),
         )
-        result = response.json()
+        result = loads(response.content)
         print(f"=== Send Message (query={query}, context_id={context_id}) ===")
         print(result)
         print()
@@ -102,6 +108,8 @@ def post_message_stream(
     api_version: str = "/v1",
 ) -> None:
     """Post Message with SSE."""
+    import httpx_sse  # noqa: PLC0415
+
     with httpx_sse.connect_sse(
         client=httpx.Client(),
         method="POST",
@@ -112,10 +120,37 @@ def post_message_stream(
         json=make_message(query, context_id),
     ) as event_source:
         for sse in event_source.iter_sse():
-            print(sse.json())
+            print(loads(sse.data))
             print()
 
 
+def exec_load(
+    url: str,
+    *,
+    flow: Flow,
+    query: str | None = None,
+    requests: int = 100,
+    concurrency: int = 8,
+    rate: float | None = None,
+    transport: Transport | None = None,
+) -> None:
+    """Drive the A2A server with a load."""
+    from app.benchmarks.a2a_load import LOAD_QUERY, run_a2a_load  # noqa: PLC0415
+
+    result = asyncio.run(
+        run_a2a_load(
+            url,
+            flow=flow,
+            requests=requests,
+            concurrency=concurrency,
+            rate=rate,
+            transport=transport,
+            query=query or LOAD_QUERY,
+        ),
+    )
+    print(json.dumps(result, indent=2))
+
+
 def a2a_query() -> None:
     """Execute a selected function."""
     parser = argparse.ArgumentParser(description="Select to execute an agent.")
@@ -128,7 +163,7 @@ def a2a_query() -> None:
     parser.add_argument(
         "-q",
         "--query",
-        required=True,
+        default=None,
         help="The query to the agent.",
     )
     parser.add_argument(
@@ -137,10 +172,61 @@ def a2a_query() -> None:
         default=None,
         help="The context ID for the conversation.",
     )
+    parser.add_argument(
+        "-l",
+        "--load",
+        choices=["send", "stream", "poll"],
+        default=None,
+        help="Drive the agent with a load of the flow, and report the latency, errors and throughput.",
+    )
+    parser.add_argument(
+        "-n",
+        "--requests",
+        type=int,
+        default=100,
+        help="The number of requests of the load.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="The number of requests of the load in flight at once.",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="The number of requests of the load started per second, instead of a fixed concurrency.",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["JSONRPC", "HTTP+JSON", "GRPC"],
+        default=None,
+        help="The transport of the load, detected from the agent card by default. The url of GRPC is host:port.",
+    )
+    parser.add_argument(
+        "--url",
+        default="http://localhost:8000/a2a/chatbot",
+        help="The url of the agent.",
+    )
     args = parser.parse_args()
 
+    if args.agent == "a2a_chatbot" and args.load is not None:
+        exec_load(
+            args.url,
+            flow=args.load,
+            query=args.query,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            transport=args.transport,
+        )
+        return
+
     if args.agent == "a2a_chatbot":
-        url = "http://localhost:8000/a2a/chatbot"
+        if args.query is None:
+            parser.error("the following arguments are required: -q/--query")
+        url = args.url
         (url, streaming) = get_agnet_card(url)
 
         if not url:
@@ -0,0 +1,155 @@
+"""
+ingest_documents.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+from app.libs.logger import setup_logger
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+###
+# Set API Key
+###
+load_dotenv()
+
+###
+# Setup logger
+###
+setup_logger(stream=sys.stderr)
+
+DOCUMENT_SUFFIXES = (".md", ".txt", ".rst")
+
+
+def read_documents(paths: list[str]) -> Iterator[tuple[str, str]]:
+    """Read the documents of the files and directories one at a time, as pairs of a source and a text."""
+    for path in map(Path, paths):
+        files = (
+            sorted(file for file in path.rglob("*") if file.suffix in DOCUMENT_SUFFIXES) if path.is_dir() else [path]
+        )
+        for file in files:
+            yield (str(file), file.read_text(encoding="utf-8", errors="replace"))
+
+
+def exec_ingest(
+    index_dir: str,
+    paths: list[str],
+    *,
+    embedder: str,
+    chunk_size: int,
+    overlap: int,
+    batch_size: int,
+    partition: bool = False,
+    lists: int | None = None,
+) -> None:
+    """Execute ingestion of documents into a local vector index."""
+    from app.libs.vector_index import VectorIndex  # noqa: PLC0415
+    from app.tools.retrieval import ingest, make_embedder  # noqa: PLC0415
+
+    index = VectorIndex(index_dir)
+    start = time.perf_counter()
+    stats = ingest(
+        index,
+        make_embedder(embedder),
+        read_documents(paths),
+        chunk_size=chunk_size,
+        overlap=overlap,
+        batch_size=batch_size,
+    )
+    if partition:
+        index.partition(lists)
+    print(
+        json.dumps(
+            {
+                **stats,
+                "rows": len(index),
+                "partitioned": index.partitioned,
+                "elapsed_s": round(time.perf_counter() - start, 3),
+            },
+        ),
+    )
+
+
+def ingest_documents() -> None:
+    """Execute a selected function."""
+    from app.tools.retrieval import RAG_BATCH_SIZE, RAG_CHUNK_OVERLAP, RAG_CHUNK_SIZE, RAG_EMBEDDER  # noqa: PLC0415
+
+    parser = argparse.ArgumentParser(description="Ingest documents into a local vector index.")
+    parser.add_argument(
+        "-i",
+        "--index",
+        required=True,
+        help="Specify the directory of the index, created if missing.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help=f"Specify the files, or the directories to read the {', '.join(DOCUMENT_SUFFIXES)} files of.",
+    )
+    parser.add_argument(
+        "--embedder",
+        default=RAG_EMBEDDER,
+        help="Specify the embedder, 'hash[:<dim>]' locally or 'google[:<model>]'. Fixed by the first ingestion.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=RAG_CHUNK_SIZE,
+        help="Specify the characters of a chunk.",
+    )
+    parser.add_argument(
+        "--overlap",
+        type=int,
+        default=RAG_CHUNK_OVERLAP,
+        help="Specify the characters shared by consecutive chunks.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=RAG_BATCH_SIZE,
+        help="Specify the chunks embedded and appended at once.",
+    )
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help="Partition the index after ingesting, so that a search scans the nearest partitions only.",
+    )
+    parser.add_argument(
+        "--lists",
+        type=int,
+        default=None,
+        help="Specify the number of partitions. Defaults to the square root of the rows.",
+    )
+    args = parser.parse_args()
+
+    if args.paths or args.partition:
+        exec_ingest(
+            args.index,
+            args.paths,
+            embedder=args.embedder,
+            chunk_size=args.chunk_size,
+            overlap=args.overlap,
+            batch_size=args.batch_size,
+            partition=args.partition,
+            lists=args.lists,
+        )
+        return
+
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    ingest_documents()
@@ -9,20 +9,27 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-from typing import TYPE_CHECKING
+import json
+import sys
+import time
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal
 from uuid import uuid4
 
 from dotenv import load_dotenv
 
-from app.agents.chatbot import Chatbot
+from app.libs.batch import BATCH_CONCURRENCY, BatchOffset, run_batch, summarize
 from app.libs.logger import setup_logger
-from app.tools.a2a_client import A2aServer
-from app.tools.currency_rate import tools as currency_rate_tools
-from app.tools.mcp_client import McpServer
 
 if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
     from langchain_core.tools import BaseTool
 
+    from app.agents.chatbot import Chatbot
+    from app.agents.tool_results import ToolResultCompactor
+
 ###
 # Set API Key
 ###
@@ -33,143 +40,385 @@ load_dotenv()
 ###
 setup_logger()
 
+MCP_CATALOG_DIR = Path.home() / ".cache" / "langgraph-templete" / "mcp"
+BATCH_SUMMARY_INTERVAL = 10.0
+
+
+async def get_tools_from_mcp_server(stack: AsyncExitStack, urls: list[str]) -> list[BaseTool]:
+    """Get tools on MCP servers."""
+    from app.tools.mcp_catalog import McpToolCatalog  # noqa: PLC0415
+    from app.tools.mcp_client import McpServer, McpServerManager  # noqa: PLC0415
+
+    catalog = McpToolCatalog(cache_dir=MCP_CATALOG_DIR)
+    if len(urls) == 1:
+        mcp_server = await stack.enter_async_context(
+            McpServer(
+                name="currency_rate",
+                server_url=urls[0],
+                transport="streamable_http",
+                catalog=catalog,
+            ),
+        )
+        return await mcp_server.get_tools()
+
+    mcp_server_manager = await stack.enter_async_context(
+        McpServerManager(
+            servers=[
+                McpServer(name=f"currency_rate_{i}", server_url=url, transport="streamable_http", catalog=catalog)
+                for i, url in enumerate(urls)
+            ],
+        ),
+    )
+    return await mcp_server_manager.get_tools()
+
 
-async def get_tools_from_a2a_server(url: str | None = None) -> list[BaseTool]:
+async def get_tools_from_a2a_server(
+    stack: AsyncExitStack,
+    urls: list[str] | None = None,
+    strategy: Literal["first", "vote", "gather"] = "first",
+    webhook_url: str | None = None,
+    task_store: str = "memory",
+) -> list[BaseTool]:
     """Execute Chatbot."""
-    a2a_server = A2aServer(
-        name="currency_rate",
-        base_url=url or "http://localhost:8000/a2a/chatbot",
+    from app.tools.a2a_client import A2aServer  # noqa: PLC0415
+    from app.tools.a2a_multi_client import A2aServerGroup  # noqa: PLC0415
+    from app.tools.a2a_task_store import make_task_id_store  # noqa: PLC0415
+    from app.tools.a2a_webhook import A2aWebhookReceiver  # noqa: PLC0415
+
+    urls = urls or ["http://localhost:8000/a2a/chatbot"]
+    # The servers share a receiver, the notifications being told apart by their task
+    receiver = A2aWebhookReceiver(public_url=webhook_url) if webhook_url else None
+    if len(urls) == 1:
+        a2a_server = await stack.enter_async_context(
+            A2aServer(
+                name="currency_rate",
+                base_url=urls[0],
+                push_notifications=receiver is not None,
+                webhook_receiver=receiver,
+                task_id_store=make_task_id_store(task_store),
+            ),
+        )
+        return await a2a_server.get_tools()
+
+    a2a_server_group = await stack.enter_async_context(
+        A2aServerGroup(
+            name="currency_rate",
+            servers=[
+                A2aServer(
+                    name=f"currency_rate_{i}",
+                    base_url=url,
+                    push_notifications=receiver is not None,
+                    webhook_receiver=receiver,
+                    # A server continuing a conversation is found by its own store
+                    task_id_store=make_task_id_store(task_store, name=f"currency_rate_{i}"),
+                )
+                for i, url in enumerate(urls)
+            ],
+            strategy=strategy,
+        ),
     )
+    return await a2a_server_group.get_tools()
+
+
+async def get_tools(
+    stack: AsyncExitStack,
+    *,
+    mcp_urls: list[str] | None = None,
+    a2a_urls: list[str] | None = None,
+    a2a_strategy: Literal["first", "vote", "gather"] = "first",
+    a2a_webhook_url: str | None = None,
+    a2a_task_store: str = "memory",
+) -> list[BaseTool]:
+    """Get tools, importing only the clients of the selected servers."""
+    if mcp_urls:
+        return await get_tools_from_mcp_server(stack, urls=mcp_urls)
+    if a2a_urls:
+        return await get_tools_from_a2a_server(
+            stack,
+            urls=a2a_urls,
+            strategy=a2a_strategy,
+            webhook_url=a2a_webhook_url,
+            task_store=a2a_task_store,
+        )
+
+    from app.tools.currency_rate import tools as currency_rate_tools  # noqa: PLC0415
+
+    return currency_rate_tools
+
+
+def get_agent_class(agent: Literal["chatbot", "planner"]) -> type[Chatbot]:
+    """Get the class of the agent."""
+    if agent == "planner":
+        from app.agents.planner import Planner  # noqa: PLC0415
+
+        return Planner
+    from app.agents.chatbot import Chatbot  # noqa: PLC0415
+
+    return Chatbot
+
+
+def get_retrieval_tools(rag_index: str | None) -> list[BaseTool]:
+    """Get the tools searching the local vector index, if given."""
+    if rag_index is None:
+        return []
+    from app.tools.retrieval import get_retrieval_tools as get_index_tools  # noqa: PLC0415
+
+    return get_index_tools(rag_index)
+
+
+def get_tool_results(*, compact: bool, rag_index: str | None = None) -> ToolResultCompactor | None:
+    """Get the compactor of the tool results, if enabled."""
+    if not compact:
+        return None
+    from app.agents.tool_results import ToolResultCompactor  # noqa: PLC0415
+    from app.tools.currency_rate import tool_result_policies  # noqa: PLC0415
+
+    policies = dict(tool_result_policies)
+    if rag_index is not None:
+        from app.tools.retrieval import tool_result_policies as retrieval_policies  # noqa: PLC0415
 
-    return await a2a_server.get_tools()
+        policies.update(retrieval_policies)
+    return ToolResultCompactor(policies)
 
 
 async def exec_chatbot(
     query: str,
     *,
+    agent: Literal["chatbot", "planner"] = "chatbot",
     streaming: bool = False,
-    mcp_url: str | None = None,
-    a2a_url: str | None = None,
+    mcp_urls: list[str] | None = None,
+    a2a_urls: list[str] | None = None,
+    a2a_strategy: Literal["first", "vote", "gather"] = "first",
+    a2a_webhook_url: str | None = None,
+    a2a_task_store: str = "memory",
     raw_output: bool = False,
+    compact_tool_results: bool = False,
+    rag_index: str | None = None,
 ) -> None:
     """Execute chatbot."""
-    if mcp_url:
-        mcp_server = McpServer(
-            name="currency_rate",
-            server_url=mcp_url,
-            transport="streamable_http",
+    agent_class = get_agent_class(agent)
+
+    async with AsyncExitStack() as stack:
+        tools = await get_tools(
+            stack,
+            mcp_urls=mcp_urls,
+            a2a_urls=a2a_urls,
+            a2a_strategy=a2a_strategy,
+            a2a_webhook_url=a2a_webhook_url,
+            a2a_task_store=a2a_task_store,
         )
-        tools = await mcp_server.get_tools()
-    elif a2a_url:
-        tools = await get_tools_from_a2a_server(url=a2a_url)
-    else:
-        tools = currency_rate_tools
-
-    chatbot = Chatbot(
-        tools=tools,
-        strict=False,
-    )
+        tools += get_retrieval_tools(rag_index)
 
-    # Prepare
-    thread_id = str(uuid4())
-    print("=== Run ===")
-    print(f"query: {query}, streaming: {streaming}, strict: {False}, thread id: {thread_id}")
-    print()
-
-    # Execute
-    if not streaming:
-        result, _ = await chatbot.async_run(
-            query=query,
-            thread_id=thread_id,
-            raw_output=raw_output,
+        chatbot = agent_class(
+            tools=tools,
+            strict=False,
+            tool_results=get_tool_results(compact=compact_tool_results, rag_index=rag_index),
         )
-        # Result
-        print("=== Result ===")
-        print(result)
-        print()
-        print("=== Checkpoint ===")
-        print(chatbot.checkpoint(thread_id))
+
+        # Prepare
+        thread_id = str(uuid4())
+        print("=== Run ===")
+        print(f"query: {query}, streaming: {streaming}, strict: {False}, thread id: {thread_id}")
         print()
 
-    else:
-        async for event, _ in chatbot.astream_run(
-            query=query,
-            thread_id=thread_id,
-            raw_output=raw_output,
-        ):
+        # Execute
+        if not streaming:
+            result, _ = await chatbot.async_run(
+                query=query,
+                thread_id=thread_id,
+                raw_output=raw_output,
+            )
             # Result
-            print("=== Event ===")
-            print(event)
+            print("=== Result ===")
+            print(result)
+            print()
+            print("=== Checkpoint ===")
+            print(chatbot.checkpoint(thread_id))
+            print()
+
+        else:
+            async for event, _ in chatbot.astream_run(
+                query=query,
+                thread_id=thread_id,
+                raw_output=raw_output,
+            ):
+                # Result
+                print("=== Event ===")
+                print(event)
+                print()
+            print("=== Checkpoint ===")
+            print(chatbot.checkpoint(thread_id))
             print()
-        print("=== Checkpoint ===")
-        print(chatbot.checkpoint(thread_id))
-        print()
 
 
 async def exec_chatbot_interactive(
     *,
+    agent: Literal["chatbot", "planner"] = "chatbot",
     streaming: bool = False,
     strict: bool = False,
-    mcp_url: str | None = None,
-    a2a_url: str | None = None,
+    mcp_urls: list[str] | None = None,
+    a2a_urls: list[str] | None = None,
+    a2a_strategy: Literal["first", "vote", "gather"] = "first",
+    a2a_webhook_url: str | None = None,
+    a2a_task_store: str = "memory",
     raw_output: bool = False,
+    compact_tool_results: bool = False,
+    rag_index: str | None = None,
 ) -> None:
     """Execute conversations with Chatbot."""
-    if mcp_url:
-        mcp_server = McpServer(
-            name="currency_rate",
-            server_url=mcp_url,
-            transport="streamable_http",
+    agent_class = get_agent_class(agent)
+
+    async with AsyncExitStack() as stack:
+        tools = await get_tools(
+            stack,
+            mcp_urls=mcp_urls,
+            a2a_urls=a2a_urls,
+            a2a_strategy=a2a_strategy,
+            a2a_webhook_url=a2a_webhook_url,
+            a2a_task_store=a2a_task_store,
         )
-        tools = await mcp_server.get_tools()
-    elif a2a_url:
-        tools = await get_tools_from_a2a_server(url=a2a_url)
-    else:
-        tools = currency_rate_tools
-
-    chatbot = Chatbot(
-        tools=tools,
-        strict=strict,
-    )
-
-    # Prepare
-    thread_id = str(uuid4())
-    print("=== Run ===")
-    print(f"streaming: {streaming}, strict: {strict}, thread id: {thread_id}")
-    print()
-
-    print("=== Chatting ===")
-    print("Starting chatting with chatbot. Input no message to halt.")
-    print()
-    resume = False
-    while True:
-        query = input("Your input : ")
+        tools += get_retrieval_tools(rag_index)
 
-        if not query:
-            break
+        chatbot = agent_class(
+            tools=tools,
+            strict=strict,
+            tool_results=get_tool_results(compact=compact_tool_results, rag_index=rag_index),
+        )
 
-        if not streaming:
-            result, interrupt = await chatbot.async_run(
-                query=query,
-                thread_id=thread_id,
-                resume=resume,
-                raw_output=raw_output,
-            )
-            resume = interrupt
-            print(f"AI output  : {result}")
-            print()
+        # Prepare
+        thread_id = str(uuid4())
+        print("=== Run ===")
+        print(f"streaming: {streaming}, strict: {strict}, thread id: {thread_id}")
+        print()
 
-        else:
-            async for event, interrupt in chatbot.astream_run(
-                query=query,
-                thread_id=thread_id,
-                resume=resume,
-                raw_output=raw_output,
-            ):
+        print("=== Chatting ===")
+        print("Starting chatting with chatbot. Input no message to halt.")
+        print()
+        resume = False
+        while True:
+            query = input("Your input : ")
+
+            if not query:
+                break
+
+            if not streaming:
+                result, interrupt = await chatbot.async_run(
+                    query=query,
+                    thread_id=thread_id,
+                    resume=resume,
+                    raw_output=raw_output,
+                )
                 resume = interrupt
-                print(f"AI output  : {event}")
+                print(f"AI output  : {result}")
                 print()
 
+            else:
+                async for event, interrupt in chatbot.astream_run(
+                    query=query,
+                    thread_id=thread_id,
+                    resume=resume,
+                    raw_output=raw_output,
+                ):
+                    resume = interrupt
+                    print(f"AI output  : {event}")
+                    print()
+
+
+async def read_lines(path: str, offset: int = 0) -> AsyncIterator[tuple[int, str]]:
+    """Read the non-empty lines of a file or of stdin, skipping the ones before the offset."""
+    stream = sys.stdin if path == "-" else await asyncio.to_thread(Path(path).open, encoding="utf-8")
+    try:
+        index = 0
+        while line := await asyncio.to_thread(stream.readline):
+            if not line.strip():
+                continue
+            if index >= offset:
+                yield (index, line)
+            index += 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+async def exec_chatbot_batch(
+    path: str,
+    *,
+    agent: Literal["chatbot", "planner"] = "chatbot",
+    concurrency: int = BATCH_CONCURRENCY,
+    output: str | None = None,
+    offset_file: str | None = None,
+    query_key: str = "query",
+    id_key: str = "id",
+    mcp_urls: list[str] | None = None,
+    a2a_urls: list[str] | None = None,
+    a2a_strategy: Literal["first", "vote", "gather"] = "first",
+    a2a_webhook_url: str | None = None,
+    a2a_task_store: str = "memory",
+    compact_tool_results: bool = False,
+    rag_index: str | None = None,
+) -> None:
+    """Execute queries of a JSONL file with Chatbot concurrently."""
+    agent_class = get_agent_class(agent)
+
+    if output is None:
+        # Keep stdout for the results
+        setup_logger(stream=sys.stderr)
+
+    offset = BatchOffset(offset_file)
+    async with AsyncExitStack() as stack:
+        tools = await get_tools(
+            stack,
+            mcp_urls=mcp_urls,
+            a2a_urls=a2a_urls,
+            a2a_strategy=a2a_strategy,
+            a2a_webhook_url=a2a_webhook_url,
+            a2a_task_store=a2a_task_store,
+        )
+        tools += get_retrieval_tools(rag_index)
+        chatbot = agent_class(
+            tools=tools,
+            strict=False,
+            tool_results=get_tool_results(compact=compact_tool_results, rag_index=rag_index),
+        )
+
+        async def _ask(line: str) -> tuple[Any, str | dict[str, Any], bool]:
+            request = json.loads(line)
+            (request_id, query) = (
+                (request.get(id_key), str(request[query_key])) if isinstance(request, dict) else (None, str(request))
+            )
+            thread_id = str(uuid4())
+            try:
+                (result, interrupt) = await chatbot.async_run(query=query, thread_id=thread_id)
+            finally:
+                # Every query runs on its own thread, drop it to bound the memory
+                chatbot.checkpointer.delete_thread(thread_id)
+            return (request_id, result, interrupt)
+
+        writer = (
+            stack.enter_context(await asyncio.to_thread(Path(output).open, "a", encoding="utf-8"))
+            if output
+            else sys.stdout
+        )
+        (latencies, errors) = ([], 0)
+        start = reported = time.perf_counter()
+        async for item in run_batch(read_lines(path, offset.offset), _ask, concurrency):
+            record: dict[str, Any] = {"index": item.index, "latency_ms": round(item.latency * 1e3, 3)}
+            if item.error is not None:
+                errors += 1
+                record["error"] = repr(item.error)
+            elif item.result is not None:
+                (record["id"], record["result"], record["interrupt"]) = item.result
+            writer.write(json.dumps(record, ensure_ascii=False) + "\n")
+            writer.flush()
+            offset.done(item.index)
+            latencies.append(item.latency)
+
+            if time.perf_counter() - reported >= BATCH_SUMMARY_INTERVAL:
+                reported = time.perf_counter()
+                print(json.dumps(summarize(latencies, reported - start, errors)), file=sys.stderr)
+
+        print(json.dumps(summarize(latencies, time.perf_counter() - start, errors)), file=sys.stderr)
+
 
 def query() -> None:
     """Execute a selected function."""
@@ -178,7 +427,7 @@ def query() -> None:
         "-a",
         "--agent",
         required=True,
-        choices=["chatbot"],
+        choices=["chatbot", "planner"],
         help="Specify an agent to execute.",
     )
     parser.add_argument(
@@ -187,6 +436,39 @@ def query() -> None:
         default=None,
         help="Specify a query or question.",
     )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        default=None,
+        help="Specify a JSONL file of queries to execute concurrently, or '-' to read stdin.",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=BATCH_CONCURRENCY,
+        help="Specify the number of queries executed at once in batch mode.",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Specify a JSONL file to append the results to in batch mode, instead of stdout.",
+    )
+    parser.add_argument(
+        "--offset-file",
+        default=None,
+        help="Specify a file recording the progress of batch mode, to resume after a crash.",
+    )
+    parser.add_argument(
+        "--query-key",
+        default="query",
+        help="Specify the key of the query in the JSONL lines.",
+    )
+    parser.add_argument(
+        "--id-key",
+        default="id",
+        help="Specify the key of the identifier in the JSONL lines.",
+    )
     parser.add_argument(
         "-i",
         "--interactive",
@@ -206,14 +488,42 @@ def query() -> None:
     parser.add_argument(
         "-mcp",
         "--remote-mcp",
+        nargs="+",
         default=None,
-        help="Specify the url to bind tools on the remote MCP server.",
+        help="Specify the url to bind tools on the remote MCP server. Give several urls to aggregate their tools.",
     )
     parser.add_argument(
         "-a2a",
         "--remote-a2a",
+        nargs="+",
+        default=None,
+        help="Specify the url to bind tools on the remote A2A server. Give several urls to fan out requests.",
+    )
+    parser.add_argument(
+        "--a2a-strategy",
+        choices=["first", "vote", "gather"],
+        default="first",
+        help="Specify how to combine answers of several remote A2A servers.",
+    )
+    parser.add_argument(
+        "--a2a-webhook-url",
         default=None,
-        help="Specify the url to bind tools on the remote A2A server.",
+        help="Enable push notifications from the remote A2A servers, to the public url reaching a local receiver.",
+    )
+    parser.add_argument(
+        "--task-store",
+        default="memory",
+        help="Specify the store of the tasks pending on the remote A2A servers, 'memory' or 'sqlite:<path>'.",
+    )
+    parser.add_argument(
+        "--rag-index",
+        default=None,
+        help="Specify the directory of a local vector index made by cli.ingest_documents, to search documents.",
+    )
+    parser.add_argument(
+        "--compact-tool-results",
+        action="store_true",
+        help="Compact large tool results in the messages, keeping the full results fetchable by id.",
     )
     parser.add_argument(
         "-o",
@@ -223,27 +533,61 @@ def query() -> None:
     )
     args = parser.parse_args()
 
+    if args.batch is not None:
+        if args.agent in ("chatbot", "planner"):
+            asyncio.run(
+                exec_chatbot_batch(
+                    args.batch,
+                    agent=args.agent,
+                    concurrency=args.concurrency,
+                    output=args.output,
+                    offset_file=args.offset_file,
+                    query_key=args.query_key,
+                    id_key=args.id_key,
+                    mcp_urls=args.remote_mcp,
+                    a2a_urls=args.remote_a2a,
+                    a2a_strategy=args.a2a_strategy,
+                    a2a_webhook_url=args.a2a_webhook_url,
+                    a2a_task_store=args.task_store,
+                    compact_tool_results=args.compact_tool_results,
+                    rag_index=args.rag_index,
+                ),
+            )
+        return
+
     if args.interactive:
-        if args.agent == "chatbot":
+        if args.agent in ("chatbot", "planner"):
             asyncio.run(
                 exec_chatbot_interactive(
+                    agent=args.agent,
                     streaming=args.streaming,
                     strict=args.strict,
-                    mcp_url=args.remote_mcp,
-                    a2a_url=args.remote_a2a,
+                    mcp_urls=args.remote_mcp,
+                    a2a_urls=args.remote_a2a,
+                    a2a_strategy=args.a2a_strategy,
+                    a2a_webhook_url=args.a2a_webhook_url,
+                    a2a_task_store=args.task_store,
+                    compact_tool_results=args.compact_tool_results,
+                    rag_index=args.rag_index,
                     raw_output=args.raw_output,
                 ),
             )
         return
 
     if args.query is not None:
-        if args.agent == "chatbot":
+        if args.agent in ("chatbot", "planner"):
             asyncio.run(
                 exec_chatbot(
                     args.query,
+                    agent=args.agent,
                     streaming=args.streaming,
-                    mcp_url=args.remote_mcp,
-                    a2a_url=args.remote_a2a,
+                    mcp_urls=args.remote_mcp,
+                    a2a_urls=args.remote_a2a,
+                    a2a_strategy=args.a2a_strategy,
+                    a2a_webhook_url=args.a2a_webhook_url,
+                    a2a_task_store=args.task_store,
+                    compact_tool_results=args.compact_tool_results,
+                    rag_index=args.rag_index,
                     raw_output=args.raw_output,
                 ),
             )
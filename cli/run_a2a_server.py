@@ -8,11 +8,13 @@ Author  : aumezawa
 from __future__ import annotations
 
 import argparse
+from typing import Literal
 
 from dotenv import load_dotenv
 
-from app.a2a_agents.a2a_chatbot import A2aChatbot
+from app.libs.executors import EXECUTOR_CPU_WORKERS, EXECUTOR_IO_WORKERS, ExecutorKind
 from app.libs.logger import setup_logger
+from app.libs.usage import MAX_LLM_CALLS_PER_TURN, TokenBudget
 
 ###
 # Set API Key
@@ -25,9 +27,60 @@ load_dotenv()
 setup_logger()
 
 
-def exec_a2a_chatbot(*, streaming: bool = True, blocking: bool = True, strict: bool = False) -> None:
+def exec_a2a_chatbot(
+    *,
+    agent: Literal["chatbot", "planner"] = "chatbot",
+    transport: Literal["JSONRPC", "GRPC", "HTTP+JSON"] = "HTTP+JSON",
+    grpc_port: int = 50051,
+    streaming: bool = True,
+    blocking: bool = True,
+    strict: bool = False,
+    push_allowed_hosts: tuple[str, ...] = (),
+    trace_jsonl: str | None = None,
+    trace_otlp: str | None = None,
+    metrics: bool = True,
+    budget: TokenBudget | None = None,
+    fallback_model: str | None = None,
+    compression_minimum_size: int | None = 1024,
+    merge_follow_ups: bool = False,
+    message_log: bool = False,
+    compact_tool_results: bool = False,
+    warm_up: bool = True,
+    io_workers: int = EXECUTOR_IO_WORKERS,
+    cpu_workers: int = EXECUTOR_CPU_WORKERS,
+    cpu_executor: ExecutorKind = "process",
+) -> None:
     """Execute A2A Chatbot."""
-    a2a_chatbot = A2aChatbot(streaming=streaming, blocking=blocking, strict=strict)
+    from app.a2a_agents.a2a_chatbot import A2aChatbot  # noqa: PLC0415
+    from app.libs.tracing import JsonlExporter, OtlpJsonExporter, SpanExporter, Tracer  # noqa: PLC0415
+
+    exporters: list[SpanExporter] = []
+    if trace_jsonl:
+        exporters.append(JsonlExporter(trace_jsonl))
+    if trace_otlp:
+        exporters.append(OtlpJsonExporter(trace_otlp))
+    a2a_chatbot = A2aChatbot(
+        mode=transport,
+        agent=agent,
+        grpc_port=grpc_port,
+        streaming=streaming,
+        blocking=blocking,
+        strict=strict,
+        push_notifications=bool(push_allowed_hosts),
+        push_allowed_hosts=push_allowed_hosts,
+        tracer=Tracer(exporters) if exporters else None,
+        metrics=metrics,
+        budget=budget,
+        fallback_model=fallback_model,
+        compression_minimum_size=compression_minimum_size,
+        merge_follow_ups=merge_follow_ups,
+        message_log=message_log,
+        compact_tool_results=compact_tool_results,
+        warm_up=warm_up,
+        io_workers=io_workers,
+        cpu_workers=cpu_workers,
+        cpu_executor=cpu_executor,
+    )
     a2a_chatbot.run()
 
 
@@ -38,9 +91,22 @@ def run_a2a_server() -> None:
         "-a",
         "--agent",
         required=True,
-        choices=["chatbot"],
+        choices=["chatbot", "planner"],
         help="Specify an a2a server to execute.",
     )
+    parser.add_argument(
+        "-t",
+        "--transport",
+        choices=["HTTP+JSON", "JSONRPC", "GRPC"],
+        default="HTTP+JSON",
+        help="Specify the transport. GRPC serves gRPC beside HTTP+JSON, and needs a2a-sdk[grpc].",
+    )
+    parser.add_argument(
+        "--grpc-port",
+        type=int,
+        default=50051,
+        help="Specify the port of the gRPC server.",
+    )
     parser.add_argument(
         "-nb",
         "--non-blocking",
@@ -59,10 +125,124 @@ def run_a2a_server() -> None:
         action="store_true",
         help="Enable strict mode.",
     )
+    parser.add_argument(
+        "--push-allowed-hosts",
+        nargs="+",
+        default=[],
+        help="Enable push notifications, to the callback urls on the hosts only.",
+    )
+    parser.add_argument(
+        "-nm",
+        "--no-metrics",
+        action="store_true",
+        help="Disable the metrics endpoint.",
+    )
+    parser.add_argument(
+        "--compression-minimum-size",
+        type=int,
+        default=1024,
+        help="Specify the size in bytes above which responses are compressed with zstd or gzip.",
+    )
+    parser.add_argument(
+        "--no-compression",
+        action="store_true",
+        help="Disable the compression of responses.",
+    )
+    parser.add_argument(
+        "--max-thread-tokens",
+        type=int,
+        help="Specify the token budget of a conversation.",
+    )
+    parser.add_argument(
+        "--max-tenant-tokens",
+        type=int,
+        help="Specify the token budget of a tenant.",
+    )
+    parser.add_argument(
+        "--max-llm-calls",
+        type=int,
+        default=MAX_LLM_CALLS_PER_TURN,
+        help="Specify the maximum number of LLM calls in a turn.",
+    )
+    parser.add_argument(
+        "--fallback-model",
+        help="Specify a cheaper model used when approaching a token budget.",
+    )
+    parser.add_argument(
+        "--merge-follow-ups",
+        action="store_true",
+        help="Merge the messages queued behind a run on the same context into a single turn.",
+    )
+    parser.add_argument(
+        "--message-log",
+        action="store_true",
+        help="Hold the messages of a context in an append-only log, for long conversations.",
+    )
+    parser.add_argument(
+        "--compact-tool-results",
+        action="store_true",
+        help="Compact large tool results in the messages, keeping the full results fetchable by id.",
+    )
+    parser.add_argument(
+        "--no-warm-up",
+        action="store_true",
+        help="Disable the warm-up at startup, reporting ready at once.",
+    )
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=EXECUTOR_IO_WORKERS,
+        help="Specify the threads running the sync tools off the event loop.",
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        default=EXECUTOR_CPU_WORKERS,
+        help="Specify the workers running the CPU-bound tools. Defaults to the CPUs available.",
+    )
+    parser.add_argument(
+        "--cpu-executor",
+        choices=["process", "interpreter", "thread"],
+        default="process",
+        help="Specify the pool of the CPU-bound tools, 'interpreter' needing Python 3.14.",
+    )
+    parser.add_argument(
+        "--trace-jsonl",
+        help="Specify a JSONL file to write trace spans to.",
+    )
+    parser.add_argument(
+        "--trace-otlp",
+        help="Specify an OTLP/HTTP collector endpoint to send trace spans to.",
+    )
     args = parser.parse_args()
 
-    if args.agent == "chatbot":
-        exec_a2a_chatbot(streaming=args.streaming, blocking=not args.non_blocking, strict=args.strict)
+    if args.agent in ("chatbot", "planner"):
+        exec_a2a_chatbot(
+            agent=args.agent,
+            transport=args.transport,
+            grpc_port=args.grpc_port,
+            streaming=args.streaming,
+            blocking=not args.non_blocking,
+            strict=args.strict,
+            push_allowed_hosts=tuple(args.push_allowed_hosts),
+            trace_jsonl=args.trace_jsonl,
+            trace_otlp=args.trace_otlp,
+            metrics=not args.no_metrics,
+            compression_minimum_size=None if args.no_compression else args.compression_minimum_size,
+            budget=TokenBudget(
+                max_thread_tokens=args.max_thread_tokens,
+                max_tenant_tokens=args.max_tenant_tokens,
+                max_llm_calls_per_turn=args.max_llm_calls,
+            ),
+            fallback_model=args.fallback_model,
+            merge_follow_ups=args.merge_follow_ups,
+            message_log=args.message_log,
+            compact_tool_results=args.compact_tool_results,
+            warm_up=not args.no_warm_up,
+            io_workers=args.io_workers,
+            cpu_workers=args.cpu_workers,
+            cpu_executor=args.cpu_executor,
+        )
         return
 
     parser.print_help()
@@ -0,0 +1,252 @@
+"""
+run_benchmark.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from app.benchmarks.e2e_bench import (
+    E2E_BASELINE_PATH,
+    E2E_CONCURRENCY,
+    E2E_LLM_LATENCY,
+    E2E_REQUESTS,
+    E2E_SCENARIOS,
+    E2E_TOKEN_RATE,
+    E2E_TOLERANCE,
+    E2E_TOOL_LATENCY,
+    E2eConfig,
+    compare_baseline,
+    run_e2e_benchmark,
+    save_baseline,
+)
+from app.benchmarks.executor_bench import EXECUTOR_BENCH_RUNS, run_executor_benchmark
+from app.benchmarks.import_bench import IMPORT_BENCH_REPEATS, run_import_benchmark
+from app.benchmarks.logger_bench import BENCH_ITERATIONS, run_logger_benchmark
+from app.benchmarks.rag_bench import RAG_BENCH_QUERIES, RAG_BENCH_ROWS, run_rag_benchmark
+from app.benchmarks.selection_bench import SELECTION_BENCH_LATENCIES, SELECTION_BENCH_ROUNDS, run_selection_benchmark
+from app.benchmarks.state_bench import STATE_BENCH_LENGTHS, STATE_BENCH_TURNS, run_state_benchmark
+
+
+def exec_logger_benchmark(iterations: int = BENCH_ITERATIONS) -> None:
+    """Execute Logger Benchmark."""
+    results = run_logger_benchmark(iterations)
+    print(json.dumps(results, indent=2))
+
+
+def exec_import_benchmark(repeats: int = IMPORT_BENCH_REPEATS, max_import_ms: float | None = None) -> None:
+    """Execute Import Benchmark."""
+    results = run_import_benchmark(repeats)
+    print(json.dumps(results, indent=2))
+
+    # Fail on a regression, for scripts and CI
+    regressions = [
+        module
+        for module, result in results.items()
+        if result["heavy_modules"] or (max_import_ms is not None and result["import_ms"] > max_import_ms)
+    ]
+    if regressions:
+        print(f"import time regressed: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+def exec_state_benchmark(lengths: tuple[int, ...] = STATE_BENCH_LENGTHS, turns: int = STATE_BENCH_TURNS) -> None:
+    """Execute State Benchmark."""
+    results = run_state_benchmark(lengths, turns)
+    print(json.dumps(results, indent=2))
+
+
+def exec_rag_benchmark(rows: tuple[int, ...] = RAG_BENCH_ROWS, queries: int = RAG_BENCH_QUERIES) -> None:
+    """Execute RAG Benchmark."""
+    results = run_rag_benchmark(rows, queries)
+    print(json.dumps(results, indent=2))
+
+
+def exec_executor_benchmark(runs: int = EXECUTOR_BENCH_RUNS) -> None:
+    """Execute Executor Benchmark."""
+    results = run_executor_benchmark(runs)
+    print(json.dumps(results, indent=2))
+
+
+def exec_selection_benchmark(rounds: int = SELECTION_BENCH_ROUNDS) -> None:
+    """Execute Selection Benchmark."""
+    results = run_selection_benchmark(rounds)
+    print(json.dumps(results, indent=2))
+
+    # Fail unless the fastest agent is selected in the end, for scripts and CI
+    fastest = min(SELECTION_BENCH_LATENCIES, key=SELECTION_BENCH_LATENCIES.__getitem__)
+    if results["final"] != fastest:
+        print(f"selection did not converge to the fastest agent: {fastest}", file=sys.stderr)
+        sys.exit(1)
+
+
+def exec_e2e_benchmark(
+    config: E2eConfig,
+    *,
+    scenarios: tuple[str, ...] = E2E_SCENARIOS,
+    baseline: str | None = None,
+    save: bool = False,
+    tolerance: float = E2E_TOLERANCE,
+) -> None:
+    """Execute End-to-End Benchmark."""
+    results = run_e2e_benchmark(config, scenarios)
+    print(json.dumps(results, indent=2))
+
+    path = baseline or E2E_BASELINE_PATH
+    if save:
+        save_baseline(results, path)
+        print(f"baseline saved: {path}", file=sys.stderr)
+        return
+
+    if baseline is not None:
+        regressions = compare_baseline(results, path, tolerance)
+        if regressions:
+            print(f"regressed from the baseline: {json.dumps(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+def run_benchmark() -> None:
+    """Execute a selected function."""
+    parser = argparse.ArgumentParser(description="Select to execute a benchmark.")
+    parser.add_argument(
+        "-b",
+        "--benchmark",
+        required=True,
+        choices=["logger", "import", "e2e", "state", "rag", "executor", "selection"],
+        help="Specify a benchmark to execute.",
+    )
+    parser.add_argument(
+        "-n",
+        "--iterations",
+        type=int,
+        default=None,
+        help="Specify the number of iterations, or of fresh interpreters for the import benchmark.",
+    )
+    parser.add_argument(
+        "--messages",
+        type=int,
+        nargs="+",
+        default=STATE_BENCH_LENGTHS,
+        help="Specify the numbers of messages of the threads of the state benchmark.",
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=RAG_BENCH_ROWS,
+        help="Specify the numbers of rows of the vector indexes of the RAG benchmark.",
+    )
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=None,
+        help="Specify the import time of an entry point over which the import benchmark fails.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=E2E_CONCURRENCY,
+        help="Specify the number of requests in flight for the end-to-end benchmark.",
+    )
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=E2E_LLM_LATENCY,
+        help="Specify the seconds to the first token of the fake model.",
+    )
+    parser.add_argument(
+        "--token-rate",
+        type=float,
+        default=E2E_TOKEN_RATE,
+        help="Specify the tokens per second of the fake model.",
+    )
+    parser.add_argument(
+        "--tool-latency",
+        type=float,
+        default=E2E_TOOL_LATENCY,
+        help="Specify the seconds of the stub tool backend.",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=E2E_SCENARIOS,
+        default=E2E_SCENARIOS,
+        help="Specify the scenarios of the end-to-end benchmark.",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help=f"Specify a baseline to compare with, failing on regressions. Defaults to {E2E_BASELINE_PATH} to save.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results of the end-to-end benchmark as the baseline.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=E2E_TOLERANCE,
+        help="Specify the relative change over which a metric regressed.",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "logger":
+        exec_logger_benchmark(iterations=args.iterations or BENCH_ITERATIONS)
+        return
+
+    if args.benchmark == "import":
+        exec_import_benchmark(
+            repeats=args.iterations or IMPORT_BENCH_REPEATS,
+            max_import_ms=args.max_import_ms,
+        )
+        return
+
+    if args.benchmark == "state":
+        exec_state_benchmark(
+            lengths=tuple(args.messages),
+            turns=args.iterations or STATE_BENCH_TURNS,
+        )
+        return
+
+    if args.benchmark == "rag":
+        exec_rag_benchmark(
+            rows=tuple(args.rows),
+            queries=args.iterations or RAG_BENCH_QUERIES,
+        )
+        return
+
+    if args.benchmark == "executor":
+        exec_executor_benchmark(runs=args.iterations or EXECUTOR_BENCH_RUNS)
+        return
+
+    if args.benchmark == "selection":
+        exec_selection_benchmark(rounds=args.iterations or SELECTION_BENCH_ROUNDS)
+        return
+
+    if args.benchmark == "e2e":
+        exec_e2e_benchmark(
+            E2eConfig(
+                requests=args.iterations or E2E_REQUESTS,
+                concurrency=args.concurrency,
+                llm_latency=args.llm_latency,
+                token_rate=args.token_rate,
+                tool_latency=args.tool_latency,
+            ),
+            scenarios=tuple(args.scenarios),
+            baseline=args.baseline,
+            save=args.save_baseline,
+            tolerance=args.tolerance,
+        )
+        return
+
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    run_benchmark()
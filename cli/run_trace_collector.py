@@ -0,0 +1,64 @@
+"""
+run_trace_collector.py
+
+Version : 2.0.0
+Author  : aumezawa
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from typing import TYPE_CHECKING
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+if TYPE_CHECKING:
+    from starlette.requests import Request
+
+COLLECTOR_HOST = "localhost"
+COLLECTOR_PORT = 4318
+
+
+async def receive_traces(request: Request) -> JSONResponse:
+    """Print the spans of an OTLP/HTTP JSON export request."""
+    payload = await request.json()
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                duration_ms = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+                attributes = {
+                    attribute["key"]: next(iter(attribute["value"].values()))
+                    for attribute in span.get("attributes", [])
+                }
+                print(
+                    f"{span['traceId']} {span.get('parentSpanId') or '-':>16} {span['spanId']} "
+                    f"{span['name']:<24} {duration_ms:10.2f} ms {json.dumps(attributes)}",
+                )
+    return JSONResponse({"partialSuccess": {}})
+
+
+def run_trace_collector() -> None:
+    """Run a collector stub printing the received spans."""
+    parser = argparse.ArgumentParser(description="Run an OTLP/HTTP JSON collector stub.")
+    parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        default=COLLECTOR_PORT,
+        help="Specify a port to listen on.",
+    )
+    args = parser.parse_args()
+
+    uvicorn.run(
+        app=Starlette(routes=[Route("/v1/traces", receive_traces, methods=["POST"])]),
+        host=COLLECTOR_HOST,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    run_trace_collector()